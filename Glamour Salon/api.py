@@ -0,0 +1,300 @@
+"""
+Headless booking API served alongside the Streamlit app.
+
+A small asyncio HTTP/1.1 server that exposes the services catalog,
+availability, booking and cancellation directly on the data layer. It is
+meant for WhatsApp deep links and other clients that should not pay for
+a full Streamlit script rerun per request. Connections are kept alive.
+Reads run on the default thread pool against the branch's connection
+pool. Writes go through the branch's single writer and are awaited as
+asyncio futures, so they batch with the app's own writes.
+
+    GET    /services
+    GET    /availability?service=Manicure[&date=2030-01-01]
+    POST   /bookings          {"phone", "service"[, "date", "time"][, "name"]}
+    DELETE /bookings/<id>?phone=...
+
+Every route takes ?branch=<id> and falls back to the default branch.
+POST /bookings without a date and time books the next open slot, and an
+Idempotency-Key header makes it safe to retry, like the app's Confirm
+Booking button. Clients are identified by phone number as at login; an
+unknown number is registered when a name is given.
+
+    python api.py [--host 127.0.0.1] [--port 8502] [--db salon.db]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import availability
+import idempotency
+import repository
+# Imported for their booking and release hooks
+import stylists
+import waitlist
+from branches import DEFAULT_BRANCH_ID, Branch, BranchRouter, get_router
+
+DEFAULT_PORT = 8502
+
+MAX_BODY_BYTES = 64 * 1024
+
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+SERVICE_DURATION_SQL = "SELECT duration FROM services WHERE name = ? ORDER BY id LIMIT 1"
+
+APPOINTMENT_OWNER_SQL = "SELECT user_id, status FROM appointments WHERE id = ?"
+
+class ApiError(Exception):
+    """Answered as {"error": message} with the given HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _service_duration(conn, service):
+    row = conn.execute(SERVICE_DURATION_SQL, (service,)).fetchone()
+    return None if row is None else row[0] or availability.DEFAULT_DURATION
+
+def _appointment_owner(conn, appointment_id):
+    row = conn.execute(APPOINTMENT_OWNER_SQL, (appointment_id,)).fetchone()
+    return None if row is None else tuple(row)
+
+def _required(fields, name):
+    value = fields.get(name)
+    if not value:
+        raise ApiError(400, f"Missing '{name}'")
+    return value
+
+class BookingApi:
+    def __init__(self, router=None):
+        self.router = router or get_router()
+
+    def engine(self, branch_id):
+        return availability.get_availability(self.router.db_path(branch_id))
+
+    async def call(self, fn, *args):
+        """Run blocking fn(*args) on the default thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def read(self, branch_id, query, *args):
+        """Run query(conn, *args) on a pooled connection of the branch"""
+        def run():
+            with self.router.pool(branch_id).connection() as conn:
+                return query(conn, *args)
+        return await self.call(run)
+
+    async def write(self, branch_id, intent, *args):
+        """Run a write intent on the branch's single writer"""
+        return await asyncio.wrap_future(self.router.writer(branch_id).submit(intent, *args))
+
+    async def duration(self, branch_id, service):
+        duration = await self.read(branch_id, _service_duration, service)
+        if duration is None:
+            raise ApiError(404, f"Unknown service '{service}'")
+        return duration
+
+    async def user_id(self, branch_id, fields):
+        phone = str(_required(fields, 'phone'))
+        user_id = await self.read(branch_id, repository.get_user_id, phone)
+        if user_id is None and fields.get('name'):
+            await self.write(branch_id, repository.register_user, str(fields['name']), phone)
+            user_id = await self.read(branch_id, repository.get_user_id, phone)
+        if user_id is None:
+            raise ApiError(404, "Unknown phone number")
+        return user_id
+
+    # Routes
+
+    async def get_services(self, branch_id, params, fields, headers):
+        services = await self.read(branch_id, repository.get_services)
+        return 200, {"services": [service.as_dict() for service in services]}
+
+    async def get_availability(self, branch_id, params, fields, headers):
+        service = _required(params, 'service')
+        duration = await self.duration(branch_id, service)
+        engine = self.engine(branch_id)
+        date = params.get('date')
+        if date is None:
+            slot = await self.call(engine.next_available, duration)
+            next_slot = None if slot is None else {"date": slot[0], "time": slot[1]}
+            return 200, {"service": service, "next": next_slot}
+        self.check_date(date)
+        slots = await self.call(engine.free_slots, date, duration)
+        return 200, {"service": service, "date": date, "slots": slots}
+
+    async def post_booking(self, branch_id, params, fields, headers):
+        service = str(_required(fields, 'service'))
+        await self.duration(branch_id, service)
+        date, time = fields.get('date'), fields.get('time')
+        if bool(date) != bool(time):
+            raise ApiError(400, "Give both 'date' and 'time', or neither for the next open slot")
+        user_id = await self.user_id(branch_id, fields)
+        rules = self.engine(branch_id).rules
+        if date:
+            self.check_date(date)
+            start = rules.slot_index(time)
+            if start is None or rules.slot_time(start) != time:
+                raise ApiError(400, f"'{time}' is not a bookable start time")
+            intent = (availability.book_if_available, rules, user_id, service, date, time,
+                      availability.BOOKING_POINTS, datetime.now())
+        else:
+            intent = (availability.book_next_available, rules, user_id, service, datetime.now(),
+                      availability.BOOKING_POINTS)
+        key = headers.get('idempotency-key')
+        if key:
+            outcome = await self.write(branch_id, idempotency.run_once, f"{user_id}:{key}", *intent)
+        else:
+            outcome = await self.write(branch_id, *intent)
+        if date:
+            outcome = [outcome, date, time]
+        result, date, time = outcome
+        self.engine(branch_id).invalidate(date)
+        status = {availability.BOOKED: 201, availability.DUPLICATE: 200, availability.PAST: 400}.get(result, 409)
+        return status, {"result": result, "service": service, "date": date, "time": time}
+
+    async def delete_booking(self, branch_id, params, fields, headers, appointment_id):
+        user_id = await self.user_id(branch_id, {'phone': fields.get('phone') or params.get('phone')})
+        owner = await self.read(branch_id, _appointment_owner, appointment_id)
+        if owner is None or owner[0] != user_id:
+            raise ApiError(404, f"No booking {appointment_id} for this phone number")
+        rules = self.engine(branch_id).rules
+        # Anyone promoted from the waitlist into the freed slot earns the booking points
+        cancelled = await self.write(branch_id, availability.cancel_and_release, rules, appointment_id,
+                                     availability.CANCELLATION_POINTS, availability.BOOKING_POINTS)
+        if not cancelled:
+            raise ApiError(409, f"Booking {appointment_id} is already {owner[1]}")
+        self.engine(branch_id).invalidate()
+        return 200, {"cancelled": appointment_id}
+
+    def check_date(self, date):
+        """Dates must be YYYY-MM-DD inside the booking window, as on the booking page"""
+        try:
+            day = datetime.strptime(date, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            raise ApiError(400, f"Invalid date '{date}', expected YYYY-MM-DD")
+        today = datetime.now().date()
+        if not today <= day < today + timedelta(days=availability.BOOKING_WINDOW_DAYS):
+            raise ApiError(400, f"{date} is outside the booking window")
+
+    # HTTP
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        branch_id = params.pop('branch', None)
+        if branch_id is not None and branch_id not in self.router.branches:
+            raise ApiError(404, f"Unknown branch '{branch_id}'")
+        try:
+            fields = json.loads(body) if body else {}
+        except ValueError:
+            raise ApiError(400, "Body must be JSON")
+        if not isinstance(fields, dict):
+            raise ApiError(400, "Body must be a JSON object")
+
+        parts = url.path.strip('/').split('/')
+        routes = {
+            ('services',): {'GET': self.get_services},
+            ('availability',): {'GET': self.get_availability},
+            ('bookings',): {'POST': self.post_booking},
+        }
+        args = ()
+        if len(parts) == 2 and parts[0] == 'bookings' and parts[1].isdigit():
+            handlers, args = {'DELETE': self.delete_booking}, (int(parts[1]),)
+        else:
+            handlers = routes.get(tuple(parts))
+        if handlers is None:
+            raise ApiError(404, f"No route for {url.path}")
+        if method not in handlers:
+            raise ApiError(405, f"{method} not allowed on {url.path}")
+        return await handlers[method](branch_id, params, fields, headers, *args)
+
+    async def respond(self, method, target, headers, body):
+        try:
+            return await self.dispatch(method, target, headers, body)
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            print(f"API error on {method} {target}: {e}")
+            return 500, {"error": "Internal error"}
+
+    async def handle(self, reader, writer):
+        """Serve one keep-alive connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode('latin-1').rstrip("\r\n").split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.split(" ")
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    writer.write(_response(400, {"error": "Malformed request"}, False))
+                    break
+                if length > MAX_BODY_BYTES:
+                    writer.write(_response(413, {"error": "Body too large"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get('connection', '').lower() != 'close'
+                status, payload = await self.respond(method, target, headers, body)
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+async def start_server(host="127.0.0.1", port=DEFAULT_PORT, router=None):
+    """Start serving and return the asyncio server (port 0 picks a free port)"""
+    api = BookingApi(router)
+    return await asyncio.start_server(api.handle, host, port)
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, router=None):
+    server = await start_server(host, port, router)
+    bound = server.sockets[0].getsockname()
+    print(f"💅 Booking API listening on http://{bound[0]}:{bound[1]}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Glamour Salon booking API")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--db', help="serve this database file as the only branch instead of config.json's")
+    args = parser.parse_args(argv)
+
+    router = BranchRouter([Branch(DEFAULT_BRANCH_ID, "Main Branch", args.db)]) if args.db else get_router()
+    router.ensure_ready()
+    try:
+        asyncio.run(serve(args.host, args.port, router))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -10,6 +10,20 @@ import base64
 import plotly.express as px
 import plotly.graph_objects as go
 import urllib.parse
+from contextlib import contextmanager
+from collections import Counter
+from branches import get_router
+from database import data_version
+from query_cache import get_query_cache
+from snapshots import snapshot_path
+import repository
+import availability
+import intervals
+import waitlist
+import stylists
+import idempotency
+import query_stats
+import cards
 
 # Page configuration
 st.set_page_config(
@@ -35,217 +49,296 @@ if 'preselected_service' not in st.session_state:
     st.session_state.preselected_service = None
 if 'flash_message' not in st.session_state:
     st.session_state.flash_message = None
+if 'branch_id' not in st.session_state:
+    st.session_state.branch_id = get_router().default_branch_id
 
 # Create directory for gallery images if it doesn't exist
 if not os.path.exists("gallery"):
     os.makedirs("gallery")
 
 # Helper for database connection
+@contextmanager
 def get_db_connection():
-    """Create a database connection with timeout and proper configuration."""
+    """Borrow a pooled connection to the session's branch database for a with-block."""
+    pool = get_router().pool(st.session_state.branch_id)
     try:
-        conn = sqlite3.connect('salon.db', timeout=30, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
+        conn = pool.acquire()
     except Exception as e:
         st.error(f"Database connection error: {e}")
-        return None
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
 
-# Initialize database
+# Initialize every branch database (once per process; later reruns return immediately)
 def init_db():
-    conn = get_db_connection()
-    if not conn:
-        return
-        
     try:
-        c = conn.cursor()
-        
-        # Enable WAL mode for better concurrency
-        try:
-            c.execute('PRAGMA journal_mode=WAL;')
-        except:
-            pass
-            
-        # Create users table
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      name TEXT NOT NULL,
-                      phone TEXT NOT NULL UNIQUE,
-                      loyalty_points INTEGER DEFAULT 0,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        # Check if loyalty_points column exists (migration for existing dbs)
-        try:
-            c.execute("SELECT loyalty_points FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            try:
-                c.execute("ALTER TABLE users ADD COLUMN loyalty_points INTEGER DEFAULT 0")
-            except:
-                pass
-        
-        # Create appointments table
-        c.execute('''CREATE TABLE IF NOT EXISTS appointments
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      user_id INTEGER,
-                      service TEXT NOT NULL,
-                      date TEXT NOT NULL,
-                      time TEXT NOT NULL,
-                      status TEXT DEFAULT 'booked',
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      FOREIGN KEY (user_id) REFERENCES users (id))''')
-        
-        # Create services table
-        c.execute('''CREATE TABLE IF NOT EXISTS services
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      name TEXT NOT NULL,
-                      price REAL NOT NULL,
-                      duration INTEGER NOT NULL,
-                      description TEXT,
-                      category TEXT)''')
-        
-        # Insert sample services if table is empty
-        c.execute("SELECT COUNT(*) FROM services")
-        if c.fetchone()[0] == 0:
-            sample_services = [
-                ("Haircut & Styling", 499.0, 60, "Professional haircut with blow dry and styling", "Hair"),
-                ("Hair Coloring", 1499.0, 120, "Full hair coloring service with conditioning treatment", "Hair"),
-                ("Hair Spa Treatment", 999.0, 90, "Deep conditioning and scalp massage treatment", "Hair"),
-                ("Facial Treatment", 899.0, 75, "Custom facial with cleansing and moisturizing", "Skin"),
-                ("Waxing Full Legs", 599.0, 45, "Complete leg waxing with soothing lotion", "Waxing"),
-                ("Eyebrow Threading", 99.0, 30, "Precision eyebrow shaping with threading", "Waxing"),
-                ("Manicure", 499.0, 45, "Classic nail care with polish", "Nails"),
-                ("Pedicure", 599.0, 60, "Luxury foot care with massage and polish", "Nails"),
-                ("Makeup Application", 1999.0, 60, "Professional makeup for special occasions", "Makeup"),
-                ("Bridal Makeup", 9999.0, 120, "Complete bridal makeup with trial session", "Makeup")
-            ]
-            
-            c.executemany("INSERT INTO services (name, price, duration, description, category) VALUES (?, ?, ?, ?, ?)", 
-                          sample_services)
-        
-        conn.commit()
+        get_router().ensure_ready()
     except sqlite3.OperationalError as e:
         # If locked, we just log it but don't crash, hoping it's initialized
         print(f"DB Init Warning: {e}")
-    finally:
-        conn.close()
 
 # Hash password (for future use)
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-# Get user ID by phone number
-def get_user_id(phone):
-    conn = get_db_connection()
-    if not conn: return None
-    try:
-        c = conn.cursor()
-        c.execute("SELECT id FROM users WHERE phone = ?", (phone,))
-        result = c.fetchone()
-        return result[0] if result else None
-    finally:
-        conn.close()
-
-# Get user details
+# Get user details (a repository.User record)
 def get_user_details(user_id):
-    conn = get_db_connection()
-    if not conn: return None
-    try:
-        c = conn.cursor()
-        c.execute("SELECT name, phone, loyalty_points FROM users WHERE id = ?", (user_id,))
-        result = c.fetchone()
-        return result
-    finally:
-        conn.close()
-
-# Register new user
-def register_user(name, phone):
-    conn = get_db_connection()
-    if not conn: return False
-    try:
-        c = conn.cursor()
-        c.execute("INSERT INTO users (name, phone, loyalty_points) VALUES (?, ?, 0)", (name, phone))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with get_db_connection() as conn:
+        if not conn: return None
+        return repository.get_user(conn, user_id)
+
+# The logged-in user's row (a repository.User record), cached in the session.
+# It is re-read only once the branch database has changed since it was cached
+# (PRAGMA data_version), so reruns in between cost no query at all.
+def get_profile():
+    # Read the version first: a commit landing mid-read then forces another read next time
+    version = data_version(get_router().db_path(st.session_state.branch_id))
+    profile = st.session_state.get('profile')
+    if profile is None or profile['version'] != version:
+        cache_profile(get_user_details(st.session_state.user_id), version)
+    return st.session_state.profile['user']
+
+# Store a freshly read user row with the data_version it was read at
+def cache_profile(user, version):
+    st.session_state.profile = {'user': user, 'version': version}
+    if user:
+        st.session_state.loyalty_points = user.loyalty_points
+
+# Write-through after this session changes its own points: the cached row is
+# updated in place for the rest of the run and confirmed from the database
+# on the next one (a replayed request may not have changed anything)
+def adjust_profile_points(points):
+    profile = st.session_state.get('profile')
+    if profile and profile['user']:
+        profile['user'].loyalty_points += points
+        profile['version'] = None
+        st.session_state.loyalty_points = profile['user'].loyalty_points
+
+# Log in by phone, registering new clients; returns (user, created).
+# Returning clients cost one read; the row seeds the profile cache.
+def login_user(name, phone):
+    version = data_version(get_router().db_path(st.session_state.branch_id))
+    with get_db_connection() as conn:
+        user = repository.get_user_by_phone(conn, phone) if conn else None
+    created = False
+    if user is None:
+        user, created = run_write(repository.get_or_register_user, name, phone)
+    cache_profile(user, version)
+    return user, created
+
+# Run a write on the session branch's background writer and wait for its result
+def run_write(intent, *args):
+    return get_router().writer(st.session_state.branch_id).run(intent, *args)
 
 # Update loyalty points
 def update_loyalty_points(user_id, points):
-    conn = get_db_connection()
-    if not conn: return
-    try:
-        c = conn.cursor()
-        c.execute("UPDATE users SET loyalty_points = loyalty_points + ? WHERE id = ?", (points, user_id))
-        conn.commit()
-    finally:
-        conn.close()
-
-# Book appointment
-def book_appointment(user_id, service, date, time):
-    conn = get_db_connection()
-    if not conn: return False
+    run_write(repository.add_loyalty_points, user_id, points)
+    adjust_profile_points(points)
+
+# Points awarded for a booking and deducted for a cancellation
+BOOKING_POINTS = availability.BOOKING_POINTS
+CANCELLATION_POINTS = availability.CANCELLATION_POINTS
+
+# Slot availability for the session's branch
+def get_availability_engine():
+    return availability.get_availability(get_router().db_path(st.session_state.branch_id))
+
+# Overlap index for the session's branch
+def get_interval_index():
+    return intervals.get_interval_index(get_router().db_path(st.session_state.branch_id))
+
+# Drop cached availability and overlap data after a write
+def invalidate_schedule(date=None):
+    get_availability_engine().invalidate(date)
+    get_interval_index().invalidate(date)
+
+# Idempotency key for a request, scoped to the logged-in client so a
+# shared instant-book link still books once for each client who opens it
+def request_key(token, *parts):
+    return ":".join([str(st.session_state.user_id), token, *map(str, parts)])
+
+# Idempotency key for a click on one form: repeated clicks (and reruns)
+# with the same selection share a key until rotate_click_key is called
+# or the user moves to another page
+def click_key(form, *parts):
+    nonces = st.session_state.setdefault('click_nonces', {})
+    if form not in nonces:
+        nonces[form] = idempotency.new_key()
+    return request_key(nonces[form], form, *parts)
+
+# Start a fresh key for the form once its request has gone through
+def rotate_click_key(form):
+    st.session_state.setdefault('click_nonces', {}).pop(form, None)
+
+# Every form gets a fresh key once the user moves to another page
+def rotate_click_keys_for_page(page):
+    if st.session_state.get('click_nonces_page') != page:
+        st.session_state.click_nonces_page = page
+        st.session_state.click_nonces = {}
+
+# Shareable link that books the next open slot for a service. Its key is a
+# click key, so the link stays the same across reruns of the admin page.
+def instant_book_link(service_name):
+    key = click_key(f"instant_link:{service_name}")
+    query = urllib.parse.urlencode({"go": "instant_book", "service": service_name, "key": key})
+    return f"?{query}"
+
+# Book appointment and award loyalty points in one transaction, provided
+# the slot still has a free chair for the whole service duration.
+# An identical existing booking counts as success but earns nothing.
+# With a key, a replayed request gets the first outcome back unchanged.
+def book_appointment(user_id, service, date, time, key=None):
+    engine = get_availability_engine()
+    intent = (availability.book_if_available, engine.rules, user_id, service, date, time, BOOKING_POINTS)
     try:
-        c = conn.cursor()
-        # Check for existing booking to prevent duplicates
-        c.execute("""
-            SELECT id FROM appointments 
-            WHERE user_id = ? AND service = ? AND date = ? AND time = ? AND status = 'booked'
-        """, (user_id, service, date, time))
-        existing = c.fetchone()
-        
-        if existing:
-            return True # Idempotent success
-            
-        c.execute("INSERT INTO appointments (user_id, service, date, time) VALUES (?, ?, ?, ?)", 
-                  (user_id, service, date, time))
-        conn.commit()
-        return True
+        result = run_write(idempotency.run_once, key, *intent) if key else run_write(*intent)
     except Exception as e:
         print(f"Booking error: {e}")
         return False
-    finally:
-        conn.close()
-
-# Cancel appointment
-def cancel_appointment(appointment_id):
-    conn = get_db_connection()
-    if not conn: return
+    invalidate_schedule(date)
+    if result == availability.BOOKED:
+        adjust_profile_points(BOOKING_POINTS)
+    return result in (availability.BOOKED, availability.DUPLICATE)
+
+# Book several appointments in one transaction, all or nothing.
+# Returns the (service, date, time) entries that could not be placed.
+def book_series(user_id, bookings):
+    engine = get_availability_engine()
     try:
-        c = conn.cursor()
-        c.execute("UPDATE appointments SET status = 'cancelled' WHERE id = ?", (appointment_id,))
-        conn.commit()
-    finally:
-        conn.close()
-
-# Get user appointments
-def get_user_appointments(user_id):
-    conn = get_db_connection()
-    if not conn: return pd.DataFrame()
+        unavailable = run_write(availability.book_many_if_available, engine.rules, user_id, bookings, BOOKING_POINTS)
+    except Exception as e:
+        print(f"Booking error: {e}")
+        return list(bookings)
+    if not unavailable:
+        invalidate_schedule()
+        adjust_profile_points(BOOKING_POINTS * len(bookings))
+    return unavailable
+
+# Book the earliest open slot for a service across the booking window.
+# Returns (booked, date, time); a replayed key returns the slot booked the first time.
+def book_next_slot(service_name, key):
+    engine = get_availability_engine()
     try:
-        # Optimized query: Removed JOIN (redundant), added GROUP BY to deduplicate
-        df = pd.read_sql_query("""
-            SELECT MAX(id) as id, service, date, time, status
-            FROM appointments
-            WHERE user_id = ?
-            GROUP BY service, date, time, status
-            ORDER BY date DESC, time DESC
-        """, conn, params=[str(user_id)])
-        return df
-    finally:
-        conn.close()
+        result, date, time = run_write(
+            idempotency.run_once, key, availability.book_next_available,
+            engine.rules, st.session_state.user_id, service_name, datetime.now(), BOOKING_POINTS
+        )
+    except Exception as e:
+        print(f"Booking error: {e}")
+        return False, None, None
+    invalidate_schedule(date)
+    if result == availability.BOOKED:
+        adjust_profile_points(BOOKING_POINTS)
+    return result in (availability.BOOKED, availability.DUPLICATE), date, time
 
-# Get all services
-@st.cache_data(ttl=300)
-def get_services():
-    conn = get_db_connection()
-    if not conn: return pd.DataFrame()
+# Cancel appointment and deduct loyalty points in one transaction
+def cancel_appointment(appointment_id):
+    engine = get_availability_engine()
+    # Anyone promoted from the waitlist into the freed slot earns the booking points
+    cancelled = run_write(availability.cancel_and_release, engine.rules, appointment_id, CANCELLATION_POINTS, BOOKING_POINTS)
+    if cancelled:
+        invalidate_schedule()
+        adjust_profile_points(CANCELLATION_POINTS)
+    return cancelled
+
+# Queue for a full slot; books straight away if a chair is free after all.
+# Returns None for a time that is not a bookable start.
+def join_waitlist(user_id, service, date, time):
+    engine = get_availability_engine()
     try:
-        df = pd.read_sql_query("SELECT * FROM services ORDER BY category, name", conn)
-        return df
-    finally:
-        conn.close()
+        result = run_write(waitlist.join_waitlist, engine.rules, user_id, service, date, time, BOOKING_POINTS)
+    except ValueError as e:
+        print(f"Waitlist error: {e}")
+        return None
+    if result == availability.BOOKED:
+        invalidate_schedule(date)
+        adjust_profile_points(BOOKING_POINTS)
+    return result
+
+# Leave the waitlist
+def leave_waitlist(entry_id):
+    return run_write(waitlist.leave_waitlist, entry_id, st.session_state.user_id)
+
+# Get the slots a user is waiting for (a list of waitlist.WaitlistEntry records)
+def get_user_waitlist(user_id):
+    with get_db_connection() as conn:
+        if not conn: return []
+        return waitlist.get_user_waitlist(conn, user_id)
+
+# Move a booking to another time if the whole service fits there
+def reschedule_appointment(appointment_id, date, time):
+    engine = get_availability_engine()
+    result = run_write(availability.reschedule_if_available, engine.rules, appointment_id, date, time, BOOKING_POINTS)
+    if result == availability.BOOKED:
+        invalidate_schedule()
+    return result
+
+# Statuses the user's appointments are in, for the status filter
+def get_user_appointment_statuses(user_id):
+    with get_db_connection() as conn:
+        if not conn: return []
+        return repository.get_user_appointment_statuses(conn, user_id)
+
+# Get user appointments filtered and sorted in SQL (a list of repository.Appointment records)
+def find_user_appointments(user_id, status=None, date_from=None, date_to=None, order='date', descending=False,
+                           after=None, limit=None):
+    with get_db_connection() as conn:
+        if not conn: return []
+        return repository.find_user_appointments(
+            conn, user_id, status, date_from, date_to, order, descending, after, limit
+        )
+
+# Page sizes offered under paginated lists
+PAGE_SIZES = [10, 25, 50]
+
+# Keyset pagination state for one list: a stack of page keys, one per page
+# visited, restarted whenever the list's filters (scope) or page size change.
+# Returns the page size and the key of the previous page's last row (None on page 1).
+def page_position(name, scope=None):
+    page_size = st.selectbox("Per page", PAGE_SIZES, key=f"{name}_page_size")
+    state = st.session_state.setdefault(f"{name}_pages", {"scope": None, "keys": [None]})
+    if state["scope"] != (scope, page_size):
+        state["scope"], state["keys"] = (scope, page_size), [None]
+    return page_size, state["keys"][-1]
+
+# Split rows fetched with LIMIT page_size + 1 into the page and the next page's key
+def split_page(rows, page_size, key):
+    if len(rows) > page_size:
+        return rows[:page_size], key(rows[page_size - 1])
+    return rows, None
+
+# Previous / Next buttons for a list paged with page_position
+def page_controls(name, next_key):
+    state = st.session_state[f"{name}_pages"]
+    cols = st.columns([1, 2, 1])
+    with cols[0]:
+        if st.button("← Previous", key=f"{name}_prev", disabled=len(state["keys"]) == 1):
+            state["keys"].pop()
+            st.rerun()
+    with cols[1]:
+        st.caption(f"Page {len(state['keys'])}")
+    with cols[2]:
+        if st.button("Next →", key=f"{name}_next", disabled=next_key is None):
+            state["keys"].append(next_key)
+            st.rerun()
+
+# Get all services (cached per branch until the services table changes)
+def get_services(branch_id):
+    router = get_router()
+    with router.pool(branch_id).connection() as conn:
+        return get_query_cache(router.db_path(branch_id)).read_sql(
+            conn, ('services',), "SELECT * FROM services ORDER BY category, name"
+        )
+
+# Run a repository loader through the branch's query cache
+def cached_query(tables, loader, *args):
+    branch_id = st.session_state.branch_id
+    router = get_router()
+    with router.pool(branch_id).connection() as conn:
+        return get_query_cache(router.db_path(branch_id)).call(conn, tables, loader, *args)
 
 # Convert image to base64 for embedding
 def get_image_base64(image_path):
@@ -950,6 +1043,19 @@ def local_css():
         animation: heroFadeIn 1.5s ease-in-out 0.5s backwards;
     }
 
+    .card-grid {
+        display: grid;
+        grid-template-columns: repeat(var(--card-columns, 1), minmax(0, 1fr));
+        column-gap: 1rem;
+    }
+    
+    /* Long catalogs: the browser skips layout and paint for cards off screen */
+    .card-grid > .service-card,
+    .card-grid > .appointment-card {
+        content-visibility: auto;
+        contain-intrinsic-size: auto 160px;
+    }
+    
     .gallery-grid {
         display: grid;
         grid-template-columns: repeat(auto-fill, minmax(250px, 1fr));
@@ -1374,28 +1480,11 @@ def main():
                 else:
                     service_name = None
                 if st.session_state.logged_in and service_name:
-                    now = datetime.now()
-                    hour = now.hour
-                    minute = now.minute
-                    if minute < 30:
-                        minute_next = 30
-                        hour_next = hour
-                    else:
-                        minute_next = 0
-                        hour_next = hour + 1
-                    if hour_next < 9:
-                        hour_next = 9
-                        minute_next = 0
-                    date_dt = now
-                    if hour_next >= 19:
-                        date_dt = now + timedelta(days=1)
-                        hour_next = 9
-                        minute_next = 0
-                    time_str = f"{hour_next:02d}:{minute_next:02d}"
-                    date_str = date_dt.strftime("%Y-%m-%d")
-                    date_label = date_dt.strftime("%A, %B %d")
-                    if book_appointment(st.session_state.user_id, service_name, date_str, time_str):
-                        update_loyalty_points(st.session_state.user_id, 10)
+                    # A link without a key gets a one-off key, so only minted links are replay-safe
+                    link_key = st.query_params.get("key") or idempotency.new_key()
+                    booked, date_str, time_str = book_next_slot(service_name, request_key(link_key))
+                    if booked:
+                        date_label = datetime.strptime(date_str, "%Y-%m-%d").strftime("%A, %B %d")
                         st.session_state.show_confetti = True
                         st.session_state.flash_message = f"🎉 Appointment for {service_name} on {date_label} at {time_str} booked!"
                         st.session_state.navigate_to = "My Appointments"
@@ -1454,39 +1543,16 @@ def book_next_available_slot(service_name: str):
             st.rerun()
             return
         
-        # Calculate next available slot
-        now = datetime.now()
-        hour = now.hour
-        minute = now.minute
-        
-        # Round up to next half hour
-        if minute < 30:
-            minute_next = 30
-            hour_next = hour
-        else:
-            minute_next = 0
-            hour_next = hour + 1
-        
-        # Ensure it's within business hours (9 AM - 7 PM)
-        if hour_next < 9:
-            hour_next = 9
-            minute_next = 0
-        
-        date_dt = now
-        # If past closing time, book for next day
-        if hour_next >= 19:
-            date_dt = now + timedelta(days=1)
-            hour_next = 9
-            minute_next = 0
-        
-        time_str = f"{hour_next:02d}:{minute_next:02d}"
-        date_str = date_dt.strftime("%Y-%m-%d")
-        date_label = date_dt.strftime("%A, %B %d")
-        
-        # Book the appointment
-        if book_appointment(st.session_state.user_id, service_name, date_str, time_str):
-            # Award loyalty points
-            update_loyalty_points(st.session_state.user_id, 10)
+        # Book the earliest slot with a free chair for the whole service
+        # (loyalty points are awarded in the same transaction)
+        # The key lasts until the user leaves the page, so a repeated click
+        # cannot book a second slot; a full window is not stored and can be retried
+        booked, date_str, time_str = book_next_slot(service_name, click_key(f"book_now:{service_name}"))
+        if not date_str:
+            st.error("❌ No open slots for this service in the next two weeks.")
+            return
+        if booked:
+            date_label = datetime.strptime(date_str, "%Y-%m-%d").strftime("%A, %B %d")
             st.session_state.show_confetti = True
             st.session_state.flash_message = f"🎉 Appointment for {service_name} on {date_label} at {time_str} booked!"
             st.session_state.navigate_to = "My Appointments"
@@ -1521,6 +1587,13 @@ def show_login_page():
         with st.form("login_form"):
             name = st.text_input("Name", placeholder="Enter your full name")
             phone = st.text_input("Phone Number", placeholder="10-digit mobile number")
+            
+            # Branch picker (only shown once the salon has more than one location)
+            branches = list(get_router().branches.values())
+            branch_id = branches[0].id
+            if len(branches) > 1:
+                branch_labels = {branch.name: branch.id for branch in branches}
+                branch_id = branch_labels[st.selectbox("Branch", list(branch_labels))]
             st.caption("We'll create a new account if one doesn't exist.")
             
             submitted = st.form_submit_button("Start Your Journey", use_container_width=True)
@@ -1528,8 +1601,12 @@ def show_login_page():
             if submitted:
                 if name and phone:
                     if len(phone) == 10 and phone.isdigit():
-                        # Register user if not exists
-                        if register_user(name, phone):
+                        # Every data helper reads and writes this branch's database
+                        st.session_state.branch_id = branch_id
+                        
+                        # Look the user up, registering them if they are new
+                        user, created = login_user(name, phone)
+                        if created:
                             st.success(f"Welcome {name}! Your account has been created.")
                         else:
                             st.info(f"Welcome back {name}!")
@@ -1538,10 +1615,7 @@ def show_login_page():
                         st.session_state.logged_in = True
                         st.session_state.user_name = name
                         st.session_state.phone_number = phone
-                        
-                        # Get user ID
-                        user_id = get_user_id(phone)
-                        st.session_state.user_id = user_id
+                        st.session_state.user_id = user.id
                         
                         st.rerun()
                     else:
@@ -1629,12 +1703,14 @@ def show_login_page():
 def show_main_app():
     # Sidebar navigation
     st.sidebar.markdown(f"<h3 style='color: var(--dark);'>Hello, {st.session_state.user_name}!</h3>", unsafe_allow_html=True)
+    router = get_router()
+    if len(router.branches) > 1:
+        st.sidebar.caption(f"📍 {router.branch(st.session_state.branch_id).name}")
     
     # Display loyalty points in sidebar
-    user_details = get_user_details(st.session_state.user_id)
+    user_details = get_profile()
     if user_details:
-        _, _, loyalty_points = user_details
-        st.session_state.loyalty_points = loyalty_points
+        loyalty_points = user_details.loyalty_points
         st.sidebar.markdown(f"<div class='loyalty-badge'>💎 {loyalty_points} Points</div>", unsafe_allow_html=True)
     
     st.sidebar.markdown("---")
@@ -1662,6 +1738,7 @@ def show_main_app():
         key="nav_select_radio",
     )
     st.session_state.navigate_to = None
+    rotate_click_keys_for_page(menu)
     
     if menu == "Home":
         show_home_page()
@@ -1706,66 +1783,47 @@ def show_home_page():
     st.markdown("<h3>🎯 Recommended For You</h3>", unsafe_allow_html=True)
     recommendations = get_service_recommendations(st.session_state.user_id)
     
-    if recommendations is not None and len(recommendations) > 0:
-        cols = st.columns(2)
-        for i in range(min(len(recommendations), 4)):  # Limit to 4 recommendations
-            service = recommendations.iloc[i]
-            with cols[i % 2]:
-                # Handle description safely
-                description = ""
-                if 'description' in service:
-                    if pd.notna(service['description']):
-                        description = str(service['description'])
-                service_name_encoded = urllib.parse.quote_plus(str(service['name']))
-                
-                st.markdown(f"""
-                <div class="service-card">
-                    <div style="display: flex; justify-content: space-between;">
-                        <h4>{service['name']}</h4>
-                        <h4 style="color: var(--primary);">₹{service['price']:.2f}</h4>
-                    </div>
-                    <p><strong>Category:</strong> {service['category']}</p>
-                    <p>{description}</p>
-                """, unsafe_allow_html=True)
-                book_button = st.button("Book Now", key=f"book_rec_{i}", use_container_width=True)
-                if book_button:
-                    book_next_available_slot(str(service['name']))
-                st.markdown("</div>", unsafe_allow_html=True)
+    if recommendations:
+        recommendations = recommendations[:4]  # Limit to 4 recommendations
+        st.markdown(cards.card_grid(
+            (cards.service_card(service.name, service.price, description=service.description, category=service.category)
+             for service in recommendations),
+        ), unsafe_allow_html=True)
+        book_now_picker("book_rec", [service.name for service in recommendations])
     else:
         st.info("Book your first service to get personalized recommendations!")
     
     # Services preview
     st.markdown("<h3>🌟 Popular Services</h3>", unsafe_allow_html=True)
-    services_df = get_services()
+    services_df = get_services(st.session_state.branch_id)
     
     # Show top 4 services
     top_services = services_df.head(4)
-    
-    cols = st.columns(2)
-    for i, (index, service) in enumerate(top_services.iterrows()):
-        with cols[i % 2]:
-            st.markdown(f"""
-            <div class="service-card">
-                <div style="display: flex; justify-content: space-between;">
-                    <h4>{service['name']}</h4>
-                    <h4 style="color: var(--primary);">₹{service['price']:.2f}</h4>
-                </div>
-                <p><strong>Duration:</strong> {service['duration']} minutes</p>
-                <p>{service['description']}</p>
-            </div>
-            """, unsafe_allow_html=True)
-            book_button = st.button("Book Now", key=f"book_top_{i}", use_container_width=True)
-            if book_button:
-                book_next_available_slot(str(service['name']))
+    st.markdown(cards.card_grid(
+        cards.service_card(name, price, duration, description)
+        for name, price, duration, description in zip(
+            top_services['name'], top_services['price'], top_services['duration'], top_services['description'])
+    ), unsafe_allow_html=True)
+    book_now_picker("book_top", list(top_services['name']))
+
+# One "Book Now" control under a card grid, instead of a button per card
+def book_now_picker(key, service_names):
+    if not service_names:
+        return
+    pick_col, button_col = st.columns([3, 1], vertical_alignment="bottom")
+    with pick_col:
+        service_name = st.selectbox("Book the next open slot for", service_names, key=f"{key}_service")
+    with button_col:
+        if st.button("Book Now", key=key, use_container_width=True):
+            book_next_available_slot(str(service_name))
 
 def show_profile_page():
     st.markdown("<h2>👤 My Profile</h2>", unsafe_allow_html=True)
     
     # Get user details
-    user_details = get_user_details(st.session_state.user_id)
+    user_details = get_profile()
     if user_details:
-        name, phone, loyalty_points = user_details
-        st.session_state.loyalty_points = loyalty_points
+        name, phone, loyalty_points = user_details.name, user_details.phone, user_details.loyalty_points
     else:
         name, phone, loyalty_points = st.session_state.user_name, st.session_state.phone_number, 0
     
@@ -1861,162 +1919,319 @@ def show_profile_page():
 def show_services_page():
     st.markdown("<h2>💇‍♀️ Our Services</h2>", unsafe_allow_html=True)
     
-    services_df = get_services()
-    
-    # Group services by category
-    categories = services_df['category'].unique()
+    services_df = get_services(st.session_state.branch_id)
     
-    for category in categories:
-        st.markdown(f"<h3 style='color: var(--accent);'>{category}</h3>", unsafe_allow_html=True)
-        category_services = services_df[services_df['category'] == category]
-        
-        for _, service in category_services.iterrows():
-            st.markdown(f"""
-            <div class="service-card">
-                <div style="display: flex; justify-content: space-between;">
-                    <h4>{service['name']}</h4>
-                    <h4 style="color: var(--primary);">₹{service['price']:.2f}</h4>
-                </div>
-                <p><strong>Duration:</strong> {service['duration']} minutes</p>
-                <p>{service['description']}</p>
-            </div>
-            """, unsafe_allow_html=True)
+    # The whole catalog, grouped by category, is a single element
+    st.markdown(cards.services_by_category(services_df), unsafe_allow_html=True)
+
+# Booking page service choice, with the price next to the name
+def service_label(name, price):
+    return f"{name} (₹{price:.2f})"
 
 def show_booking_page():
     st.markdown("<h2>📅 Book Appointment</h2>", unsafe_allow_html=True)
-    st.caption("Choose a service, pick a date and select a time between 09:00 and 18:30.")
+    st.caption("Choose a service, pick a date and select one of the open times.")
     
-    services_df = get_services()
+    services_df = get_services(st.session_state.branch_id)
     if services_df is None or services_df.empty:
         st.error("No services available right now. Please check back later.")
         return
     
-    service_options = [f"{row['name']} (₹{row['price']:.2f})" for _, row in services_df.iterrows()]
-    service_dict = {f"{row['name']} (₹{row['price']:.2f})": row['name'] for _, row in services_df.iterrows()}
-    
-    # Calculate default time
-    now = datetime.now()
-    minute = now.minute
-    next_minute = 30 if minute < 30 else 0
-    next_hour = now.hour if minute < 30 else now.hour + 1
-    if next_hour < 9:
-        next_hour = 9
-        next_minute = 0
-    default_time = datetime(now.year, now.month, now.day, next_hour, next_minute).time()
-
-    # Determine default index
-    default_index = 0
-    
-    # Check if we have a preselected service from navigation
+    # A service chosen elsewhere (Book Now, instant-book links) is selected here once
     if st.session_state.preselected_service:
-        try:
-            for idx, label in enumerate(service_options):
-                if service_dict.get(label) == st.session_state.preselected_service:
-                    default_index = idx
-                    # Update the widget state to match preselection
-                    st.session_state.booking_service = label
-                    break
-        except Exception:
-            default_index = 0
+        for name, price in zip(services_df['name'], services_df['price']):
+            if name == st.session_state.preselected_service:
+                st.session_state.booking_service = service_label(name, price)
+                break
         # Clear preselection so it doesn't persist and lock the dropdown
         st.session_state.preselected_service = None
-
-    # Layout: 2 Columns (Inputs | Summary) - Responsive
+    
+    # Picking a service, date or time reruns only the fragments below;
+    # the rest of the script (CSS, sidebar, this header) runs again on confirm
+    booking_service_picker()
+    
+    engine = get_availability_engine()
+    today = datetime.today().date()
+    window = engine.window(today.strftime("%Y-%m-%d"), availability.BOOKING_WINDOW_DAYS)
+    with st.expander("📊 How busy are the next two weeks?"):
+        # Rendered from the same window as the slot picker, so the heatmap costs no extra query
+        heatmap = go.Figure(go.Heatmap(
+            z=[[min(count, engine.rules.chairs) for count in day.counts] for day in window],
+            x=[engine.rules.slot_time(i) for i in range(engine.rules.slots_per_day)],
+            y=[datetime.strptime(day.date, "%Y-%m-%d").strftime("%a %d %b") for day in window],
+            zmin=0,
+            zmax=engine.rules.chairs,
+            colorscale=[[0, "#fdf2f8"], [1, "#FF69B4"]],
+            colorbar=dict(title="Chairs taken"),
+        ))
+        heatmap.update_layout(height=420, margin=dict(l=0, r=0, t=10, b=0), yaxis=dict(autorange="reversed"))
+        st.plotly_chart(heatmap, use_container_width=True)
+
+# Step 1 of the booking page. Changing the service reruns this fragment,
+# which includes the slot picker and summary for the new service.
+@st.fragment
+def booking_service_picker():
+    services_df = get_services(st.session_state.branch_id)
+    labels = [service_label(name, price) for name, price in zip(services_df['name'], services_df['price'])]
+    names = dict(zip(labels, services_df['name']))
+    durations = dict(zip(services_df['name'], services_df['duration']))
+    if st.session_state.get("booking_service") not in names:
+        st.session_state.booking_service = labels[0]
+    
+    picker_col, _ = st.columns([2, 1], gap="large")
+    with picker_col:
+        st.markdown("### 1. Select Service")
+        service_selected = st.selectbox("Choose Service", labels, key="booking_service")
+        st.caption("Service price is shown next to the name.")
+    
+    booking_slot_picker(names[service_selected], durations)
+
+# Step 2 and the summary card. Changing the date or time reruns only this
+# fragment; the summary shows both selections, so it renders in here too.
+@st.fragment
+def booking_slot_picker(service_name, durations):
+    engine = get_availability_engine()
+    today = datetime.today().date()
+    duration = durations.get(service_name)
     main_cols = st.columns([2, 1], gap="large")
     
     with main_cols[0]:
-        with st.container():
-            st.markdown("### 1. Select Service")
-            
-            # Use the key to manage state, but respect default_index if key is not yet set
-            # If key is in session_state, index argument is ignored by Streamlit
-            if "booking_service" not in st.session_state:
-                 st.session_state.booking_service = service_options[default_index] if service_options else None
-            
-            # Find current index from session state to avoid warnings if possible, 
-            # though Streamlit handles this via key mostly.
-            current_val = st.session_state.get("booking_service")
-            current_idx = 0
-            if current_val in service_options:
-                current_idx = service_options.index(current_val)
-            
-            service_selected = st.selectbox(
-                "Choose Service", 
-                service_options, 
-                index=current_idx, 
-                key="booking_service"
+        st.markdown("### 2. Select Date & Time")
+        d_cols = st.columns(2)
+        with d_cols[0]:
+            date_input = st.date_input(
+                "Date",
+                value=today,
+                min_value=today,
+                max_value=today + timedelta(days=availability.BOOKING_WINDOW_DAYS - 1),
+                key="booking_date"
             )
-            
-            service_name = service_dict.get(service_selected, service_options[0] if service_options else "")
-            st.caption("Service price is shown next to the name.")
-            
-            st.markdown("### 2. Select Date & Time")
-            d_cols = st.columns(2)
-            with d_cols[0]:
-                today = datetime.today().date()
-                date_input = st.date_input(
-                    "Date",
-                    value=today,
-                    min_value=today,
-                    max_value=today + timedelta(days=14),
-                    key="booking_date"
-                )
-            with d_cols[1]:
-                time_input = st.time_input("Time", value=default_time, step=1800, key="booking_time")
-            
-            if not (9 <= time_input.hour < 19):
-                st.warning("⚠️ Please select a time between 09:00 and 18:30.")
+        date_selected = date_input.strftime("%Y-%m-%d")
+        free_times = engine.free_slots(date_selected, duration)
+        with d_cols[1]:
+            time_input = st.selectbox(
+                "Time",
+                free_times,
+                key="booking_slot",
+                disabled=not free_times,
+                placeholder="No open times"
+            )
+        
+        if not free_times:
+            st.info("This day is fully booked for this service. Please choose another date.")
+        else:
+            for clash in get_interval_index().conflicts(date_selected, time_input, duration, st.session_state.user_id):
+                st.warning(f"⚠️ This overlaps your {clash.service} booking at {clash.start_time}–{clash.end_time}.")
+        full_times = engine.full_slots(date_selected, duration)
+        if full_times:
+            with st.expander("⏳ Wanted time taken? Join the waitlist"):
+                st.caption("If a booking at that time is cancelled, it is yours automatically.")
+                wait_time = st.selectbox("Time", full_times, key="waitlist_time")
+                if st.button("Join Waitlist", key="waitlist_join"):
+                    result = join_waitlist(st.session_state.user_id, service_name, date_selected, wait_time)
+                    if result == waitlist.WAITING:
+                        st.success(f"You're on the waitlist for {service_name} at {wait_time}.")
+                    elif result == availability.BOOKED:
+                        st.success(f"🎉 A chair just opened up: booked for {wait_time}!")
+                        st.session_state.show_confetti = True
+                        st.rerun()
+                    elif result == availability.DUPLICATE:
+                        st.info("You're already on the waitlist for this time.")
+                    else:
+                        st.error("❌ That time can't be waitlisted. Please pick another slot.")
+        # The window is loaded in one query and cached, so date changes cost no reads
+        window = engine.window(today.strftime("%Y-%m-%d"), availability.BOOKING_WINDOW_DAYS)
+        full_days = [
+            datetime.strptime(day.date, "%Y-%m-%d").strftime("%a %d %b")
+            for day in window
+            if not day.free_start_mask(engine.rules.slots_for(duration))
+        ]
+        if full_days:
+            st.caption("Fully booked: " + ", ".join(full_days))
+    
+    with main_cols[1]:
+        show_booking_summary(service_name, date_input, time_input)
+    
+    if time_input:
+        show_series_booking(service_name, list(durations), durations, date_input, time_input)
 
-    # Prepare summary data
+def show_booking_summary(service_name, date_input, time_input):
+    """Summary card and Confirm Booking; a confirmed booking reruns the whole page"""
     date_selected = date_input.strftime("%Y-%m-%d")
     date_label = date_input.strftime("%A, %B %d")
-    time_selected = f"{time_input.hour:02d}:{time_input.minute:02d}"
-
-    with main_cols[1]:
-        st.markdown("### Summary")
-        st.markdown(f"""
-        <div class="appointment-card" style="border: 2px solid var(--primary); padding: 1.5rem;">
-            <div style="display:flex;justify-content:space-between;margin-bottom:1rem;border-bottom:1px solid #eee;padding-bottom:0.5rem;">
-                <h4 style="margin:0;">Selection</h4>
-                <h4 style="color:var(--primary);margin:0;">{time_selected}</h4>
-            </div>
-            <p style="margin-bottom:0.5rem;"><strong>Service:</strong><br>{service_name}</p>
-            <p style="margin-bottom:0.5rem;"><strong>Date:</strong><br>{date_label}</p>
-            <p style="margin-bottom:0.5rem;"><strong>Time:</strong><br>{time_selected}</p>
-            <hr style="margin: 1rem 0; border: 0; border-top: 1px solid #eee;">
-            <p style="font-size: 0.85rem; color: #666; line-height: 1.6;">
-                <span style="color: var(--primary); font-weight:bold;">✓</span> Free Cancellation<br>
-                <span style="color: var(--primary); font-weight:bold;">✓</span> Instant Confirmation
-            </p>
+    time_selected = time_input or "--:--"
+    
+    st.markdown("### Summary")
+    st.markdown(f"""
+    <div class="appointment-card" style="border: 2px solid var(--primary); padding: 1.5rem;">
+        <div style="display:flex;justify-content:space-between;margin-bottom:1rem;border-bottom:1px solid #eee;padding-bottom:0.5rem;">
+            <h4 style="margin:0;">Selection</h4>
+            <h4 style="color:var(--primary);margin:0;">{time_selected}</h4>
         </div>
-        """, unsafe_allow_html=True)
+        <p style="margin-bottom:0.5rem;"><strong>Service:</strong><br>{service_name}</p>
+        <p style="margin-bottom:0.5rem;"><strong>Date:</strong><br>{date_label}</p>
+        <p style="margin-bottom:0.5rem;"><strong>Time:</strong><br>{time_selected}</p>
+        <hr style="margin: 1rem 0; border: 0; border-top: 1px solid #eee;">
+        <p style="font-size: 0.85rem; color: #666; line-height: 1.6;">
+            <span style="color: var(--primary); font-weight:bold;">✓</span> Free Cancellation<br>
+            <span style="color: var(--primary); font-weight:bold;">✓</span> Instant Confirmation
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    if st.button("Confirm Booking", type="primary", use_container_width=True, disabled=not time_input):
+        key = click_key("confirm_booking", service_name, date_selected, time_selected)
+        if book_appointment(st.session_state.user_id, service_name, date_selected, time_selected, key):
+            rotate_click_key("confirm_booking")
+            st.success(f"🎉 Appointment booked successfully for {date_label} at {time_selected}")
+            st.session_state.show_confetti = True
+            st.session_state.preselected_service = None
+            st.rerun()
+        else:
+            st.error("❌ That time is no longer available. Please pick another slot.")
+
+def show_series_booking(service_name, service_names, durations, start_date, start_time):
+    """Repeat the selected booking, or book several services at once, in one transaction"""
+    with st.expander("🔁 Repeat this booking or book for a group"):
+        mode = st.radio(
+            "Booking type",
+            ["Repeat every few weeks", "Several services on this day"],
+            horizontal=True,
+            key="series_mode"
+        )
+        if mode == "Repeat every few weeks":
+            cols = st.columns(2)
+            with cols[0]:
+                every = st.selectbox("Every", [1, 2, 3, 4, 6, 8], index=3,
+                                     format_func=lambda weeks: f"{weeks} week{'s' if weeks > 1 else ''}",
+                                     key="series_every")
+            with cols[1]:
+                count = st.slider("Appointments", 2, 12, 4, key="series_count")
+            series = [
+                (service_name, (start_date + timedelta(weeks=every * i)).strftime("%Y-%m-%d"), start_time)
+                for i in range(count)
+            ]
+        else:
+            chosen = st.multiselect("Services", service_names, default=[service_name], key="series_services")
+            series = [(name, start_date.strftime("%Y-%m-%d"), start_time) for name in chosen]
         
-        if st.button("Confirm Booking", type="primary", use_container_width=True):
-            if 9 <= time_input.hour < 19:
-                if book_appointment(st.session_state.user_id, service_name, date_selected, time_selected):
-                    st.success(f"🎉 Appointment booked successfully for {date_label} at {time_selected}")
-                    st.session_state.show_confetti = True
-                    update_loyalty_points(st.session_state.user_id, 10)
-                    st.session_state.preselected_service = None
-                    st.rerun()
-                else:
-                    st.error("❌ Failed to book appointment. Please try again.")
+        if not series:
+            return
+        engine = get_availability_engine()
+        # One read covers every date in the series before the per-entry checks
+        engine.days(sorted({date for _, date, _ in series}))
+        st.dataframe(pd.DataFrame([
+            {
+                'service': service,
+                'date': datetime.strptime(date, "%Y-%m-%d").strftime("%a %d %b %Y"),
+                'time': time,
+                'open': "✓" if engine.is_free(date, time, durations.get(service)) else "✗ full",
+            }
+            for service, date, time in series
+        ]), hide_index=True, use_container_width=True)
+        
+        if st.button(f"Book All {len(series)}", key="series_book"):
+            unavailable = book_series(st.session_state.user_id, series)
+            if not unavailable:
+                st.success(f"🎉 {len(series)} appointments booked!")
+                st.session_state.show_confetti = True
+                st.rerun()
             else:
-                st.error("Please select a valid time slot.")
+                missing = ", ".join(f"{service} on {date} at {time}" for service, date, time in unavailable)
+                st.error(f"❌ Nothing was booked. These are not available: {missing}")
+
+def show_reschedule_form(appointment, duration):
+    """Move a booked appointment to another open slot.
+
+    duration is the one the booking holds, which the move is checked against.
+    """
+    with st.expander("Reschedule"):
+        engine = get_availability_engine()
+        today = datetime.today().date()
+        last_day = today + timedelta(days=availability.BOOKING_WINDOW_DAYS - 1)
+        try:
+            current = datetime.strptime(str(appointment.date), '%Y-%m-%d').date()
+        except ValueError:
+            current = today
+        new_date = st.date_input(
+            "New date",
+            value=min(max(current, today), last_day),
+            min_value=today,
+            max_value=last_day,
+            key=f"reschedule_date_{appointment.id}"
+        )
+        date_str = new_date.strftime("%Y-%m-%d")
+        free_times = [
+            time for time in engine.free_slots(date_str, duration, moving=(str(appointment.date), appointment.time, duration))
+            if (date_str, time) != (str(appointment.date), appointment.time)
+        ]
+        new_time = st.selectbox(
+            "New time",
+            free_times,
+            key=f"reschedule_time_{appointment.id}",
+            disabled=not free_times,
+            placeholder="No open times"
+        )
+        if new_time:
+            clashes = get_interval_index().conflicts(date_str, new_time, duration, st.session_state.user_id, exclude_id=appointment.id)
+            for clash in clashes:
+                st.warning(f"⚠️ This overlaps your {clash.service} booking at {clash.start_time}–{clash.end_time}.")
+        if st.button("Move Appointment", key=f"reschedule_{appointment.id}", disabled=not new_time):
+            result = reschedule_appointment(appointment.id, date_str, new_time)
+            if result == availability.BOOKED:
+                st.success(f"Appointment moved to {new_date.strftime('%A, %B %d')} at {new_time}!")
+                st.rerun()
+            elif result == availability.DUPLICATE:
+                st.error("❌ You already have this service booked at that time.")
+            else:
+                st.error("❌ That time is no longer available. Please pick another slot.")
+
+# "Date Range" choices as (first, last) day offsets from today; None is unbounded
+APPOINTMENT_DATE_RANGES = {
+    "Upcoming": (0, None),
+    "All Time": (None, None),
+    "Last 7 Days": (-7, 0),
+    "Last 30 Days": (-30, 0),
+    "Next 7 Days": (0, 7),
+    "Next 30 Days": (0, 30),
+}
+
+# "Sort By" choices as (order, descending) for repository.find_user_appointments
+APPOINTMENT_SORTS = {
+    "Date (Ascending)": ('date', False),
+    "Date (Descending)": ('date', True),
+    "Time (Ascending)": ('time', False),
+    "Time (Descending)": ('time', True),
+}
 
 def show_my_appointments():
     st.markdown("<h2>🗓️ My Appointments</h2>", unsafe_allow_html=True)
     
-    # Get user appointments
-    appointments_df = get_user_appointments(st.session_state.user_id)
+    # Statuses double as the "has any appointments" check
+    statuses = get_user_appointment_statuses(st.session_state.user_id)
+    
+    waiting = get_user_waitlist(st.session_state.user_id)
+    if waiting:
+        st.markdown("<h3>⏳ Waitlist</h3>", unsafe_allow_html=True)
+        for entry in waiting:
+            entry_cols = st.columns([4, 1])
+            with entry_cols[0]:
+                st.markdown(f"**{entry.service}** · {entry.date} at {entry.time}")
+            with entry_cols[1]:
+                if st.button("Leave", key=f"leave_waitlist_{entry.id}"):
+                    leave_waitlist(entry.id)
+                    st.rerun()
     
-    if appointments_df.empty:
+    if not statuses:
         st.info("You don't have any appointments yet. Book your first appointment!")
         if st.button("Book Now"):
             st.session_state.navigate_to = "Book Appointment"
             st.session_state.preselected_service = None
             st.rerun()
     else:
+        services_df = get_services(st.session_state.branch_id)
+        durations = dict(zip(services_df['name'], services_df['duration'])) if not services_df.empty else {}
+        
         # Add filtering and sorting options
         st.markdown("<h3>Filter & Sort Appointments</h3>", unsafe_allow_html=True)
         
@@ -2024,7 +2239,7 @@ def show_my_appointments():
         col1, col2, col3 = st.columns(3)
         with col1:
             # Status filter (radio buttons for better readability)
-            status_options = ["All"] + list(appointments_df['status'].unique())
+            status_options = ["All"] + statuses
             selected_status = st.radio(
                 "Filter by Status",
                 status_options,
@@ -2034,10 +2249,9 @@ def show_my_appointments():
         
         with col2:
             # Sort by date or time (radio buttons)
-            sort_options = ["Date (Ascending)", "Date (Descending)", "Time (Ascending)", "Time (Descending)"]
             selected_sort = st.radio(
                 "Sort By",
-                sort_options,
+                list(APPOINTMENT_SORTS),
                 index=0,
                 key="appt_sort_by",
             )
@@ -2046,126 +2260,54 @@ def show_my_appointments():
             # Date range filter (radio buttons)
             date_range = st.radio(
                 "Date Range",
-                ["Upcoming", "All Time", "Last 7 Days", "Last 30 Days", "Next 7 Days", "Next 30 Days"],
+                list(APPOINTMENT_DATE_RANGES),
                 index=0,
                 key="appt_date_range",
             )
         
-        # Apply filters
-        filtered_df = appointments_df.copy()
-        
-        # Apply status filter
-        if selected_status != "All":
-            filtered_df = filtered_df[filtered_df['status'] == selected_status]
-        
-        # Apply date range filter
+        # Filters and sort order become one parameterized query on the page-key indexes
         today = datetime.now().date()
-        if date_range != "All Time":
-            try:
-                # Create a list to store indices of rows that match the filter
-                filtered_indices = []
-                
-                for idx, row in filtered_df.iterrows():
-                    try:
-                        # Convert to string explicitly
-                        date_str = str(row['date'])
-                        appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                        
-                        if date_range == "Upcoming":
-                            if appointment_date >= today:
-                                filtered_indices.append(idx)
-                        elif date_range == "Last 7 Days":
-                            week_ago = today - timedelta(days=7)
-                            if appointment_date >= week_ago and appointment_date <= today:
-                                filtered_indices.append(idx)
-                        elif date_range == "Last 30 Days":
-                            month_ago = today - timedelta(days=30)
-                            if appointment_date >= month_ago and appointment_date <= today:
-                                filtered_indices.append(idx)
-                        elif date_range == "Next 7 Days":
-                            week_ahead = today + timedelta(days=7)
-                            if today <= appointment_date <= week_ahead:
-                                filtered_indices.append(idx)
-                        elif date_range == "Next 30 Days":
-                            month_ahead = today + timedelta(days=30)
-                            if today <= appointment_date <= month_ahead:
-                                filtered_indices.append(idx)
-                    except:
-                        # If date parsing fails, skip this row
-                        pass
-                
-                # Filter the DataFrame using the collected indices
-                # Even if filtered_indices is empty, we should filter to show empty result
-                filtered_df = filtered_df.loc[filtered_indices]
-            except Exception as e:
-                st.warning(f"Date filtering encountered an issue: {str(e)}")
-        
-        # Apply sorting
-        try:
-            if selected_sort == "Date (Ascending)" or selected_sort == "Date (Descending)":
-                # Create a temporary column for sorting by date
-                date_list = []
-                for _, row in filtered_df.iterrows():
-                    try:
-                        # Convert to string explicitly
-                        date_str = str(row['date'])
-                        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                        date_list.append(date_obj)
-                    except:
-                        date_list.append(datetime.min)
-                
-                filtered_df.loc[:, 'temp_date_sort'] = date_list
-                ascending = (selected_sort == "Date (Ascending)")
-                # Use a more defensive approach for sorting
-                try:
-                    sorted_indices = filtered_df['temp_date_sort'].sort_values(ascending=ascending).index
-                    filtered_df = filtered_df.loc[sorted_indices]
-                except:
-                    pass
-                filtered_df = filtered_df.drop('temp_date_sort', axis=1)
-            elif selected_sort == "Time (Ascending)" or selected_sort == "Time (Descending)":
-                ascending = (selected_sort == "Time (Ascending)")
-                # Use a more defensive approach for sorting
-                try:
-                    sorted_indices = filtered_df['time'].sort_values(ascending=ascending).index
-                    filtered_df = filtered_df.loc[sorted_indices]
-                except:
-                    pass
-        except Exception as e:
-            st.warning(f"Sorting encountered an issue: {str(e)}")
+        bounds = [
+            None if offset is None else (today + timedelta(days=offset)).strftime('%Y-%m-%d')
+            for offset in APPOINTMENT_DATE_RANGES[date_range]
+        ]
+        order, descending = APPOINTMENT_SORTS[selected_sort]
+        # Pages seek past the last (date, time, id) shown, so each rerun reads one page
+        page_size, after = page_position("appointments", (selected_status, selected_sort, date_range))
+        filtered, next_key = split_page(
+            find_user_appointments(
+                st.session_state.user_id,
+                None if selected_status == "All" else selected_status,
+                *bounds, order, descending, after, page_size + 1
+            ),
+            page_size,
+            lambda appointment: repository.appointment_key(appointment, order),
+        )
         
         # Display filtered appointments
-        if filtered_df.empty:
+        if not filtered:
             st.info("No appointments match your filters.")
         else:
-            st.markdown(f"<h3>Your Appointments ({len(filtered_df)} found)</h3>", unsafe_allow_html=True)
-            for _, appointment in filtered_df.iterrows():
-                status_str = str(appointment['status']) if appointment['status'] is not None else "unknown"
-                status_color = "green" if status_str == 'booked' else "red"
-                status_badge = f"<span style='color: {status_color}; font-weight: bold;'>{status_str.upper()}</span>"
-                st.markdown(f"""
-                <div class="appointment-card">
-                    <div style="display: flex; justify-content: space-between; align-items: center;">
-                        <div>
-                            <h4>{appointment['service']}</h4>
-                            <p><strong>Date:</strong> {appointment['date']}</p>
-                            <p><strong>Time:</strong> {appointment['time']}</p>
-                        </div>
-                        <div style="text-align: right;">
-                            {status_badge}
-                        </div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Add cancel button functionality below the card (Streamlit native button)
-                if status_str == 'booked':
-                    if st.button("Cancel Appointment", key=f"cancel_{appointment['id']}"):
-                        cancel_appointment(appointment['id'])
-                        st.success("Appointment cancelled successfully!")
-                        # Deduct loyalty points for cancellation
-                        update_loyalty_points(st.session_state.user_id, -5)
-                        st.rerun()
+            st.markdown("<h3>Your Appointments</h3>", unsafe_allow_html=True)
+            st.markdown(cards.appointment_cards(filtered), unsafe_allow_html=True)
+            
+            # One set of controls for the booking picked here, instead of buttons under every card
+            booked = [appointment for appointment in filtered if appointment.status == 'booked']
+            if booked:
+                appointment = st.selectbox(
+                    "Manage appointment",
+                    booked,
+                    format_func=lambda a: f"{a.service} · {a.date} at {a.time}",
+                    key="manage_appointment",
+                )
+                if st.button("Cancel Appointment", key=f"cancel_{appointment.id}"):
+                    # Loyalty points are deducted in the same transaction
+                    cancel_appointment(appointment.id)
+                    st.success("Appointment cancelled successfully!")
+                    st.rerun()
+                if str(appointment.date) >= today.strftime('%Y-%m-%d'):
+                    show_reschedule_form(appointment, appointment.duration or durations.get(appointment.service))
+            page_controls("appointments", next_key)
 
 def show_gallery():
     st.markdown("<h2>📸 Salon Gallery</h2>", unsafe_allow_html=True)
@@ -2305,13 +2447,11 @@ def show_contact_page():
 def show_admin_panel():
     st.markdown("<h2>🔧 Admin Panel</h2>", unsafe_allow_html=True)
     
-    admin_tabs = st.tabs(["Service Management", "Image Management", "Analytics", "User Management"])
+    admin_tabs = st.tabs(["Service Management", "Image Management", "Analytics", "User Management", "Day View", "Stylists", "Query Stats"])
     
     with admin_tabs[0]:
         st.markdown("<h3>Service Management</h3>", unsafe_allow_html=True)
         
-        services_df = get_services()
-        
         st.markdown("<h4>Add New Service</h4>", unsafe_allow_html=True)
         with st.form("add_service"):
             col1, col2 = st.columns(2)
@@ -2327,30 +2467,31 @@ def show_admin_panel():
             submitted = st.form_submit_button("Add Service")
             if submitted:
                 if name and price > 0 and duration > 0:
-                    conn = sqlite3.connect('salon.db')
-                    c = conn.cursor()
+                    added = False
                     try:
-                        c.execute(
-                            "INSERT INTO services (name, price, duration, description, category) VALUES (?, ?, ?, ?, ?)",
-                            (name, price, duration, description, category),
-                        )
-                        conn.commit()
-                        st.success(f"✅ Service '{name}' added successfully!")
-                        st.rerun()
+                        run_write(repository.add_service, name, price, duration, description, category)
+                        added = True
                     except Exception as e:
                         st.error(f"❌ Error adding service: {e}")
-                    finally:
-                        conn.close()
+                    if added:
+                        st.success(f"✅ Service '{name}' added successfully!")
+                        st.rerun()
                 else:
                     st.error("❌ Please fill in all required fields")
         
         st.markdown("<h4>Existing Services</h4>", unsafe_allow_html=True)
-        if not services_df.empty:
-            for _, service in services_df.iterrows():
+        page_size, after = page_position("admin_services")
+        with get_db_connection() as conn:
+            page = repository.get_services_page(conn, after, page_size + 1) if conn else []
+        services_page, next_key = split_page(page, page_size, lambda service: (service.category, service.name, service.id))
+        if services_page:
+            for service in (record.as_dict() for record in services_page):
                 with st.expander(f"{service['name']} - ₹{service['price']:.2f}"):
                     st.markdown(f"**Category:** {service['category']}")
                     st.markdown(f"**Duration:** {service['duration']} minutes")
                     st.markdown(f"**Description:** {service['description']}")
+                    st.markdown("**Instant-book link** (books once per client):")
+                    st.code(instant_book_link(str(service['name'])), language=None)
                     
                     with st.form(f"edit_service_{service['id']}"):
                         col1, col2 = st.columns(2)
@@ -2397,37 +2538,30 @@ def show_admin_panel():
                             delete_submitted = st.form_submit_button("Delete Service", type="primary")
                         
                         if update_submitted:
-                            conn = sqlite3.connect('salon.db')
-                            c = conn.cursor()
+                            updated = False
                             try:
-                                c.execute(
-                                    """
-                                    UPDATE services
-                                    SET name = ?, price = ?, duration = ?, description = ?, category = ?
-                                    WHERE id = ?
-                                    """,
-                                    (new_name, new_price, new_duration, new_description, new_category, service['id']),
+                                run_write(
+                                    repository.update_service, int(service['id']),
+                                    new_name, new_price, new_duration, new_description, new_category,
                                 )
-                                conn.commit()
-                                st.success(f"✅ Service '{new_name}' updated successfully!")
-                                st.rerun()
+                                updated = True
                             except Exception as e:
                                 st.error(f"❌ Error updating service: {e}")
-                            finally:
-                                conn.close()
+                            if updated:
+                                st.success(f"✅ Service '{new_name}' updated successfully!")
+                                st.rerun()
                         
                         if delete_submitted:
-                            conn = sqlite3.connect('salon.db')
-                            c = conn.cursor()
+                            deleted = False
                             try:
-                                c.execute("DELETE FROM services WHERE id = ?", (service['id'],))
-                                conn.commit()
-                                st.success(f"✅ Service '{service['name']}' deleted successfully!")
-                                st.rerun()
+                                run_write(repository.delete_service, int(service['id']))
+                                deleted = True
                             except Exception as e:
                                 st.error(f"❌ Error deleting service: {e}")
-                            finally:
-                                conn.close()
+                            if deleted:
+                                st.success(f"✅ Service '{service['name']}' deleted successfully!")
+                                st.rerun()
+            page_controls("admin_services", next_key)
         else:
             st.info("No services found. Add your first service above!")
     
@@ -2482,23 +2616,42 @@ def show_admin_panel():
     with admin_tabs[2]:
         st.markdown("<h3>Analytics Dashboard</h3>", unsafe_allow_html=True)
         
-        conn = sqlite3.connect('salon.db')
-        try:
-            appointments_df = pd.read_sql_query(
+        # Reports read each branch's snapshot so they never hold read locks on the live files
+        router = get_router()
+        snapshot = router.snapshot(st.session_state.branch_id)
+        snapshot_age = snapshot.age()
+        refresh_col, age_col = st.columns([1, 3])
+        with refresh_col:
+            if st.button("Refresh Report Data"):
+                for branch_id in router.branches:
+                    router.snapshot(branch_id).refresh()
+                snapshot_age = 0
+        with age_col:
+            if snapshot_age is not None:
+                st.caption(f"Report data is {int(snapshot_age // 60)} min old (refreshes every {snapshot.max_age // 60} min).")
+        
+        # Scatter the report query to every branch snapshot and gather the results
+        # Each snapshot keeps its own cache, reloaded when a refresh brings in changes
+        def load_branch_appointments(branch, conn):
+            df = get_query_cache(snapshot_path(branch.db_path)).read_sql(
+                conn, ('appointments', 'services', 'users'),
                 """
                 SELECT a.*, s.name as service_name, s.price, u.name as user_name, s.category
                 FROM appointments a
-                JOIN services s ON a.service = s.name
+                JOIN services s ON a.service_id = s.id
                 JOIN users u ON a.user_id = u.id
                 ORDER BY a.date, a.time
                 """,
-                conn,
             )
+            df['branch'] = branch.name
+            return df
+        
+        try:
+            branch_frames = router.scatter_gather(load_branch_appointments, snapshot=True)
+            appointments_df = pd.concat(branch_frames.values(), ignore_index=True)
         except Exception as e:
             appointments_df = pd.DataFrame()
             st.warning(f"Could not load appointment data: {str(e)}")
-        finally:
-            conn.close()
         
         if not appointments_df.empty:
             try:
@@ -2520,54 +2673,157 @@ def show_admin_panel():
                 st.metric("Total Appointments", total_appointments)
             with col2:
                 st.metric("Total Revenue", f"₹{total_revenue:.2f}")
+            
+            if appointments_df['branch'].nunique() > 1:
+                st.markdown("<h4>By Branch</h4>", unsafe_allow_html=True)
+                branch_summary = appointments_df.groupby('branch').agg(
+                    appointments=('id', 'count'),
+                    revenue=('price', 'sum'),
+                )
+                st.dataframe(branch_summary)
         else:
             st.info("No appointment data available yet.")
     
     with admin_tabs[3]:
         st.markdown("<h3>User Management</h3>", unsafe_allow_html=True)
         
-        conn = sqlite3.connect('salon.db')
+        search_term = st.text_input("Search users by name or phone")
+        page_size, before = page_position("admin_users", search_term)
+        users = []
         try:
-            users_df = pd.read_sql_query("SELECT * FROM users ORDER BY created_at DESC", conn)
+            # Newest first, one page at a time by (created_at, id)
+            with get_router().snapshot(st.session_state.branch_id).connection() as conn:
+                users = repository.get_users_page(conn, search_term, before, page_size + 1)
         except Exception as e:
-            users_df = pd.DataFrame()
             st.warning(f"Could not load users: {str(e)}")
-        finally:
-            conn.close()
+        users, next_key = split_page(users, page_size, lambda user: (user.created_at, user.id))
         
-        if not users_df.empty:
-            st.dataframe(users_df[['id', 'name', 'phone', 'loyalty_points', 'created_at']])
-            
-            search_term = st.text_input("Search users by name or phone")
-            if search_term:
-                filtered_users = users_df[
-                    users_df['name'].str.contains(search_term, case=False)
-                    | users_df['phone'].str.contains(search_term, case=False)
-                ]
-                st.dataframe(filtered_users[['id', 'name', 'phone', 'loyalty_points', 'created_at']])
+        if users:
+            st.dataframe(pd.DataFrame([user.as_dict() for user in users]), hide_index=True)
+            page_controls("admin_users", next_key)
         else:
             st.info("No users found.")
     
+    with admin_tabs[4]:
+        st.markdown("<h3>Day View</h3>", unsafe_allow_html=True)
+        st.caption("Bookings overlapping a time window, read live from the branch database.")
+        
+        rules = get_availability_engine().rules
+        boundaries = [rules.slot_time(i) for i in range(rules.slots_per_day + 1)]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            view_date = st.date_input("Date", value=datetime.today().date(), key="day_view_date")
+        with col2:
+            window_start = st.selectbox("From", boundaries[:-1], key="day_view_from")
+        with col3:
+            window_end = st.selectbox("To", boundaries[1:], index=len(boundaries) - 2, key="day_view_to")
+        
+        if window_end <= window_start:
+            st.warning("Pick an end time after the start time.")
+        else:
+            overlapping = get_interval_index().overlapping(view_date.strftime("%Y-%m-%d"), window_start, window_end)
+            if overlapping:
+                st.metric("Bookings in window", len(overlapping))
+                st.dataframe(pd.DataFrame([
+                    {
+                        'start': booking.start_time,
+                        'end': booking.end_time,
+                        'service': booking.service,
+                        'client': booking.user_name,
+                        'stylist': booking.stylist or "unassigned",
+                    }
+                    for booking in overlapping
+                ]), hide_index=True, use_container_width=True)
+            else:
+                st.info("No bookings in this window.")
+    
+    with admin_tabs[5]:
+        st.markdown("<h3>Stylists</h3>", unsafe_allow_html=True)
+        st.caption("New bookings go to a free stylist skilled in the service's category, packed to leave the fewest idle gaps.")
+        
+        with get_db_connection() as conn:
+            team = stylists.get_stylists(conn) if conn else []
+        for stylist in team:
+            stylist_cols = st.columns([2, 3, 1])
+            with stylist_cols[0]:
+                st.markdown(f"**{stylist.name}**")
+            with stylist_cols[1]:
+                st.markdown(", ".join(sorted(stylist.skills)) or "No skills yet")
+            with stylist_cols[2]:
+                if st.button("Deactivate", key=f"deactivate_stylist_{stylist.id}"):
+                    run_write(stylists.deactivate_stylist, stylist.id)
+                    st.rerun()
+        
+        services_df = get_services(st.session_state.branch_id)
+        categories = sorted(services_df['category'].dropna().unique()) if not services_df.empty else []
+        with st.form("add_stylist_form"):
+            st.markdown("<h4>Add Stylist</h4>", unsafe_allow_html=True)
+            stylist_name = st.text_input("Name")
+            stylist_skills = st.multiselect("Skills", categories)
+            if st.form_submit_button("Add Stylist"):
+                if stylist_name and stylist_skills:
+                    run_write(stylists.add_stylist, stylist_name, stylist_skills)
+                    st.success(f"✅ {stylist_name} added!")
+                    st.rerun()
+                else:
+                    st.error("Please enter a name and at least one skill.")
+        
+        st.markdown("<h4>Reassign a Day</h4>", unsafe_allow_html=True)
+        reassign_date = st.date_input("Date", value=datetime.today().date(), key="reassign_date")
+        if st.button("Reassign Stylists"):
+            date_str = reassign_date.strftime("%Y-%m-%d")
+            assigned, unassigned = run_write(stylists.assign_day, get_availability_engine().rules, date_str)
+            get_interval_index().invalidate(date_str)
+            st.success(f"✅ {assigned} bookings assigned, {unassigned} without a free stylist.")
+    
+    with admin_tabs[6]:
+        st.markdown("<h3>Query Performance</h3>", unsafe_allow_html=True)
+        st.caption(
+            f"Timings since the server started, per calling function. "
+            f"Statements slower than {query_stats.SLOW_QUERY_MS:g} ms are logged to {query_stats.SLOW_QUERY_LOG}."
+        )
+        
+        if st.button("Reset Query Stats"):
+            query_stats.reset_stats()
+        
+        stats = query_stats.get_stats()
+        if stats:
+            stats_df = pd.DataFrame(stats)
+            st.dataframe(
+                stats_df[['function', 'calls', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'query']].round(3),
+                use_container_width=True,
+            )
+        else:
+            st.info("No queries recorded yet.")
+        
+        st.markdown("<h4>Recent Slow Queries</h4>", unsafe_allow_html=True)
+        slow_queries = query_stats.read_slow_log(limit=20)
+        if slow_queries:
+            for entry in slow_queries:
+                with st.expander(f"{entry['ts']} · {entry['function']} · {entry['ms']} ms"):
+                    st.code(entry['query'], language="sql")
+                    st.markdown("**Query plan:**")
+                    st.code("\n".join(entry['plan']) or "(no plan)")
+        else:
+            st.info("No slow queries logged.")
+    
 def logout():
     st.session_state.logged_in = False
     st.session_state.user_name = ""
     st.session_state.phone_number = ""
     st.session_state.user_id = None
     st.session_state.loyalty_points = 0
+    st.session_state.profile = None
     st.rerun()
 
 def get_user_booking_history(user_id):
     """Get user's booking history"""
-    conn = sqlite3.connect('salon.db')
-    df = pd.read_sql_query("""
-        SELECT a.service, a.date, s.category
-        FROM appointments a
-        JOIN services s ON a.service = s.name
-        WHERE a.user_id = ? AND a.status = 'booked'
-        ORDER BY a.date DESC
-    """, conn, params=[str(user_id)])
-    conn.close()
-    return df
+    with get_db_connection() as conn:
+        return repository.get_booking_history(conn, user_id)
+
+def get_popular_services():
+    """Get the most booked services"""
+    return cached_query(('appointments', 'services'), repository.get_popular_services)
 
 def get_service_recommendations(user_id):
     """Get service recommendations based on user's booking history"""
@@ -2575,92 +2831,35 @@ def get_service_recommendations(user_id):
         # Get user's booking history
         booking_history = get_user_booking_history(user_id)
         
-        if booking_history.empty:
+        if not booking_history:
             # If no booking history, return popular services
-            conn = sqlite3.connect('salon.db')
-            popular_services = pd.read_sql_query("""
-                SELECT s.name, s.category, s.price, s.description
-                FROM services s
-                LEFT JOIN appointments a ON s.name = a.service
-                GROUP BY s.id
-                ORDER BY COUNT(a.service) DESC
-                LIMIT 5
-            """, conn)
-            conn.close()
-            return popular_services if popular_services is not None else pd.DataFrame()
+            return get_popular_services()
         
         # Get user's favorite categories
-        category_counts = booking_history['category'].value_counts()
-        favorite_categories = category_counts.head(2).index.tolist()
-        
-        # If no favorite categories, return popular services
-        if not favorite_categories:
-            conn = sqlite3.connect('salon.db')
-            popular_services = pd.read_sql_query("""
-                SELECT s.name, s.category, s.price, s.description
-                FROM services s
-                LEFT JOIN appointments a ON s.name = a.service
-                GROUP BY s.id
-                ORDER BY COUNT(a.service) DESC
-                LIMIT 5
-            """, conn)
-            conn.close()
-            return popular_services if popular_services is not None else pd.DataFrame()
+        category_counts = Counter(entry.category for entry in booking_history)
+        favorite_categories = [category for category, _ in category_counts.most_common(2)]
         
         # Get services from favorite categories that user hasn't booked recently
-        conn = sqlite3.connect('salon.db')
-        # Create placeholders for the IN clause
-        placeholders = ','.join('?' * len(favorite_categories))
-        query = f"""
-            SELECT s.name, s.category, s.price, s.description
-            FROM services s
-            WHERE s.category IN ({placeholders})
-            AND s.name NOT IN (
-                SELECT service 
-                FROM appointments 
-                WHERE user_id = ? AND date > date('now', '-30 days')
-            )
-            ORDER BY RANDOM()
-            LIMIT 5
-        """
-        # Convert all parameters to strings
-        params = [str(cat) for cat in favorite_categories] + [str(user_id)]
-        recommended_services = pd.read_sql_query(query, conn, params=params)
-        conn.close()
+        # The cutoff date is part of the cache key, so the cached pick changes daily
+        since = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        recommended_services = cached_query(
+            ('appointments', 'services'), repository.get_recommended_services,
+            tuple(favorite_categories), user_id, 5, since,
+        )
         
         # If we got recommendations, return them
-        if recommended_services is not None and len(recommended_services) > 0:
+        if recommended_services:
             return recommended_services
         
         # Otherwise, return popular services
-        conn = sqlite3.connect('salon.db')
-        popular_services = pd.read_sql_query("""
-            SELECT s.name, s.category, s.price, s.description
-            FROM services s
-            LEFT JOIN appointments a ON s.name = a.service
-            GROUP BY s.id
-            ORDER BY COUNT(a.service) DESC
-            LIMIT 5
-        """, conn)
-        conn.close()
-        return popular_services if popular_services is not None else pd.DataFrame()
+        return get_popular_services()
         
     except Exception as e:
         # If any error occurs, return popular services as fallback
         try:
-            conn = sqlite3.connect('salon.db')
-            popular_services = pd.read_sql_query("""
-                SELECT s.name, s.category, s.price, s.description
-                FROM services s
-                LEFT JOIN appointments a ON s.name = a.service
-                GROUP BY s.id
-                ORDER BY COUNT(a.service) DESC
-                LIMIT 5
-            """, conn)
-            conn.close()
-            return popular_services if popular_services is not None else pd.DataFrame()
+            return get_popular_services()
         except:
-            return pd.DataFrame()
+            return []
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,570 @@
+"""
+Capacity-aware slot availability for the booking page.
+
+The day is split into fixed slots (30 minutes by default) between
+opening and closing time. Each booking occupies as many consecutive
+slots as its service's duration needs, and a slot is full once as many
+bookings overlap it as the salon has chairs. Every day keeps a bitmap of
+full slots, so checking whether a service fits at a given start is a
+shift and a mask: O(1) regardless of how many bookings the day holds.
+
+Per-slot counts are materialized in the occupancy table, which the
+booking and cancellation intents update in the same transaction as the
+appointment itself. Loading a range of days is then one primary-key
+range read, however much history the appointments table holds.
+
+Intents that free slots (cancel, reschedule) then call every function
+in RELEASE_HOOKS inside the same transaction; the waitlist registers
+there to backfill freed chairs. Likewise every new or moved booking goes
+through BOOKING_HOOKS, where stylist assignment registers.
+"""
+
+import json
+import os
+import sys
+import threading
+import time as time_module
+from datetime import datetime, timedelta
+
+from database import DB_PATH, PerDatabase, get_pool, ensure_db_ready
+import repository
+
+# Outcomes of book_if_available and reschedule_if_available
+BOOKED = 'booked'
+DUPLICATE = 'duplicate'
+FULL = 'full'
+# The requested start has already gone by
+PAST = 'past'
+NOT_BOOKED = 'not_booked'
+
+# Duration assumed for appointments whose service has since been deleted
+DEFAULT_DURATION = 30
+
+# Days open for booking, today included
+BOOKING_WINDOW_DAYS = 15
+
+# Loyalty points awarded for a booking and deducted for a cancellation
+BOOKING_POINTS = 10
+CANCELLATION_POINTS = -5
+
+# Called as hook(conn, rules, date, start_slot, length, points) after slots are freed
+RELEASE_HOOKS = []
+# Called as hook(conn, rules, appointment_id) after a booking is made or moved
+BOOKING_HOOKS = []
+
+class BookingRules:
+    """Opening hours, slot size and chair capacity (the "booking" block of config.json)"""
+    __slots__ = ('open_minute', 'close_minute', 'slot_minutes', 'chairs', 'closed_weekdays')
+
+    def __init__(self, open_time="09:00", close_time="19:00", slot_minutes=30, chairs=3, closed_weekdays=()):
+        self.open_minute = to_minutes(open_time)
+        self.close_minute = to_minutes(close_time)
+        self.slot_minutes = slot_minutes
+        self.chairs = chairs
+        self.closed_weekdays = frozenset(closed_weekdays)
+
+    @classmethod
+    def from_config(cls, config_path='config.json'):
+        try:
+            with open(config_path, 'r') as f:
+                booking = json.load(f).get('booking', {})
+        except (OSError, ValueError) as e:
+            print(f"Booking config warning: {e}")
+            booking = {}
+        return cls(
+            open_time=booking.get('open', "09:00"),
+            close_time=booking.get('close', "19:00"),
+            slot_minutes=booking.get('slot_minutes', 30),
+            chairs=booking.get('chairs', 3),
+            closed_weekdays=booking.get('closed_weekdays', ()),
+        )
+
+    @property
+    def slots_per_day(self):
+        return (self.close_minute - self.open_minute) // self.slot_minutes
+
+    def slot_index(self, time_str):
+        """Slot a "HH:MM" start time falls in, or None outside opening hours"""
+        try:
+            minute = to_minutes(time_str)
+        except ValueError:
+            return None
+        if not self.open_minute <= minute < self.close_minute:
+            return None
+        return (minute - self.open_minute) // self.slot_minutes
+
+    def slot_time(self, index):
+        minute = self.open_minute + index * self.slot_minutes
+        return f"{minute // 60:02d}:{minute % 60:02d}"
+
+    def slots_for(self, duration):
+        """Number of slots a service of this many minutes occupies"""
+        duration = duration or DEFAULT_DURATION
+        return max(1, -(-int(duration) // self.slot_minutes))
+
+    def is_closed(self, date_str):
+        return datetime.strptime(date_str, "%Y-%m-%d").weekday() in self.closed_weekdays
+
+def to_minutes(time_str):
+    hour, minute = str(time_str).split(":")[:2]
+    return int(hour) * 60 + int(minute)
+
+class DayOccupancy:
+    """Booked count per slot plus a bitmap of the slots at capacity"""
+    __slots__ = ('date', 'counts', 'full_mask')
+
+    def __init__(self, date, slots):
+        self.date = date
+        self.counts = [0] * slots
+        self.full_mask = 0
+
+    def set_count(self, slot, count, capacity):
+        if 0 <= slot < len(self.counts):
+            self.counts[slot] = count
+            if count >= capacity:
+                self.full_mask |= 1 << slot
+
+    def occupy(self, start, length, capacity):
+        """Count one more booking over [start, start + length) in memory"""
+        for slot in range(start, min(start + length, len(self.counts))):
+            self.set_count(slot, self.counts[slot] + 1, capacity)
+
+    def without(self, start, length, capacity):
+        """A copy with one booking over [start, start + length) taken out, e.g. the one being moved"""
+        day = DayOccupancy(self.date, len(self.counts))
+        day.counts = list(self.counts)
+        day.full_mask = self.full_mask
+        for slot in range(max(start, 0), min(start + length, len(day.counts))):
+            # Closed days and overbooked slots stay full
+            if day.counts[slot] == capacity:
+                day.full_mask &= ~(1 << slot)
+            day.counts[slot] = max(day.counts[slot] - 1, 0)
+        return day
+
+    def close(self):
+        """Mark the whole day full (salon closed)"""
+        self.full_mask = (1 << len(self.counts)) - 1
+
+    def fits(self, start, length):
+        """O(1): are the slots [start, start + length) all below capacity?"""
+        if start < 0 or start + length > len(self.counts):
+            return False
+        return (self.full_mask >> start) & ((1 << length) - 1) == 0
+
+    def free_start_mask(self, length):
+        """Bitmap of every start slot where a service of this length fits"""
+        blocked = self.full_mask
+        for shift in range(1, length):
+            blocked |= self.full_mask >> shift
+        last_start = len(self.counts) - length
+        if last_start < 0:
+            return 0
+        return ~blocked & ((1 << (last_start + 1)) - 1)
+
+OCCUPANCY_WINDOW_SQL = "SELECT date, slot, booked_count FROM occupancy WHERE date BETWEEN ? AND ?"
+
+ADJUST_OCCUPANCY_SQL = """
+    INSERT INTO occupancy (date, slot, booked_count) VALUES (?, ?, ?)
+    ON CONFLICT (date, slot) DO UPDATE SET booked_count = booked_count + excluded.booked_count
+"""
+
+BOOKED_SPANS_SQL = """
+    SELECT a.date, a.time, COALESCE(a.duration, s.duration)
+    FROM appointments a
+    LEFT JOIN services s ON s.id = a.service_id
+    WHERE a.status = 'booked'
+"""
+
+APPOINTMENT_SPAN_SQL = """
+    SELECT a.date, a.time, COALESCE(a.duration, s.duration), a.status
+    FROM appointments a
+    LEFT JOIN services s ON s.id = a.service_id
+    WHERE a.id = ?
+"""
+
+def _span(rules, start, length):
+    return range(start, min(start + length, rules.slots_per_day))
+
+def adjust_occupancy(conn, rules, date, start, length, delta):
+    """Add delta to every slot a booking covers (call inside the booking's transaction)"""
+    conn.executemany(ADJUST_OCCUPANCY_SQL, [(date, slot, delta) for slot in _span(rules, start, length)])
+
+def rebuild_occupancy(conn, rules):
+    """Recompute the whole occupancy table from booked appointments.
+
+    This is the repair path, and it is also needed after changing opening
+    hours or slot length. Each booking keeps the duration it was made
+    with, so editing a service does not resize existing bookings. It
+    runs inside the caller's transaction and returns the number of
+    occupied (date, slot) rows.
+    """
+    counts = {}
+    for date, time, duration in conn.execute(BOOKED_SPANS_SQL):
+        start = rules.slot_index(time)
+        if start is None:
+            continue
+        for slot in _span(rules, start, rules.slots_for(duration)):
+            counts[(date, slot)] = counts.get((date, slot), 0) + 1
+    conn.execute("DELETE FROM occupancy")
+    conn.executemany(
+        "INSERT INTO occupancy (date, slot, booked_count) VALUES (?, ?, ?)",
+        [(date, slot, count) for (date, slot), count in counts.items()],
+    )
+    return len(counts)
+
+def _empty_day(rules, date_str):
+    day = DayOccupancy(date_str, rules.slots_per_day)
+    if rules.is_closed(date_str):
+        day.close()
+    return day
+
+def _fill(days, rows, capacity):
+    for date_str, slot, booked_count in rows:
+        if date_str in days:
+            days[date_str].set_count(slot, booked_count, capacity)
+    return days
+
+def load_days(conn, rules, first_date, last_date):
+    """Occupancy for every date in [first_date, last_date] from one range read"""
+    days = {}
+    current = datetime.strptime(first_date, "%Y-%m-%d")
+    end = datetime.strptime(last_date, "%Y-%m-%d")
+    while current <= end:
+        date_str = current.strftime("%Y-%m-%d")
+        days[date_str] = _empty_day(rules, date_str)
+        current += timedelta(days=1)
+    return _fill(days, conn.execute(OCCUPANCY_WINDOW_SQL, (first_date, last_date)), rules.chairs)
+
+def load_dates(conn, rules, dates):
+    """Occupancy for scattered dates (a recurring series) without the days in between"""
+    days = {date_str: _empty_day(rules, date_str) for date_str in dates}
+    rows = conn.execute(
+        f"SELECT date, slot, booked_count FROM occupancy WHERE date IN ({', '.join('?' * len(days))})",
+        list(days),
+    )
+    return _fill(days, rows, rules.chairs)
+
+def service_duration(conn, service):
+    row = conn.execute(
+        "SELECT duration FROM services WHERE name = ? ORDER BY id LIMIT 1", (service,)
+    ).fetchone()
+    return row[0] if row else DEFAULT_DURATION
+
+def booked_appointment_id(conn, user_id, service, date, time):
+    row = conn.execute("""
+        SELECT id FROM appointments
+        WHERE user_id = ? AND service = ? AND date = ? AND time = ? AND status = 'booked'
+    """, (user_id, service, date, time)).fetchone()
+    return row[0] if row else None
+
+def _run_booking_hooks(conn, rules, appointment_id):
+    for hook in BOOKING_HOOKS:
+        hook(conn, rules, appointment_id)
+
+def has_started(rules, date_str, start, now):
+    """Is a start slot on date_str already past at `now`? Matches first_bookable_slot"""
+    today = now.strftime("%Y-%m-%d")
+    return date_str < today or (date_str == today and start < first_bookable_slot(rules, date_str, now))
+
+def book_if_available(conn, rules, user_id, service, date, time, points=0, now=None):
+    """Write intent: book only if the slot still has room for the service's duration.
+
+    Occupancy is re-read inside the writer's transaction, so two sessions
+    racing for the last chair cannot both get it. A start that has already
+    gone by at `now` (default: the current time) is PAST.
+    """
+    start = rules.slot_index(time)
+    if start is not None and has_started(rules, date, start, now or datetime.now()):
+        return PAST
+    length = rules.slots_for(service_duration(conn, service))
+    day = load_days(conn, rules, date, date)[date]
+    if start is None or not day.fits(start, length):
+        return DUPLICATE if booked_appointment_id(conn, user_id, service, date, time) else FULL
+    if repository.book_appointment(conn, user_id, service, date, time, points):
+        adjust_occupancy(conn, rules, date, start, length, 1)
+        if BOOKING_HOOKS:
+            _run_booking_hooks(conn, rules, booked_appointment_id(conn, user_id, service, date, time))
+        return BOOKED
+    return DUPLICATE
+
+def first_bookable_slot(rules, date_str, now):
+    """Earliest slot not already in the past on date_str"""
+    if date_str != now.strftime("%Y-%m-%d"):
+        return 0
+    minutes_now = now.hour * 60 + now.minute
+    return max(0, -(-(minutes_now - rules.open_minute) // rules.slot_minutes))
+
+def earliest_start(rules, days, length, now):
+    """Earliest (date, "HH:MM") across days where `length` slots fit, or None.
+
+    Each day costs a few mask operations: the lowest set bit of its
+    free-start bitmap is the earliest start, so no time is probed.
+    """
+    for day in days:
+        first = first_bookable_slot(rules, day.date, now)
+        mask = day.free_start_mask(length) >> first << first
+        if mask:
+            return day.date, rules.slot_time((mask & -mask).bit_length() - 1)
+    return None
+
+def book_next_available(conn, rules, user_id, service, now, points=0, days=BOOKING_WINDOW_DAYS):
+    """Write intent: book the earliest slot the service fits in; returns [outcome, date, time].
+
+    The slot is found from occupancy read inside the transaction, so the
+    booking cannot lose a race to the slot it was offered. date and time
+    are None when the whole window is full.
+    """
+    first = now.strftime("%Y-%m-%d")
+    last = (now + timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    length = rules.slots_for(service_duration(conn, service))
+    slot = earliest_start(rules, load_days(conn, rules, first, last).values(), length, now)
+    if slot is None:
+        return [FULL, None, None]
+    return [book_if_available(conn, rules, user_id, service, *slot, points, now), *slot]
+
+def book_many_if_available(conn, rules, user_id, bookings, points=0, now=None):
+    """Write intent: book a series of (service, date, time) entries all or nothing.
+
+    Every entry is checked against one read of occupancy, counting
+    the earlier entries of the same series, and the series is inserted
+    with one executemany. Returns the entries that could not be placed,
+    including any that start before `now`; when that list is empty
+    everything was booked and `points` per booking were awarded in a
+    single update.
+    """
+    bookings = [tuple(booking) for booking in bookings]
+    if not bookings:
+        return []
+    names = sorted({service for service, _, _ in bookings})
+    # Newest first, so a duplicated name ends up on its oldest id like book_appointment
+    services = {}
+    for service_id, name, duration in conn.execute(
+        f"SELECT id, name, duration FROM services WHERE name IN ({', '.join('?' * len(names))}) ORDER BY id DESC",
+        names,
+    ):
+        services[name] = (service_id, duration)
+
+    dates = sorted({date for _, date, _ in bookings})
+    days = load_dates(conn, rules, dates)
+    taken = {tuple(row) for row in conn.execute("""
+        SELECT service, date, time FROM appointments
+        WHERE user_id = ? AND date BETWEEN ? AND ? AND status = 'booked'
+    """, (user_id, dates[0], dates[-1]))}
+
+    now = now or datetime.now()
+    unavailable = []
+    placed = []
+    for service, date, time in bookings:
+        service_id, duration = services.get(service, (None, DEFAULT_DURATION))
+        start = rules.slot_index(time)
+        length = rules.slots_for(duration)
+        if (start is None or has_started(rules, date, start, now) or (service, date, time) in taken
+                or not days[date].fits(start, length)):
+            unavailable.append((service, date, time))
+            continue
+        days[date].occupy(start, length, rules.chairs)
+        taken.add((service, date, time))
+        placed.append((service_id, service, date, time, start, length))
+    if unavailable:
+        return unavailable
+
+    repository.book_appointments(
+        conn, user_id, [(service_id, service, date, time) for service_id, service, date, time, _, _ in placed],
+        points * len(placed),
+    )
+    deltas = {}
+    for _, _, date, _, start, length in placed:
+        for slot in _span(rules, start, length):
+            deltas[(date, slot)] = deltas.get((date, slot), 0) + 1
+    conn.executemany(ADJUST_OCCUPANCY_SQL, [(date, slot, delta) for (date, slot), delta in deltas.items()])
+    if BOOKING_HOOKS:
+        for _, service, date, time, _, _ in placed:
+            _run_booking_hooks(conn, rules, booked_appointment_id(conn, user_id, service, date, time))
+    return []
+
+def _run_release_hooks(conn, rules, date, start, length, promotion_points):
+    for hook in RELEASE_HOOKS:
+        hook(conn, rules, date, start, length, promotion_points)
+
+def cancel_and_release(conn, rules, appointment_id, points=0, promotion_points=0):
+    """Write intent: cancel a booking and free its slots in the same transaction.
+
+    Release hooks may hand the freed slots to someone else; anyone they
+    book earns promotion_points.
+    """
+    span = conn.execute(APPOINTMENT_SPAN_SQL, (appointment_id,)).fetchone()
+    if span is None or not repository.cancel_appointment(conn, appointment_id, points):
+        return False
+    date, time, duration, _ = span
+    start = rules.slot_index(time)
+    if start is not None:
+        length = rules.slots_for(duration)
+        adjust_occupancy(conn, rules, date, start, length, -1)
+        _run_release_hooks(conn, rules, date, start, length, promotion_points)
+    return True
+
+def reschedule_if_available(conn, rules, appointment_id, date, time, promotion_points=0, now=None):
+    """Write intent: move a booking if its new time has room for the whole service.
+
+    The old slots are released before the check, so a booking can shift
+    into slots it already holds; they are taken back if the move fails.
+    A new start that has already gone by is PAST.
+    """
+    span = conn.execute(APPOINTMENT_SPAN_SQL, (appointment_id,)).fetchone()
+    if span is None or span[3] != 'booked':
+        return NOT_BOOKED
+    old_date, old_time, duration, _ = span
+    length = rules.slots_for(duration)
+    old_start = rules.slot_index(old_time)
+    start = rules.slot_index(time)
+    if start is not None and has_started(rules, date, start, now or datetime.now()):
+        return PAST
+
+    def hold_old_slots(delta):
+        if old_start is not None:
+            adjust_occupancy(conn, rules, old_date, old_start, length, delta)
+
+    hold_old_slots(-1)
+    if start is None or not load_days(conn, rules, date, date)[date].fits(start, length):
+        hold_old_slots(1)
+        return FULL
+    if not repository.reschedule_appointment(conn, appointment_id, date, time):
+        hold_old_slots(1)
+        return DUPLICATE
+    adjust_occupancy(conn, rules, date, start, length, 1)
+    _run_booking_hooks(conn, rules, appointment_id)
+    if old_start is not None:
+        _run_release_hooks(conn, rules, old_date, old_start, length, promotion_points)
+    return BOOKED
+
+class DayCache:
+    """Per-day values loaded from one database, kept until invalidated or max_age seconds old.
+
+    load(conn, dates) returns {date: value} for the dates it is given;
+    missing dates are loaded together on one pooled connection. The app
+    invalidates the dates it writes to; max_age bounds how long a write
+    from another process can go unseen.
+    """
+
+    def __init__(self, db_path, load, max_age=60):
+        self.db_path = db_path
+        self.load = load
+        self.max_age = max_age
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def get(self, dates):
+        now = time_module.monotonic()
+        with self._lock:
+            entries = {d: self._days.get(d) for d in dates}
+        cached = {d: entry[1] for d, entry in entries.items() if entry is not None and now - entry[0] < self.max_age}
+        missing = [d for d in dates if d not in cached]
+        if missing:
+            with get_pool(self.db_path).connection() as conn:
+                loaded = self.load(conn, missing)
+            with self._lock:
+                for date_str, day in loaded.items():
+                    self._days[date_str] = (now, day)
+            cached.update(loaded)
+        return [cached[d] for d in dates]
+
+    def invalidate(self, date_str=None):
+        with self._lock:
+            if date_str is None:
+                self._days.clear()
+            else:
+                self._days.pop(date_str, None)
+
+class AvailabilityEngine:
+    """Per-database cache of day occupancy, invalidated by the app after each write"""
+
+    def __init__(self, db_path=DB_PATH, rules=None, max_age=60):
+        self.db_path = db_path
+        self.rules = rules or BookingRules()
+        self._days = DayCache(db_path, lambda conn, dates: load_dates(conn, self.rules, dates), max_age)
+
+    def window(self, first_date, days):
+        """Occupancy for `days` consecutive dates"""
+        start = datetime.strptime(first_date, "%Y-%m-%d")
+        return self.days([(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)])
+
+    def days(self, dates):
+        """Occupancy for the given dates, loading any missing ones in one query"""
+        return self._days.get(dates)
+
+    def day(self, date_str):
+        return self.window(date_str, 1)[0]
+
+    def is_free(self, date_str, time_str, duration):
+        start = self.rules.slot_index(time_str)
+        return start is not None and self.day(date_str).fits(start, self.rules.slots_for(duration))
+
+    def free_slots(self, date_str, duration, now=None, moving=None):
+        """Start times ("HH:MM") where a service of this duration fits, skipping past slots.
+
+        moving is the (date, time, duration) of a booking being rescheduled;
+        the slots it holds count as free, since the move releases them.
+        """
+        day = self.day(date_str)
+        if moving is not None and moving[0] == date_str:
+            start = self.rules.slot_index(moving[1])
+            if start is not None:
+                day = day.without(start, self.rules.slots_for(moving[2]), self.rules.chairs)
+        mask = day.free_start_mask(self.rules.slots_for(duration))
+        first = first_bookable_slot(self.rules, date_str, now or datetime.now())
+        return [self.rules.slot_time(i) for i in range(first, self.rules.slots_per_day) if mask >> i & 1]
+
+    def full_slots(self, date_str, duration, now=None):
+        """Start times where the service does not fit: what a client can join the waitlist for"""
+        if self.rules.is_closed(date_str):
+            return []
+        length = self.rules.slots_for(duration)
+        mask = self.day(date_str).free_start_mask(length)
+        first = first_bookable_slot(self.rules, date_str, now or datetime.now())
+        return [self.rules.slot_time(i) for i in range(first, self.rules.slots_per_day - length + 1) if not mask >> i & 1]
+
+    def next_available(self, duration, days=BOOKING_WINDOW_DAYS, now=None):
+        """Earliest (date, "HH:MM") in the next `days` days where the service fits, or None"""
+        now = now or datetime.now()
+        days = self.window(now.strftime("%Y-%m-%d"), days)
+        return earliest_start(self.rules, days, self.rules.slots_for(duration), now)
+
+    def invalidate(self, date_str=None):
+        self._days.invalidate(date_str)
+
+def load_rules(config_path=None):
+    """Booking rules from config.json next to this file"""
+    if config_path is None:
+        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+    return BookingRules.from_config(config_path)
+
+_engines = PerDatabase(lambda db_path, config_path: AvailabilityEngine(db_path, load_rules(config_path)))
+
+def get_availability(db_path=DB_PATH, config_path=None):
+    """Return the process-wide availability engine for a database file"""
+    return _engines.get(db_path, config_path)
+
+def main(argv):
+    """python availability.py rebuild [db_path]"""
+    if not argv or argv[0] != 'rebuild':
+        print("Usage: python availability.py rebuild [db_path]")
+        return 1
+    db_path = argv[1] if len(argv) > 1 else DB_PATH
+    ensure_db_ready(db_path)
+    with get_pool(db_path).connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rules = load_rules()
+            rows = rebuild_occupancy(conn, rules)
+            # Waiting entries are matched on slot numbers too
+            from waitlist import refresh_slots
+            refresh_slots(conn, rules)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    print(f"Rebuilt occupancy for {db_path}: {rows} occupied slots")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
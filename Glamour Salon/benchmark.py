@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the Glamour Salon data layer.
+Each benchmark runs against a throwaway database, never salon.db.
+
+Usage:
+    python benchmark.py            # run every benchmark
+    python benchmark.py init       # run a single benchmark
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import database
+import repository
+
+def timed(func, repeat):
+    """Return the mean duration of func() in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def report(label, before_ms, after_ms):
+    speedup = before_ms / after_ms if after_ms else float('inf')
+    print(f"  {label}")
+    print(f"    before: {before_ms:.4f} ms/call")
+    print(f"    after:  {after_ms:.4f} ms/call  ({speedup:.1f}x faster)")
+
+def bench_init(tmp, repeat=200):
+    """Schema cost paid by each Streamlit rerun: full init_db vs ensure_db_ready"""
+    db_path = os.path.join(tmp, 'init.db')
+    database.init_db(db_path)
+
+    before = timed(lambda: database.init_db(db_path), repeat)
+    after = timed(lambda: database.ensure_db_ready(db_path), repeat)
+    report("init per rerun", before, after)
+
+def seed_appointments(db_path, users=50, per_user=20):
+    """Fill a database with a realistic spread of appointments"""
+    database.init_db(db_path)
+    with database.get_pool(db_path).connection() as conn:
+        services = [row[0] for row in conn.execute("SELECT name FROM services")]
+        conn.executemany(
+            "INSERT INTO users (name, phone) VALUES (?, ?)",
+            [(f"Client {i}", f"9{i:09d}") for i in range(users)],
+        )
+        rows = []
+        for user_id in range(1, users + 1):
+            for n in range(per_user):
+                service = services[(user_id + n) % len(services)]
+                date = f"2030-{1 + n % 12:02d}-{1 + (user_id + n) % 28:02d}"
+                rows.append((user_id, service, service, date, f"{9 + n % 10:02d}:00"))
+        conn.executemany("""
+            INSERT INTO appointments (user_id, service, service_id, date, time)
+            VALUES (?, ?, (SELECT id FROM services WHERE name = ?), ?, ?)
+        """, rows)
+        conn.commit()
+
+def bench_reads(tmp, repeat=500):
+    """Small lookups: pd.read_sql_query + iterrows vs __slots__ records"""
+    import pandas as pd
+
+    db_path = os.path.join(tmp, 'reads.db')
+    seed_appointments(db_path)
+    pool = database.get_pool(db_path)
+
+    def appointments_dataframe():
+        with pool.connection() as conn:
+            df = pd.read_sql_query(repository.USER_APPOINTMENTS_SQL, conn, params=[7])
+        return [row['service'] for _, row in df.iterrows()]
+
+    def appointments_records():
+        with pool.connection() as conn:
+            records = repository.get_user_appointments(conn, 7)
+        return [record.service for record in records]
+
+    def user_dataframe():
+        with pool.connection() as conn:
+            df = pd.read_sql_query(repository.USER_BY_ID_SQL, conn, params=[7])
+        return df.iloc[0]['loyalty_points']
+
+    def user_record():
+        with pool.connection() as conn:
+            return repository.get_user(conn, 7).loyalty_points
+
+    report("get_user_appointments (20 rows)", timed(appointments_dataframe, repeat), timed(appointments_records, repeat))
+    report("get_user_details (1 row)", timed(user_dataframe, repeat), timed(user_record, repeat))
+
+def bench_writes(tmp, writes_per_session=50):
+    """Write latency as concurrent sessions grow: own-connection commits vs the writer queue"""
+    import sqlite3
+    import threading
+    from write_queue import WriteQueue
+
+    db_path = os.path.join(tmp, 'writes.db')
+    seed_appointments(db_path, users=20, per_user=1)
+    writer = WriteQueue(db_path)
+
+    def direct_write():
+        conn = sqlite3.connect(db_path, timeout=30)
+        repository.add_loyalty_points(conn, 1, 1)
+        conn.commit()
+        conn.close()
+
+    def queued_write():
+        writer.run(repository.add_loyalty_points, 1, 1)
+
+    def per_write_latency(write, sessions):
+        latencies = []
+        lock = threading.Lock()
+
+        def session():
+            for _ in range(writes_per_session):
+                start = time.perf_counter()
+                write()
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        threads = [threading.Thread(target=session) for _ in range(sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return sum(latencies) / len(latencies)
+
+    for sessions in (1, 4, 16):
+        report(
+            f"write latency, {sessions} concurrent sessions",
+            per_write_latency(direct_write, sessions),
+            per_write_latency(queued_write, sessions),
+        )
+    writer.stop()
+
+def bench_slots(tmp, repeat=50):
+    """Next free slot on a nearly full two weeks: probing each time vs the occupancy bitmaps"""
+    from datetime import datetime, timedelta
+    import availability
+
+    db_path = os.path.join(tmp, 'slots.db')
+    database.init_db(db_path)
+    rules = availability.BookingRules(chairs=3)
+    start = datetime(2030, 1, 1, 8, 0)
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(availability.BOOKING_WINDOW_DAYS)]
+    # Every chair taken for the whole window except the last slot of the last day
+    rows = [
+        (chair, date, rules.slot_time(slot))
+        for date in dates
+        for slot in range(rules.slots_per_day)
+        for chair in range(1, rules.chairs + 1)
+    ][:-1]
+    pool = database.get_pool(db_path)
+    with pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO appointments (user_id, service, date, time) VALUES (?, 'Eyebrow Threading', ?, ?)", rows
+        )
+        availability.rebuild_occupancy(conn, rules)
+        conn.commit()
+
+    def probe_each_time():
+        with pool.connection() as conn:
+            for date in dates:
+                for slot in range(rules.slots_per_day):
+                    if availability.load_days(conn, rules, date, date)[date].fits(slot, 1):
+                        return date, rules.slot_time(slot)
+        return None
+
+    engine = availability.AvailabilityEngine(db_path, rules)
+
+    def next_available():
+        engine.invalidate()
+        return engine.next_available(30, now=start)
+
+    assert probe_each_time() == next_available() == (dates[-1], "18:30")
+    report(f"next free slot ({len(rows)} bookings)", timed(probe_each_time, repeat), timed(next_available, repeat))
+
+def bench_series(tmp, repeat=20):
+    """A 12-booking series: one writer round trip per booking vs one bulk intent"""
+    import availability
+    from write_queue import WriteQueue
+
+    db_path = os.path.join(tmp, 'series.db')
+    seed_appointments(db_path, users=repeat * 3, per_user=1)
+    rules = availability.BookingRules(chairs=repeat * 3)
+    writer = WriteQueue(db_path)
+    users = iter(range(1, repeat * 3 + 1))
+
+    def series():
+        return [("Haircut & Styling", f"2031-{m:02d}-01", "10:00") for m in range(1, 13)]
+
+    def one_by_one():
+        user_id = next(users)
+        for service, date, time in series():
+            writer.run(availability.book_if_available, rules, user_id, service, date, time, 10)
+
+    def bulk():
+        assert writer.run(availability.book_many_if_available, rules, next(users), series(), 10) == []
+
+    def single():
+        writer.run(availability.book_if_available, rules, next(users), "Haircut & Styling", "2031-01-01", "10:00", 10)
+
+    single_ms = timed(single, repeat)
+    report("12-booking series", timed(one_by_one, repeat), timed(bulk, repeat))
+    print(f"    one booking: {single_ms:.4f} ms/call")
+    writer.stop()
+
+def bench_stylists(tmp, repeat=50):
+    """Stylist assignment on a packed day: inline for one booking and for the whole day"""
+    import random
+    import availability
+    import stylists
+
+    db_path = os.path.join(tmp, 'stylists.db')
+    database.init_db(db_path)
+    rules = availability.BookingRules(chairs=8)
+    rng = random.Random(1)
+    pool = database.get_pool(db_path)
+    with pool.connection() as conn:
+        for i, skills in enumerate([["Hair", "Makeup"], ["Hair", "Skin"], ["Nails", "Waxing"], ["Skin", "Makeup"], ["Hair", "Nails"]]):
+            stylists.add_stylist(conn, f"Extra {i}", skills)
+        services = [row[0] for row in conn.execute("SELECT name FROM services")]
+        rows = [
+            (user_id, rng.choice(services), rules.slot_time(rng.randrange(rules.slots_per_day - 4)))
+            for user_id in range(1, 121)
+        ]
+        conn.executemany("""
+            INSERT OR IGNORE INTO appointments (user_id, service, service_id, date, time)
+            VALUES (?, ?, (SELECT id FROM services WHERE name = ?2), '2030-01-01', ?)
+        """, rows)
+        conn.commit()
+        count = conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        team = len(stylists.get_stylists(conn))
+
+    def assign_one():
+        with pool.connection() as conn:
+            stylists.assign_booking(conn, rules, count)
+            conn.rollback()
+
+    def assign_whole_day():
+        with pool.connection() as conn:
+            stylists.assign_day(conn, rules, "2030-01-01")
+            conn.rollback()
+
+    print(f"  stylist assignment ({count} bookings, {team} stylists)")
+    print(f"    one booking: {timed(assign_one, repeat):.4f} ms/call")
+    print(f"    whole day:   {timed(assign_whole_day, repeat):.4f} ms/call")
+
+def bench_my_appointments(tmp, rows=10000, repeat=20):
+    """My Appointments at 10k rows: Python date filter and sort vs parameterized SQL"""
+    from datetime import datetime, timedelta
+
+    db_path = os.path.join(tmp, 'history.db')
+    database.init_db(db_path)
+    pool = database.get_pool(db_path)
+    start = datetime(2030, 1, 1)
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO users (name, phone) VALUES ('Regular', '9000000000')")
+        services = [row[0] for row in conn.execute("SELECT name FROM services")]
+        conn.executemany("""
+            INSERT INTO appointments (user_id, service, service_id, date, time, status)
+            VALUES (1, ?, (SELECT id FROM services WHERE name = ?1), ?, ?, ?)
+        """, [
+            (services[n % len(services)], (start + timedelta(days=n // 10)).strftime("%Y-%m-%d"),
+             f"{9 + n % 10:02d}:00", 'cancelled' if n % 7 == 0 else 'booked')
+            for n in range(rows)
+        ])
+        conn.commit()
+
+    # "Last 30 Days" of booked appointments, date descending, as of a day mid-history
+    today = (start + timedelta(days=rows // 20)).date()
+    month_ago = today - timedelta(days=30)
+
+    def python_filter():
+        with pool.connection() as conn:
+            appointments = repository.get_user_appointments(conn, 1)
+        matching = [
+            appointment for appointment in appointments
+            if appointment.status == 'booked'
+            and month_ago <= datetime.strptime(appointment.date, '%Y-%m-%d').date() <= today
+        ]
+        return sorted(matching, key=lambda appointment: datetime.strptime(appointment.date, '%Y-%m-%d'), reverse=True)
+
+    def sql_filter():
+        with pool.connection() as conn:
+            return repository.find_user_appointments(
+                conn, 1, 'booked', month_ago.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'), 'date', True
+            )
+
+    assert {a.id for a in python_filter()} == {a.id for a in sql_filter()}
+    report(f"My Appointments, last 30 days ({rows} rows)", timed(python_filter, repeat), timed(sql_filter, repeat))
+
+def _per_card_catalog(services):
+    """The services page as it was: a heading and then one element per card"""
+    import streamlit as st
+
+    for category in services['category'].unique():
+        st.markdown(f"<h3 style='color: var(--accent);'>{category}</h3>", unsafe_allow_html=True)
+        for _, service in services[services['category'] == category].iterrows():
+            st.markdown(f"""
+            <div class="service-card">
+                <div style="display: flex; justify-content: space-between;">
+                    <h4>{service['name']}</h4>
+                    <h4 style="color: var(--primary);">₹{service['price']:.2f}</h4>
+                </div>
+                <p><strong>Duration:</strong> {service['duration']} minutes</p>
+                <p>{service['description']}</p>
+            </div>
+            """, unsafe_allow_html=True)
+
+def _batched_catalog(services):
+    """The services page now: the whole catalog in one element"""
+    import streamlit as st
+    import cards
+
+    st.markdown(cards.services_by_category(services), unsafe_allow_html=True)
+
+def bench_service_cards(tmp, services=150, repeat=10):
+    """Services page with a large catalog: one element per card vs one batched block"""
+    try:
+        import pandas as pd
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("  service cards skipped (streamlit.testing not available)")
+        return
+
+    catalog = pd.DataFrame({
+        'name': [f"Service {n}" for n in range(services)],
+        'price': [199.0 + n for n in range(services)],
+        'duration': [30 + 15 * (n % 6) for n in range(services)],
+        'description': [f"Description of service {n}" for n in range(services)],
+        'category': [("Hair", "Skin", "Nails", "Waxing", "Makeup")[n % 5] for n in range(services)],
+    })
+
+    def measure(render):
+        at = AppTest.from_function(render, args=(catalog,), default_timeout=60)
+        at.run()
+        deltas = list(at.markdown)
+        # Bytes of element protos the server sends as deltas on each rerun
+        sent = sum(element.proto.ByteSize() for element in deltas)
+        return timed(at.run, repeat), len(deltas), sent
+
+    before_ms, before_elements, before_bytes = measure(_per_card_catalog)
+    after_ms, after_elements, after_bytes = measure(_batched_catalog)
+    report(f"Services page rerun ({services} services)", before_ms, after_ms)
+    print(f"    elements: {before_elements} -> {after_elements}, "
+          f"delta bytes: {before_bytes} -> {after_bytes}")
+
+BENCHMARKS = {
+    'init': bench_init,
+    'reads': bench_reads,
+    'writes': bench_writes,
+    'slots': bench_slots,
+    'series': bench_series,
+    'stylists': bench_stylists,
+    'my_appointments': bench_my_appointments,
+    'service_cards': bench_service_cards,
+}
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Choose from: {', '.join(BENCHMARKS)}")
+            return 1
+
+    print("⏱️ Glamour Salon Benchmarks")
+    print("=" * 40)
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            BENCHMARKS[name](tmp)
+            for pool in database._pools.values():
+                pool.close_all()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
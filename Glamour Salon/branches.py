@@ -0,0 +1,102 @@
+"""
+Routing layer for multi-branch salons.
+
+Each branch keeps its own SQLite file, so bookings at one location never
+wait on another location's write lock. The router maps a branch id to
+its database file and hands out that branch's connection pool and
+writer. Cross-branch admin reports fan out with scatter_gather().
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import DB_PATH, get_pool, ensure_db_ready
+from snapshots import get_snapshot
+from write_queue import get_write_queue
+
+DEFAULT_BRANCH_ID = 'main'
+
+class Branch:
+    __slots__ = ('id', 'name', 'db_path')
+
+    def __init__(self, id, name, db_path):
+        self.id = id
+        self.name = name
+        self.db_path = db_path
+
+class BranchRouter:
+    def __init__(self, branches):
+        if not branches:
+            branches = [Branch(DEFAULT_BRANCH_ID, "Main Branch", DB_PATH)]
+        self.branches = {branch.id: branch for branch in branches}
+        self.default_branch_id = branches[0].id
+
+    @classmethod
+    def from_config(cls, config_path='config.json'):
+        """Build the router from the "branches" list in config.json"""
+        branches = []
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+            for entry in config.get('branches', []):
+                branches.append(Branch(entry['id'], entry.get('name', entry['id']), entry['db_path']))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Branch config warning: {e}")
+        return cls(branches)
+
+    def branch(self, branch_id=None):
+        """Resolve a branch id, falling back to the default branch"""
+        return self.branches.get(branch_id) or self.branches[self.default_branch_id]
+
+    def db_path(self, branch_id=None):
+        return self.branch(branch_id).db_path
+
+    def pool(self, branch_id=None):
+        return get_pool(self.db_path(branch_id))
+
+    def writer(self, branch_id=None):
+        return get_write_queue(self.db_path(branch_id))
+
+    def ensure_ready(self):
+        """Migrate and seed every branch database"""
+        for branch in self.branches.values():
+            ensure_db_ready(branch.db_path)
+
+    def snapshot(self, branch_id=None):
+        return get_snapshot(self.db_path(branch_id))
+
+    def scatter_gather(self, query, branch_ids=None, snapshot=False):
+        """Run query(branch, conn) on each branch in parallel; returns {branch_id: result}.
+
+        With snapshot=True the query reads each branch's reporting snapshot
+        instead of the live database.
+        """
+        targets = [self.branch(branch_id) for branch_id in (branch_ids or self.branches)]
+
+        def run(branch):
+            if snapshot:
+                connection = get_snapshot(branch.db_path).connection()
+            else:
+                connection = get_pool(branch.db_path).connection()
+            with connection as conn:
+                return query(branch, conn)
+
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            results = list(executor.map(run, targets))
+        return {branch.id: result for branch, result in zip(targets, results)}
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router(config_path=None):
+    """Return the process-wide router, reading config.json next to this file"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                if config_path is None:
+                    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+                _router = BranchRouter.from_config(config_path)
+    return _router
@@ -0,0 +1,86 @@
+"""
+HTML for the service and appointment card lists.
+
+Each list is rendered as one block of HTML and sent as a single
+st.markdown element, instead of one element per card. Every element is
+its own delta over the websocket and its own React subtree in the
+browser, so a 100-service catalog used to cost over a hundred deltas
+per rerun. The card markup is compiled once, as string.Template
+objects, and every value is HTML-escaped before it is substituted.
+"""
+
+import html
+from string import Template
+
+SERVICE_CARD = Template("""<div class="service-card">
+<div style="display: flex; justify-content: space-between;">
+<h4>$name</h4>
+<h4 style="color: var(--primary);">₹$price</h4>
+</div>
+<p><strong>$detail_label:</strong> $detail</p>
+<p>$description</p>
+</div>""")
+
+APPOINTMENT_CARD = Template("""<div class="appointment-card">
+<div style="display: flex; justify-content: space-between; align-items: center;">
+<div>
+<h4>$service</h4>
+<p><strong>Date:</strong> $date</p>
+<p><strong>Time:</strong> $time</p>
+$stylist_line
+</div>
+<div style="text-align: right;">
+<span style='color: $status_color; font-weight: bold;'>$status</span>
+</div>
+</div>
+</div>""")
+
+CATEGORY_HEADING = Template("<h3 style='color: var(--accent);'>$category</h3>")
+
+STYLIST_LINE = Template("<p><strong>Stylist:</strong> $stylist</p>")
+
+def _text(value):
+    return html.escape("" if value is None else str(value))
+
+def service_card(name, price, duration=None, description=None, category=None):
+    """One service card; shows the category when given, otherwise the duration"""
+    if category is not None:
+        detail_label, detail = "Category", _text(category)
+    else:
+        detail_label, detail = "Duration", f"{_text(duration)} minutes"
+    return SERVICE_CARD.substitute(
+        name=_text(name), price=f"{float(price or 0):.2f}",
+        detail_label=detail_label, detail=detail, description=_text(description),
+    )
+
+def card_grid(cards, columns=2):
+    """Lay cards out in a grid of the given number of columns"""
+    return f'<div class="card-grid" style="--card-columns: {int(columns)};">{"".join(cards)}</div>'
+
+def services_by_category(services_df):
+    """The whole catalog as one block: a heading per category, then its cards"""
+    parts = []
+    for category, group in services_df.groupby('category', sort=False):
+        parts.append(CATEGORY_HEADING.substitute(category=_text(category)))
+        parts.append(card_grid(
+            (service_card(name, price, duration, description)
+             for name, price, duration, description in zip(
+                 group['name'], group['price'], group['duration'], group['description'])),
+            columns=1,
+        ))
+    return "".join(parts)
+
+def appointment_cards(appointments):
+    """Appointment cards for a page of repository.Appointment records"""
+    cards = []
+    for appointment in appointments:
+        status = str(appointment.status) if appointment.status is not None else "unknown"
+        cards.append(APPOINTMENT_CARD.substitute(
+            service=_text(appointment.service),
+            date=_text(appointment.date),
+            time=_text(appointment.time),
+            stylist_line=STYLIST_LINE.substitute(stylist=_text(appointment.stylist)) if appointment.stylist else "",
+            status_color="green" if status == 'booked' else "red",
+            status=_text(status.upper()),
+        ))
+    return card_grid(cards, columns=1)
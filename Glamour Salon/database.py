@@ -0,0 +1,486 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from queue import Queue, Empty, Full
+
+from query_stats import InstrumentedConnection
+
+DB_PATH = 'salon.db'
+
+# PRAGMAs applied once when a pooled connection is opened
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+]
+
+def open_connection(db_path=DB_PATH, timeout=30):
+    """Open a new connection and apply the per-connection PRAGMAs"""
+    # A generous statement cache keeps the repository's fixed queries prepared;
+    # every statement is timed by query_stats
+    conn = sqlite3.connect(
+        db_path, timeout=timeout, check_same_thread=False, cached_statements=256,
+        factory=InstrumentedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except sqlite3.OperationalError:
+            # journal_mode can fail while another writer holds the lock
+            pass
+    return conn
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of SQLite connections for one database file"""
+
+    def __init__(self, db_path=DB_PATH, max_size=5, timeout=30, health_check_interval=60):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._last_used = {}
+
+    def _open(self):
+        return open_connection(self.db_path, self.timeout)
+
+    def _is_healthy(self, conn):
+        """Cheap liveness probe, only run on connections idle for a while"""
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        """Borrow a connection, opening a new one while under max_size"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                with self._lock:
+                    can_open = self._created < self.max_size
+                    if can_open:
+                        self._created += 1
+                if can_open:
+                    try:
+                        return self._open()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                # Pool exhausted: wait for another thread to give one back
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except Empty:
+                    raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left open"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager wrapping acquire/release"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones are closed on release)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+class PerDatabase:
+    """Process-wide objects keyed by database file, each made by factory on first use.
+
+    Lookups of an existing object take no lock; creation re-checks under
+    the lock so racing first callers share one object. Extra arguments to
+    get() are passed to the factory and only matter on that first call.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def get(self, db_path=DB_PATH, *args):
+        obj = self._objects.get(db_path)
+        if obj is None:
+            with self._lock:
+                obj = self._objects.get(db_path)
+                if obj is None:
+                    obj = self._factory(db_path, *args)
+                    self._objects[db_path] = obj
+        return obj
+
+    def values(self):
+        return list(self._objects.values())
+
+_pools = PerDatabase(ConnectionPool)
+
+def get_pool(db_path=DB_PATH):
+    """Return the process-wide pool for a database file, creating it on first use"""
+    return _pools.get(db_path)
+
+class DataVersion:
+    """Change detector for one database file.
+
+    PRAGMA data_version moves whenever another connection (the writer, a
+    second process) commits to the file. It is only comparable on the
+    same connection, so each file gets one connection that never writes.
+    An unchanged value means nothing read from the file can be stale.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+_data_versions = PerDatabase(DataVersion)
+
+def data_version(db_path=DB_PATH):
+    """The current data_version of a database file, from its process-wide watcher"""
+    return _data_versions.get(db_path).current()
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Never edit a shipped migration; append a new one instead.
+
+def _migration_1_base_schema(conn):
+    """Base tables (idempotent so pre-versioning databases upgrade cleanly)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     name TEXT NOT NULL,
+                     phone TEXT NOT NULL UNIQUE,
+                     loyalty_points INTEGER DEFAULT 0,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Older databases were created before loyalty_points existed
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if 'loyalty_points' not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN loyalty_points INTEGER DEFAULT 0")
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS appointments
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id INTEGER,
+                     service TEXT NOT NULL,
+                     date TEXT NOT NULL,
+                     time TEXT NOT NULL,
+                     status TEXT DEFAULT 'booked',
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     FOREIGN KEY (user_id) REFERENCES users (id))''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS services
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     name TEXT NOT NULL,
+                     price REAL NOT NULL,
+                     duration INTEGER NOT NULL,
+                     description TEXT,
+                     category TEXT)''')
+
+def _migration_2_hot_path_indexes(conn):
+    """Indexes for My Appointments, duplicate checks and recommendations"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_user_date ON appointments(user_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_slot ON appointments(date, time, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_service ON appointments(service)")
+
+def _migration_3_appointment_service_id(conn):
+    """Join appointments to services on an integer key instead of the name"""
+    conn.execute("ALTER TABLE appointments ADD COLUMN service_id INTEGER REFERENCES services(id)")
+    # Service names are not unique; attach history to the oldest match
+    conn.execute("""
+        UPDATE appointments
+        SET service_id = (SELECT MIN(s.id) FROM services s WHERE s.name = appointments.service)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_appointments_service")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_service_id ON appointments(service_id)")
+
+# Points each booking earned when the duplicates cancelled by migration 4 were made
+DUPLICATE_BOOKING_POINTS = 10
+
+def _migration_4_unique_booking(conn):
+    """Reject duplicate live bookings with a partial unique index"""
+    # Cancel duplicates that slipped past the old pre-read check, keeping the first.
+    # Each cancelled row and the points taken back for it are kept for auditing.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cancelled_duplicate_bookings
+        (appointment_id INTEGER PRIMARY KEY,
+         user_id INTEGER,
+         points_reversed INTEGER NOT NULL)
+    """)
+    conn.execute("""
+        INSERT INTO cancelled_duplicate_bookings (appointment_id, user_id, points_reversed)
+        SELECT id, user_id, ? FROM appointments
+        WHERE status = 'booked' AND id NOT IN (
+            SELECT MIN(id) FROM appointments
+            WHERE status = 'booked'
+            GROUP BY user_id, service, date, time
+        )
+    """, (DUPLICATE_BOOKING_POINTS,))
+    conn.execute("""
+        UPDATE appointments SET status = 'cancelled'
+        WHERE id IN (SELECT appointment_id FROM cancelled_duplicate_bookings)
+    """)
+    conn.execute("""
+        UPDATE users SET loyalty_points = MAX(0, COALESCE(loyalty_points, 0) - (
+            SELECT SUM(points_reversed) FROM cancelled_duplicate_bookings d WHERE d.user_id = users.id
+        ))
+        WHERE id IN (SELECT user_id FROM cancelled_duplicate_bookings)
+    """)
+    cancelled, users = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT user_id) FROM cancelled_duplicate_bookings"
+    ).fetchone()
+    if cancelled:
+        print(f"Cancelled {cancelled} duplicate bookings for {users} users and reversed their loyalty points "
+              "(see cancelled_duplicate_bookings)")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_unique_booking
+        ON appointments(user_id, service, date, time) WHERE status = 'booked'
+    """)
+
+def _migration_5_occupancy(conn):
+    """Materialized booked count per (date, slot), kept in step by the booking intents"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS occupancy
+        (date TEXT NOT NULL,
+         slot INTEGER NOT NULL,
+         booked_count INTEGER NOT NULL DEFAULT 0,
+         PRIMARY KEY (date, slot)) WITHOUT ROWID
+    """)
+    # Filled from booked appointments by migration 11, once they carry their duration
+
+def _migration_6_waitlist(conn):
+    """Clients waiting for a full slot, matched on (date, slot, service) when one frees up"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS waitlist
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+         user_id INTEGER NOT NULL REFERENCES users (id),
+         service TEXT NOT NULL,
+         date TEXT NOT NULL,
+         time TEXT NOT NULL,
+         slot INTEGER NOT NULL,
+         status TEXT NOT NULL DEFAULT 'waiting',
+         appointment_id INTEGER REFERENCES appointments (id),
+         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    """)
+    # Partial, so it only holds live waiters; user_id last also rejects double joins
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_waitlist_slot
+        ON waitlist(date, slot, service, user_id) WHERE status = 'waiting'
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_user ON waitlist(user_id) WHERE status = 'waiting'")
+
+def _migration_7_stylists(conn):
+    """Stylists, their skills by service category, and who each booking is with"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stylists
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+         name TEXT NOT NULL,
+         active INTEGER NOT NULL DEFAULT 1)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stylist_skills
+        (stylist_id INTEGER NOT NULL REFERENCES stylists (id),
+         category TEXT NOT NULL,
+         PRIMARY KEY (stylist_id, category)) WITHOUT ROWID
+    """)
+    conn.execute("ALTER TABLE appointments ADD COLUMN stylist_id INTEGER REFERENCES stylists(id)")
+
+def _migration_8_idempotency_keys(conn):
+    """Stored results of booking requests, so a replayed click or link is not applied twice"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys
+        (key TEXT PRIMARY KEY,
+         result TEXT NOT NULL,
+         created_at REAL NOT NULL) WITHOUT ROWID
+    """)
+    # Expiry deletes by age
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)")
+
+def _migration_9_page_keys(conn):
+    """Indexes for keyset pagination of the admin service and user lists"""
+    # Row-value page keys skip NULLs; the app files uncategorized services under "Other"
+    conn.execute("UPDATE services SET category = 'Other' WHERE category IS NULL")
+    conn.execute("UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_services_category_name ON services(category, name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)")
+
+# Tables whose inserts, updates and deletes bump their row in table_versions
+VERSIONED_TABLES = ('users', 'appointments', 'services', 'stylists', 'stylist_skills')
+
+def _migration_10_table_versions(conn):
+    """Per-table change counters, kept by triggers, that key the query result cache"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions
+        (name TEXT PRIMARY KEY,
+         version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID
+    """)
+    for table in VERSIONED_TABLES:
+        conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            """)
+
+def _migration_11_appointment_duration(conn):
+    """Keep the duration each appointment was booked for, so editing or deleting its service does not resize it"""
+    conn.execute("ALTER TABLE appointments ADD COLUMN duration INTEGER")
+    conn.execute("""
+        UPDATE appointments
+        SET duration = (SELECT s.duration FROM services s WHERE s.id = appointments.service_id)
+    """)
+    # Rebuilt from the stored durations, which also repairs counts left by
+    # bookings released at their service's edited duration.
+    # Slot numbering comes from the booking rules in config.json
+    from availability import load_rules, rebuild_occupancy
+    rebuild_occupancy(conn, load_rules())
+
+def _migration_12_appointment_page_keys(conn):
+    """Indexes in the page-key order of My Appointments, so a page reads only its own rows"""
+    # With the rowid at the end these are (user_id, date, time, id) and (user_id, time, date, id);
+    # the first one also serves every (user_id, date) lookup
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_user_date_time ON appointments(user_id, date, time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_user_time_date ON appointments(user_id, time, date)")
+    conn.execute("DROP INDEX IF EXISTS idx_appointments_user_date")
+
+MIGRATIONS = [
+    (1, _migration_1_base_schema),
+    (2, _migration_2_hot_path_indexes),
+    (3, _migration_3_appointment_service_id),
+    (4, _migration_4_unique_booking),
+    (5, _migration_5_occupancy),
+    (6, _migration_6_waitlist),
+    (7, _migration_7_stylists),
+    (8, _migration_8_idempotency_keys),
+    (9, _migration_9_page_keys),
+    (10, _migration_10_table_versions),
+    (11, _migration_11_appointment_duration),
+    (12, _migration_12_appointment_page_keys),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Apply every pending migration, each in its own write transaction"""
+    applied = []
+    for version, migration in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock in case another process migrated first
+            if get_schema_version(conn) < version:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                applied.append(version)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return applied
+
+SAMPLE_SERVICES = [
+    ("Haircut & Styling", 499.0, 60, "Professional haircut with blow dry and styling", "Hair"),
+    ("Hair Coloring", 1499.0, 120, "Full hair coloring service with conditioning treatment", "Hair"),
+    ("Hair Spa Treatment", 999.0, 90, "Deep conditioning and scalp massage treatment", "Hair"),
+    ("Facial Treatment", 899.0, 75, "Custom facial with cleansing and moisturizing", "Skin"),
+    ("Waxing Full Legs", 599.0, 45, "Complete leg waxing with soothing lotion", "Waxing"),
+    ("Eyebrow Threading", 99.0, 30, "Precision eyebrow shaping with threading", "Waxing"),
+    ("Manicure", 499.0, 45, "Classic nail care with polish", "Nails"),
+    ("Pedicure", 599.0, 60, "Luxury foot care with massage and polish", "Nails"),
+    ("Makeup Application", 1999.0, 60, "Professional makeup for special occasions", "Makeup"),
+    ("Bridal Makeup", 9999.0, 120, "Complete bridal makeup with trial session", "Makeup")
+]
+
+SAMPLE_STYLISTS = [
+    ("Anjali", ["Hair", "Makeup"]),
+    ("Meera", ["Hair", "Skin", "Waxing"]),
+    ("Riya", ["Nails", "Waxing", "Skin", "Makeup"]),
+]
+
+def init_db(db_path=DB_PATH):
+    """Migrate the schema and seed the sample catalog into a new database.
+
+    The sample stylists only go into a database with no services and no
+    stylists yet; an existing salon's team is left to the admin Stylists tab.
+    """
+    with get_pool(db_path).connection() as conn:
+        applied = migrate(conn)
+        if applied:
+            print(f"DB migrated to schema version {applied[-1]}")
+
+        if conn.execute("SELECT COUNT(*) FROM services").fetchone()[0] == 0:
+            conn.executemany(
+                "INSERT INTO services (name, price, duration, description, category) VALUES (?, ?, ?, ?, ?)",
+                SAMPLE_SERVICES,
+            )
+            if conn.execute("SELECT COUNT(*) FROM stylists").fetchone()[0] == 0:
+                for name, skills in SAMPLE_STYLISTS:
+                    stylist_id = conn.execute("INSERT INTO stylists (name) VALUES (?)", (name,)).lastrowid
+                    conn.executemany(
+                        "INSERT INTO stylist_skills (stylist_id, category) VALUES (?, ?)",
+                        [(stylist_id, category) for category in skills],
+                    )
+        conn.commit()
+    return applied
+
+_ready = set()
+_ready_lock = threading.Lock()
+
+def ensure_db_ready(db_path=DB_PATH):
+    """Run init_db at most once per process and database file"""
+    if db_path in _ready:
+        return
+    with _ready_lock:
+        if db_path in _ready:
+            return
+        init_db(db_path)
+        _ready.add(db_path)
@@ -0,0 +1,57 @@
+"""
+Idempotency keys for booking requests.
+
+A Confirm Booking click or an instant-book link carries a key minted
+for it. run_once wraps a write intent: the first request with a key that
+books (or finds the booking already made) stores its JSON-encoded result
+under the key, in the same transaction as the booking itself. A replay of
+that request (a double-click, a browser refresh, a retried link) finds
+the key and gets the stored result back without touching appointments or
+users. Any other outcome, such as a full slot, is not stored, so a retry
+with the same key checks again.
+
+Keys expire after KEY_TTL_SECONDS; expired ones are deleted on the next
+write through idx_idempotency_created.
+"""
+
+import json
+import secrets
+import time
+
+from availability import BOOKED, DUPLICATE
+
+# How long a stored result answers replays
+KEY_TTL_SECONDS = 24 * 60 * 60
+
+def new_key():
+    """A fresh random key for one click or one link"""
+    return secrets.token_urlsafe(16)
+
+def expire_keys(conn, now=None):
+    """Write intent: delete keys older than KEY_TTL_SECONDS; returns how many went"""
+    cutoff = (now if now is not None else time.time()) - KEY_TTL_SECONDS
+    return conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (cutoff,)).rowcount
+
+def run_once(conn, key, intent, *args):
+    """Write intent: run intent(conn, *args) once per key and replay its result after that.
+
+    The intent returns an outcome, or a list or tuple that starts with
+    one, and must be JSON-serializable; tuples come back as lists on
+    replay. Only BOOKED and DUPLICATE results are stored. An intent that
+    raises or returns anything else stores nothing, so the request can be
+    retried with the same key.
+    """
+    now = time.time()
+    expire_keys(conn, now)
+    row = conn.execute("SELECT result FROM idempotency_keys WHERE key = ?", (key,)).fetchone()
+    if row is not None:
+        return json.loads(row[0])
+    result = intent(conn, *args)
+    outcome = result[0] if isinstance(result, (list, tuple)) else result
+    if outcome not in (BOOKED, DUPLICATE):
+        return result
+    conn.execute(
+        "INSERT INTO idempotency_keys (key, result, created_at) VALUES (?, ?, ?)",
+        (key, json.dumps(result), now),
+    )
+    return result
@@ -0,0 +1,113 @@
+"""
+Per-day interval index for appointment overlap queries.
+
+Appointments store only a start date and time; the end comes from the
+service duration. Each day's booked appointments are kept sorted by
+start minute together with the day's longest booking, so the bookings
+overlapping [start, end) are found with two bisects: only those starting
+after start - longest and before end can overlap. That is O(log n + k)
+for the k bookings in that band, instead of a scan of the whole day.
+"""
+
+from bisect import bisect_left, bisect_right
+
+from database import DB_PATH, PerDatabase
+from availability import DEFAULT_DURATION, DayCache, to_minutes
+
+class Booking:
+    __slots__ = ('id', 'user_id', 'user_name', 'service', 'start', 'end', 'stylist')
+
+    def __init__(self, id, user_id, user_name, service, start, end, stylist=None):
+        self.id = id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.service = service
+        self.start = start
+        self.end = end
+        self.stylist = stylist
+
+    def __lt__(self, other):
+        return (self.start, self.id) < (other.start, other.id)
+
+    @property
+    def start_time(self):
+        return _to_time(self.start)
+
+    @property
+    def end_time(self):
+        return _to_time(self.end)
+
+def _to_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+class DayIntervals:
+    """One day's bookings sorted by start minute"""
+    __slots__ = ('date', 'bookings', 'starts', 'longest')
+
+    def __init__(self, date, bookings=()):
+        self.date = date
+        self.bookings = sorted(bookings)
+        self.starts = [booking.start for booking in self.bookings]
+        self.longest = max((booking.end - booking.start for booking in self.bookings), default=0)
+
+    def overlapping(self, start, end):
+        """Bookings whose [start, end) intersects the given minutes"""
+        lo = bisect_right(self.starts, start - self.longest)
+        hi = bisect_left(self.starts, end)
+        return [booking for booking in self.bookings[lo:hi] if booking.end > start]
+
+DAY_BOOKINGS_SQL = """
+    SELECT a.id, a.user_id, u.name, a.service, a.time, COALESCE(a.duration, s.duration), st.name
+    FROM appointments a
+    LEFT JOIN services s ON s.id = a.service_id
+    LEFT JOIN users u ON u.id = a.user_id
+    LEFT JOIN stylists st ON st.id = a.stylist_id
+    WHERE a.date = ? AND a.status = 'booked'
+"""
+
+def load_day(conn, date):
+    """Build a day's index from one query on idx_appointments_slot"""
+    bookings = []
+    for appointment_id, user_id, user_name, service, time_str, duration, stylist in conn.execute(DAY_BOOKINGS_SQL, (date,)):
+        try:
+            start = to_minutes(time_str)
+        except ValueError:
+            continue
+        end = start + (duration or DEFAULT_DURATION)
+        bookings.append(Booking(appointment_id, user_id, user_name, service, start, end, stylist))
+    return DayIntervals(date, bookings)
+
+def load_days(conn, dates):
+    """Day indexes for several dates, one query each"""
+    return {date: load_day(conn, date) for date in dates}
+
+class IntervalIndex:
+    """Overlap queries over each day's bookings, cached per date like the availability engine's occupancy"""
+
+    def __init__(self, db_path=DB_PATH, max_age=60):
+        self.db_path = db_path
+        self._days = DayCache(db_path, load_days, max_age)
+
+    def day(self, date):
+        return self._days.get([date])[0]
+
+    def overlapping(self, date, start_time, end_time):
+        """Bookings on date overlapping "HH:MM"-"HH:MM", earliest first"""
+        return self.day(date).overlapping(to_minutes(start_time), to_minutes(end_time))
+
+    def conflicts(self, date, time, duration, user_id, exclude_id=None):
+        """The user's own bookings that would overlap a new one at date/time"""
+        start = to_minutes(time)
+        return [
+            booking for booking in self.day(date).overlapping(start, start + (duration or DEFAULT_DURATION))
+            if booking.user_id == user_id and booking.id != exclude_id
+        ]
+
+    def invalidate(self, date=None):
+        self._days.invalidate(date)
+
+_indexes = PerDatabase(IntervalIndex)
+
+def get_interval_index(db_path=DB_PATH):
+    """Return the process-wide interval index for a database file"""
+    return _indexes.get(db_path)
@@ -0,0 +1,311 @@
+"""
+Local load test for the booking API (api.py).
+
+Starts the API on a throwaway database in a subprocess, then drives it
+with keep-alive asyncio clients and reports requests per second and
+latency percentiles for each route. For comparison it also times Streamlit
+reruns of the booking page with streamlit.testing; this is what every
+booking costs through the app. The rerun timing skips the browser and
+websocket round trip, so the real app is slower still.
+
+Finally it runs the app under `streamlit run` and drives the booking page
+over the websocket the way a browser tab does, timing a date change as a
+full script rerun and as a rerun of just the fragment holding the date
+picker: the round trip from the widget update until the last delta
+arrives, the server's script execution time and the deltas sent.
+
+    python loadtest.py [--clients 32] [--seconds 5] [--reruns 20] [--interactions 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import init_db
+from write_queue import WriteQueue
+import repository
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CLIENT_PHONES = [f"98{i:08d}" for i in range(200)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def seed(db_path):
+    init_db(db_path)
+    writer = WriteQueue(db_path)
+    for i, phone in enumerate(CLIENT_PHONES):
+        writer.run(repository.register_user, f"Client {i}", phone)
+    writer.stop()
+
+def start_api(db_path, port):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "api.py"), "--port", str(port), "--db", db_path],
+        stdout=subprocess.DEVNULL, cwd=os.path.dirname(db_path),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Booking API did not start")
+
+def encode(method, path, payload=None, headers=()):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers)
+    return (head + "\r\n").encode() + body
+
+async def client(port, make_request, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        n = 0
+        while time.perf_counter() < deadline:
+            request = make_request(n)
+            n += 1
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status_line, *header_lines = head.decode('latin-1').split("\r\n")
+            length = next(
+                int(line.split(":", 1)[1]) for line in header_lines if line.lower().startswith("content-length")
+            )
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            status = status_line.split(" ")[1]
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def run_load(port, clients, seconds, make_request_for):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(port, make_request_for(i), deadline, latencies, statuses) for i in range(clients)
+    ))
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, sorted(latencies), statuses
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+def scenarios():
+    today = time.strftime("%Y-%m-%d")
+    services = encode("GET", "/services")
+    slots = encode("GET", f"/availability?service=Manicure&date={today}")
+    next_slot = encode("GET", "/availability?service=Hair%20Coloring")
+
+    def bookings(i):
+        # Each client books the next open slot for its own phone numbers
+        def make(n):
+            phone = CLIENT_PHONES[(i + n * 37) % len(CLIENT_PHONES)]
+            return encode("POST", "/bookings", {"phone": phone, "service": "Manicure"},
+                          [("Idempotency-Key", f"load-{i}-{n}")])
+        return make
+
+    return [
+        ("GET /services", lambda i: lambda n: services),
+        ("GET /availability (day)", lambda i: lambda n: slots),
+        ("GET /availability (next)", lambda i: lambda n: next_slot),
+        ("POST /bookings (next slot)", bookings),
+    ]
+
+def time_streamlit_reruns(workdir, reruns):
+    """Reruns per second of the logged-in booking page, or None without streamlit.testing"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+    shutil.copy(os.path.join(HERE, "config.json"), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        at = AppTest.from_file(os.path.join(HERE, "app_restored.py"), default_timeout=60)
+        at.run()
+        at.text_input[0].input("Client 0")
+        at.text_input[1].input(CLIENT_PHONES[0])
+        at.button[0].click()
+        at.run()
+        at.sidebar.radio[0].set_value("Book Appointment")
+        at.run()
+        started = time.perf_counter()
+        for _ in range(reruns):
+            at.run()
+        return reruns / (time.perf_counter() - started)
+    finally:
+        os.chdir(cwd)
+
+def start_streamlit(workdir, port):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(HERE, "app_restored.py"),
+         # Usage stats make the server report each run's execution time in a page
+         # profile message; it goes to this script only, as no browser connects
+         "--server.headless", "true", "--server.port", str(port), "--browser.gatherUsageStats", "true"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=workdir,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Streamlit did not start")
+
+class StreamlitTab:
+    """The browser side of one Streamlit session: sends widget states, reads deltas"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.widgets = {}  # (element type, label) -> (widget id, fragment id)
+        self.states = {}   # widget id -> WidgetState sent with every rerun
+
+    def set(self, kind, label, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id = self.widgets[(kind, label)][0]
+        self.states[widget_id] = WidgetState(id=widget_id, **value)
+
+    def fragment_of(self, kind, label):
+        return self.widgets[(kind, label)][1]
+
+    async def run(self, fragment_id="", click=None):
+        """Rerun the script (or one fragment); returns (round trip s, execution s, deltas)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        message = BackMsg()
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        if click:
+            message.rerun_script.widget_states.widgets.append(
+                WidgetState(id=self.widgets[('button', click)][0], trigger_value=True))
+        message.rerun_script.fragment_id = fragment_id
+        started = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+        executed, deltas = 0.0, 0
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.websocket.recv())
+            kind = forward.WhichOneof("type")
+            deltas += kind == "delta"
+            if kind == "page_profile":
+                executed = forward.page_profile.exec_time / 1e6
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                widget = getattr(element, element.WhichOneof("type"))
+                if getattr(widget, "id", "") and hasattr(widget, "label"):
+                    self.widgets[(element.WhichOneof("type"), widget.label)] = (widget.id, forward.delta.fragment_id)
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - started, executed, deltas
+
+async def booking_interactions(port, rounds):
+    """Date-change timings on the booking page as {kind: [(round trip, execution, deltas)]}"""
+    import websockets
+
+    async with websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                  subprotocols=["streamlit"], max_size=None) as websocket:
+        tab = StreamlitTab(websocket)
+        await tab.run()
+        tab.set('text_input', "Name", string_value="Client 0")
+        tab.set('text_input', "Phone Number", string_value=CLIENT_PHONES[0])
+        await tab.run(click="Start Your Journey")
+        tab.set('radio', "Navigation", string_value="Book Appointment")
+        await tab.run()
+
+        # Alternate full and fragment reruns, flipping the date between two days
+        timings = {"full rerun": [], "fragment rerun": []}
+        fragment_id = tab.fragment_of('date_input', "Date")
+        for n in range(2 * rounds):
+            kind = "fragment rerun" if n % 2 else "full rerun"
+            if kind == "fragment rerun" and not fragment_id:
+                continue  # the page has no fragments
+            day = date.today() + timedelta(days=1 + n % 2)
+            tab.set('date_input', "Date", string_array_value={"data": [day.isoformat()]})
+            timings[kind].append(await tab.run(fragment_id if kind == "fragment rerun" else ""))
+        return timings
+
+def time_booking_interactions(workdir, rounds):
+    """Booking page date changes over a live websocket, or None without websockets"""
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        return None
+    shutil.copy(os.path.join(HERE, "config.json"), workdir)
+    port = free_port()
+    process = start_streamlit(workdir, port)
+    try:
+        return asyncio.run(booking_interactions(port, rounds))
+    finally:
+        process.terminate()
+        process.wait()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Load test the Glamour Salon booking API")
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--reruns', type=int, default=20, help="Streamlit reruns to time (0 to skip)")
+    parser.add_argument('--interactions', type=int, default=20,
+                        help="booking page date changes to time over a live websocket (0 to skip)")
+    args = parser.parse_args(argv)
+
+    print("🚦 Glamour Salon Booking API Load Test")
+    print("=" * 40)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "salon.db")
+        seed(db_path)
+        port = free_port()
+        process = start_api(db_path, port)
+        try:
+            print(f"{args.clients} keep-alive clients, {args.seconds:g}s per route")
+            for name, make_request_for in scenarios():
+                rate, latencies, statuses = asyncio.run(
+                    run_load(port, args.clients, args.seconds, make_request_for)
+                )
+                codes = ", ".join(f"{code}×{count}" for code, count in sorted(statuses.items()))
+                print(f"  {name:28} {rate:8.0f} req/s   p50 {percentile(latencies, 0.5):6.2f} ms"
+                      f"   p99 {percentile(latencies, 0.99):6.2f} ms   [{codes}]")
+        finally:
+            process.terminate()
+            process.wait()
+
+        if args.reruns:
+            rate = time_streamlit_reruns(tmp, args.reruns)
+            if rate is None:
+                print("  Streamlit rerun baseline skipped (streamlit.testing not available)")
+            else:
+                print(f"  {'Streamlit booking page rerun':28} {rate:8.1f} req/s")
+
+        if args.interactions:
+            timings = time_booking_interactions(tmp, args.interactions)
+            if timings is None:
+                print("  Booking page interactions skipped (websockets not available)")
+            else:
+                for name, runs in timings.items():
+                    if not runs:
+                        continue
+                    round_trips, executions, deltas = (sorted(values) for values in zip(*runs))
+                    print(f"  {'Date change, ' + name:28}   p50 {percentile(round_trips, 0.5):6.2f} ms"
+                          f"   p99 {percentile(round_trips, 0.99):6.2f} ms"
+                          f"   script p50 {percentile(executions, 0.5):6.2f} ms   {deltas[len(deltas) // 2]} deltas")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,88 @@
+"""
+Result cache for the salon's read queries, invalidated by table versions.
+
+Triggers (migration 10) bump a counter in table_versions on every insert,
+update and delete of a tracked table. A cached result is keyed on its
+query (the SQL, or the repository loader running it), its parameters
+and the current counters of the tables it reads. Any write to one of
+those tables makes the old entry unreachable, and the next read runs
+the query again. While the tables are unchanged,
+each read costs one primary-key lookup in table_versions instead of the
+query. Entries are evicted least recently used once max_entries is
+reached.
+
+This replaces fixed TTLs: results are never served stale, and unchanged
+tables are never re-queried.
+"""
+
+import threading
+from collections import OrderedDict
+
+from database import DB_PATH, PerDatabase
+
+MAX_ENTRIES = 256
+
+def table_versions(conn, tables):
+    """Current change counters of the given tables, in the same order"""
+    rows = dict(conn.execute(
+        f"SELECT name, version FROM table_versions WHERE name IN ({', '.join('?' * len(tables))})",
+        tables,
+    ).fetchall())
+    return tuple(rows.get(table, 0) for table in tables)
+
+class QueryCache:
+    """LRU cache of query results for one database file"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, tables, key, load):
+        """Cached load() for key, reloaded once any of tables has changed.
+
+        Results are shared between callers and must be treated as read-only.
+        """
+        full_key = (key, tuple(tables), table_versions(conn, tables))
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key]
+        value = load()
+        with self._lock:
+            self.misses += 1
+            self._entries[full_key] = value
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def call(self, conn, tables, loader, *args):
+        """Cached loader(conn, *args) for a repository loader running one fixed query"""
+        key = (loader.__module__, loader.__qualname__, args)
+        return self.get(conn, tables, key, lambda: loader(conn, *args))
+
+    def read_sql(self, conn, tables, sql, params=()):
+        """Cached pd.read_sql_query; returns a copy the caller may modify"""
+        import pandas as pd
+
+        params = tuple(params)
+        df = self.get(conn, tables, ('read_sql', sql, params), lambda: pd.read_sql_query(sql, conn, params=params))
+        return df.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# The cache holds results, not connections, so the path is only its key
+_caches = PerDatabase(lambda db_path: QueryCache())
+
+def get_query_cache(db_path=DB_PATH):
+    """Return the process-wide query cache for a database file"""
+    return _caches.get(db_path)
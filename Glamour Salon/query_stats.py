@@ -0,0 +1,172 @@
+"""
+SQL instrumentation for the salon data layer.
+
+Connections opened by database.open_connection use InstrumentedConnection,
+which times every statement and tags it with the app function that
+issued it (get_services, get_service_recommendations, ...). Statements
+slower than the threshold are appended to a JSONL slow-query log along
+with their EXPLAIN QUERY PLAN. get_stats() summarises p50/p95/p99 per
+query for the admin panel.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from itertools import chain
+
+SLOW_QUERY_MS = float(os.environ.get('SALON_SLOW_QUERY_MS', 50))
+SLOW_QUERY_LOG = os.environ.get('SALON_SLOW_QUERY_LOG', 'slow_queries.jsonl')
+
+# Keep this many recent timings per query for the percentiles
+SAMPLES_PER_QUERY = 1000
+
+# Frames from these modules are plumbing, never the caller we want to tag
+_PLUMBING_MODULES = ('query_stats', 'database', 'write_queue', 'snapshots', 'branches',
+                     'contextlib', 'threading', 'concurrent', 'pandas', 'sqlalchemy')
+# Repository functions are only used as the tag when no app frame is found
+# (e.g. write intents running on the writer thread)
+_DATA_MODULES = ('repository',)
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_timings = {}
+
+def _module_matches(module_name, prefixes):
+    return any(module_name == p or module_name.startswith(p + '.') for p in prefixes)
+
+def caller_tag():
+    """Name of the app function that issued the current statement"""
+    frame = sys._getframe(1)
+    data_tag = None
+    first_tag = None
+    while frame is not None:
+        module_name = frame.f_globals.get('__name__', '')
+        if first_tag is None and module_name != __name__:
+            first_tag = frame.f_code.co_name
+        if _module_matches(module_name, _DATA_MODULES):
+            if data_tag is None:
+                data_tag = frame.f_code.co_name
+        elif not _module_matches(module_name, _PLUMBING_MODULES):
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return data_tag or first_tag or 'unknown'
+
+def normalize_sql(sql):
+    return _WHITESPACE.sub(' ', sql).strip()
+
+def record(tag, sql, elapsed_ms):
+    key = (tag, normalize_sql(sql))
+    with _lock:
+        samples = _timings.get(key)
+        if samples is None:
+            samples = _timings[key] = deque(maxlen=SAMPLES_PER_QUERY)
+        samples.append(elapsed_ms)
+
+def _percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, int(round(pct / 100 * len(sorted_samples))) - 1)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+def get_stats():
+    """One dict per (tag, query), slowest p95 first"""
+    with _lock:
+        snapshot = {key: sorted(samples) for key, samples in _timings.items()}
+    stats = []
+    for (tag, sql), samples in snapshot.items():
+        stats.append({
+            'function': tag,
+            'query': sql,
+            'calls': len(samples),
+            'p50_ms': _percentile(samples, 50),
+            'p95_ms': _percentile(samples, 95),
+            'p99_ms': _percentile(samples, 99),
+            'max_ms': samples[-1],
+        })
+    stats.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return stats
+
+def reset_stats():
+    with _lock:
+        _timings.clear()
+
+def read_slow_log(limit=50, path=None):
+    """Most recent slow-query entries, newest first"""
+    path = path or SLOW_QUERY_LOG
+    try:
+        with open(path, 'r') as f:
+            lines = deque(f, maxlen=limit)
+    except OSError:
+        return []
+    entries = []
+    for line in reversed(lines):
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            pass
+    return entries
+
+def _log_slow_query(cursor, tag, sql, params, elapsed_ms):
+    plan = []
+    if _EXPLAINABLE.match(sql):
+        try:
+            # A fresh plain cursor so the plan lookup is neither timed nor logged
+            plan_cursor = sqlite3.Cursor(cursor.connection)
+            rows = plan_cursor.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan = [row[3] for row in rows]
+        except sqlite3.Error as e:
+            plan = [f"plan unavailable: {e}"]
+    entry = {
+        'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'function': tag,
+        'ms': round(elapsed_ms, 3),
+        'query': normalize_sql(sql),
+        'params': repr(params)[:200],
+        'plan': plan,
+    }
+    try:
+        with _lock, open(SLOW_QUERY_LOG, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    except OSError as e:
+        print(f"Slow query log error: {e}")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._observe(sql, params, start)
+
+    def executemany(self, sql, seq_of_params):
+        # The first parameter row stands in for the batch in the slow-query plan lookup
+        rows = iter(seq_of_params)
+        first = next(rows, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, rows if first is None else chain((first,), rows))
+        finally:
+            self._observe(sql, () if first is None else first, start)
+
+    def _observe(self, sql, params, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        tag = caller_tag()
+        record(tag, sql, elapsed_ms)
+        if elapsed_ms >= SLOW_QUERY_MS:
+            _log_slow_query(self, tag, sql, params, elapsed_ms)
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
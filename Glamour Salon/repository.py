@@ -0,0 +1,379 @@
+"""
+Lightweight typed row layer for the salon's small reads, plus the write
+intents run by the single writer.
+
+Queries are module-level constants so each pooled connection keeps them
+in its prepared-statement cache, and rows become compact __slots__
+records instead of pandas DataFrames. DataFrames stay reserved for the
+admin analytics paths.
+"""
+
+import sqlite3
+from datetime import date, timedelta
+
+class Record:
+    """Base class for __slots__ row records"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls(*row) for row in rows]
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class User(Record):
+    __slots__ = ('id', 'name', 'phone', 'loyalty_points')
+
+class UserListEntry(Record):
+    __slots__ = ('id', 'name', 'phone', 'loyalty_points', 'created_at')
+
+class Appointment(Record):
+    __slots__ = ('id', 'service', 'date', 'time', 'status', 'stylist', 'duration')
+
+class Service(Record):
+    __slots__ = ('id', 'name', 'category', 'price', 'duration', 'description')
+
+class BookingHistoryEntry(Record):
+    __slots__ = ('service', 'date', 'category')
+
+USER_ID_BY_PHONE_SQL = "SELECT id FROM users WHERE phone = ?"
+
+USER_BY_ID_SQL = "SELECT id, name, phone, loyalty_points FROM users WHERE id = ?"
+
+USER_BY_PHONE_SQL = "SELECT id, name, phone, loyalty_points FROM users WHERE phone = ?"
+
+USER_APPOINTMENTS_SQL = """
+    SELECT MAX(a.id) as id, a.service, a.date, a.time, a.status, st.name, a.duration
+    FROM appointments a
+    LEFT JOIN stylists st ON st.id = a.stylist_id
+    WHERE a.user_id = ?
+    GROUP BY a.service, a.date, a.time, a.status
+    ORDER BY a.date DESC, a.time DESC
+"""
+
+USER_APPOINTMENT_STATUSES_SQL = "SELECT DISTINCT status FROM appointments WHERE user_id = ? ORDER BY status"
+
+# ORDER BY columns for find_user_appointments; with the id they are also the page key
+APPOINTMENT_ORDERS = {
+    'date': ("a.date", "a.time"),
+    'time': ("a.time", "a.date"),
+}
+
+_filtered_appointments_sql = {}
+
+def filtered_appointments_sql(status=False, date_from=False, date_to=False, order='date', descending=False,
+                              after=False, limit=False):
+    """SQL for a user's appointments with only the filters in use.
+
+    Each combination of filters is one constant statement, so pooled
+    connections cache all of them. Rows come straight off the user's
+    (order columns, id) page-key index from migration 12, and pages seek
+    past the previous page's last key instead of using OFFSET, so a page
+    reads about `limit` rows however long the history is. No duplicate
+    rows need folding: idx_appointments_unique_booking allows one live
+    booking per user, service and slot.
+    """
+    if after and order == 'date':
+        # find_user_appointments narrows the date bound on the seek side to the page key
+        date_to, date_from = (True, date_from) if descending else (date_to, True)
+    shape = (bool(status), bool(date_from), bool(date_to), order, bool(descending), bool(after), bool(limit))
+    sql = _filtered_appointments_sql.get(shape)
+    if sql is None:
+        first, second = APPOINTMENT_ORDERS[order]
+        direction, seek = (" DESC", "<") if descending else ("", ">")
+        conditions = ["a.user_id = ?"]
+        if status:
+            conditions.append("a.status = ?")
+        if date_from:
+            conditions.append("a.date >= ?")
+        if date_to:
+            conditions.append("a.date <= ?")
+        if after:
+            # A plain bound on the leading column is what starts the index range at the page key
+            if order == 'time':
+                conditions.append(f"{first} {seek}= ?")
+            conditions.append(f"({first}, {second}, a.id) {seek} (?, ?, ?)")
+        sql = f"""
+    SELECT a.id, a.service, a.date, a.time, a.status, st.name, a.duration
+    FROM appointments a
+    LEFT JOIN stylists st ON st.id = a.stylist_id
+    WHERE {" AND ".join(conditions)}
+    ORDER BY {first}{direction}, {second}{direction}, a.id{direction}
+    {"LIMIT ?" if limit else ""}
+"""
+        _filtered_appointments_sql[shape] = sql
+    return sql
+
+SERVICES_PAGE_SQL = """
+    SELECT id, name, category, price, duration, description
+    FROM services
+    ORDER BY category, name, id
+    LIMIT ?
+"""
+
+SERVICES_PAGE_AFTER_SQL = """
+    SELECT id, name, category, price, duration, description
+    FROM services
+    WHERE (category, name, id) > (?, ?, ?)
+    ORDER BY category, name, id
+    LIMIT ?
+"""
+
+# Newest first; the optional search matches name (any case) or phone
+USERS_PAGE_SQL = """
+    SELECT id, name, phone, loyalty_points, created_at
+    FROM users
+    WHERE (?1 IS NULL OR instr(lower(name), lower(?1)) > 0 OR instr(phone, ?1) > 0)
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?2
+"""
+
+USERS_PAGE_BEFORE_SQL = """
+    SELECT id, name, phone, loyalty_points, created_at
+    FROM users
+    WHERE (created_at, id) < (?2, ?3)
+    AND (?1 IS NULL OR instr(lower(name), lower(?1)) > 0 OR instr(phone, ?1) > 0)
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?4
+"""
+
+BOOKING_HISTORY_SQL = """
+    SELECT a.service, a.date, s.category
+    FROM appointments a
+    JOIN services s ON a.service_id = s.id
+    WHERE a.user_id = ? AND a.status = 'booked'
+    ORDER BY a.date DESC
+"""
+
+SERVICES_SQL = """
+    SELECT id, name, category, price, duration, description
+    FROM services
+    ORDER BY category, name
+"""
+
+# Ranked from idx_appointments_service_id alone; only the top services are read
+POPULAR_SERVICES_SQL = """
+    SELECT s.id, s.name, s.category, s.price, s.duration, s.description
+    FROM services s
+    WHERE s.id IN (
+        SELECT service_id FROM appointments
+        WHERE service_id IS NOT NULL
+        GROUP BY service_id
+        ORDER BY COUNT(*) DESC
+        LIMIT ?
+    )
+    ORDER BY (SELECT COUNT(*) FROM appointments a WHERE a.service_id = s.id) DESC
+"""
+
+# Two favourite categories, the user id, then the first day counted as recent
+RECOMMENDED_SERVICES_SQL = """
+    SELECT s.id, s.name, s.category, s.price, s.duration, s.description
+    FROM services s
+    WHERE s.category IN (?, ?)
+    AND s.id NOT IN (
+        SELECT service_id
+        FROM appointments
+        WHERE user_id = ? AND date > ? AND service_id IS NOT NULL
+    )
+    ORDER BY RANDOM()
+    LIMIT ?
+"""
+
+def _fetch(conn, sql, params):
+    """Execute a cached statement and return plain tuples"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params).fetchall()
+
+def get_user_id(conn, phone):
+    rows = _fetch(conn, USER_ID_BY_PHONE_SQL, (phone,))
+    return rows[0][0] if rows else None
+
+def get_user(conn, user_id):
+    rows = _fetch(conn, USER_BY_ID_SQL, (user_id,))
+    return User(*rows[0]) if rows else None
+
+def get_user_appointments(conn, user_id):
+    return Appointment.from_rows(_fetch(conn, USER_APPOINTMENTS_SQL, (user_id,)))
+
+def get_user_by_phone(conn, phone):
+    rows = _fetch(conn, USER_BY_PHONE_SQL, (phone,))
+    return User(*rows[0]) if rows else None
+
+def get_user_appointment_statuses(conn, user_id):
+    return [row[0] for row in _fetch(conn, USER_APPOINTMENT_STATUSES_SQL, (user_id,))]
+
+def find_user_appointments(conn, user_id, status=None, date_from=None, date_to=None, order='date', descending=False,
+                           after=None, limit=None):
+    """A user's appointments filtered and sorted in SQL.
+
+    status and the inclusive "YYYY-MM-DD" date bounds are optional;
+    order is 'date' (date, then time) or 'time' (time, then date).
+    after is the appointment_key of the last row of the previous page.
+    """
+    if after and order == 'date':
+        if descending:
+            date_to = min(date_to, after[0]) if date_to else after[0]
+        else:
+            date_from = max(date_from, after[0]) if date_from else after[0]
+    sql = filtered_appointments_sql(status, date_from, date_to, order, descending, after, limit)
+    params = [user_id] + [value for value in (status, date_from, date_to) if value]
+    if after:
+        params += [after[0]] * (order == 'time') + list(after)
+    if limit:
+        params.append(limit)
+    return Appointment.from_rows(_fetch(conn, sql, params))
+
+def appointment_key(appointment, order='date'):
+    """Page key of an appointment for find_user_appointments(after=...)"""
+    if order == 'time':
+        return (appointment.time, appointment.date, appointment.id)
+    return (appointment.date, appointment.time, appointment.id)
+
+def get_services_page(conn, after=None, limit=20):
+    """Services by category and name; after is the (category, name, id) of the previous page's last row"""
+    if after:
+        return Service.from_rows(_fetch(conn, SERVICES_PAGE_AFTER_SQL, (*after, limit)))
+    return Service.from_rows(_fetch(conn, SERVICES_PAGE_SQL, (limit,)))
+
+def get_users_page(conn, search=None, before=None, limit=25):
+    """Users newest first; before is the (created_at, id) of the previous page's last row"""
+    if before:
+        return UserListEntry.from_rows(_fetch(conn, USERS_PAGE_BEFORE_SQL, (search or None, *before, limit)))
+    return UserListEntry.from_rows(_fetch(conn, USERS_PAGE_SQL, (search or None, limit)))
+
+def get_booking_history(conn, user_id):
+    return BookingHistoryEntry.from_rows(_fetch(conn, BOOKING_HISTORY_SQL, (user_id,)))
+
+def get_services(conn):
+    return Service.from_rows(_fetch(conn, SERVICES_SQL, ()))
+
+def get_popular_services(conn, limit=5):
+    """Most-booked services first, filled up from the catalog while few have been booked"""
+    services = Service.from_rows(_fetch(conn, POPULAR_SERVICES_SQL, (limit,)))
+    if len(services) < limit:
+        booked = [service.id for service in services]
+        services += Service.from_rows(_fetch(conn, f"""
+            SELECT id, name, category, price, duration, description FROM services
+            WHERE id NOT IN ({', '.join('?' * len(booked))})
+            ORDER BY id LIMIT ?
+        """, (*booked, limit - len(services))))
+    return services
+
+def get_recommended_services(conn, categories, user_id, limit=5, since=None):
+    """Services in up to two favourite categories not booked since `since` (default: 30 days ago)"""
+    first, second = (list(categories) + [None, None])[:2]
+    since = since or (date.today() - timedelta(days=30)).strftime("%Y-%m-%d")
+    return Service.from_rows(_fetch(conn, RECOMMENDED_SERVICES_SQL, (first, second, user_id, since, limit)))
+
+# Write intents. Each runs on the single writer connection (see
+# write_queue.py) inside a transaction the writer commits, so none of
+# them call commit() themselves.
+
+def register_user(conn, name, phone):
+    """Create a user; False if the phone number is already registered"""
+    try:
+        conn.execute("INSERT INTO users (name, phone, loyalty_points) VALUES (?, ?, 0)", (name, phone))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+def get_or_register_user(conn, name, phone):
+    """Return (user, created): the user with this phone, registering them first if needed"""
+    created = conn.execute(
+        "INSERT OR IGNORE INTO users (name, phone, loyalty_points) VALUES (?, ?, 0)", (name, phone)
+    ).rowcount == 1
+    return get_user_by_phone(conn, phone), created
+
+def add_loyalty_points(conn, user_id, points):
+    conn.execute("UPDATE users SET loyalty_points = loyalty_points + ? WHERE id = ?", (points, user_id))
+
+def book_appointment(conn, user_id, service, date, time, points=0):
+    """Insert a booking and award points together.
+
+    Duplicates are rejected by idx_appointments_unique_booking rather than
+    a pre-read; returns False (and awards nothing) for a duplicate.
+    """
+    try:
+        conn.execute("""
+            INSERT INTO appointments (user_id, service, service_id, duration, date, time)
+            VALUES (?1, ?2,
+                    (SELECT id FROM services WHERE name = ?2 ORDER BY id LIMIT 1),
+                    (SELECT duration FROM services WHERE name = ?2 ORDER BY id LIMIT 1),
+                    ?3, ?4)
+        """, (user_id, service, date, time))
+    except sqlite3.IntegrityError:
+        return False
+    if points:
+        add_loyalty_points(conn, user_id, points)
+    return True
+
+def book_appointments(conn, user_id, bookings, points=0):
+    """Insert a series of (service_id, service, date, time) bookings and award points once.
+
+    Callers check for duplicates first: one duplicate fails the whole
+    executemany, and the writer rolls the series back.
+    """
+    conn.executemany("""
+        INSERT INTO appointments (user_id, service, service_id, duration, date, time)
+        VALUES (?1, ?2, ?3, (SELECT duration FROM services WHERE id = ?3), ?4, ?5)
+    """, [(user_id, service, service_id, date, time) for service_id, service, date, time in bookings])
+    if points:
+        add_loyalty_points(conn, user_id, points)
+
+def cancel_appointment(conn, appointment_id, points=0):
+    """Cancel a booked appointment and adjust its owner's points together.
+
+    Returns False if the appointment was not booked (already cancelled).
+    """
+    cursor = conn.execute(
+        "UPDATE appointments SET status = 'cancelled' WHERE id = ? AND status = 'booked'",
+        (appointment_id,),
+    )
+    if cursor.rowcount == 0:
+        return False
+    if points:
+        conn.execute("""
+            UPDATE users SET loyalty_points = loyalty_points + ?
+            WHERE id = (SELECT user_id FROM appointments WHERE id = ?)
+        """, (points, appointment_id))
+    return True
+
+def reschedule_appointment(conn, appointment_id, date, time):
+    """Move a booked appointment; False if the user already has that service then"""
+    try:
+        cursor = conn.execute(
+            "UPDATE appointments SET date = ?, time = ? WHERE id = ? AND status = 'booked'",
+            (date, time, appointment_id),
+        )
+    except sqlite3.IntegrityError:
+        return False
+    return cursor.rowcount == 1
+
+def add_service(conn, name, price, duration, description, category):
+    conn.execute(
+        "INSERT INTO services (name, price, duration, description, category) VALUES (?, ?, ?, ?, ?)",
+        (name, price, duration, description, category),
+    )
+
+def update_service(conn, service_id, name, price, duration, description, category):
+    conn.execute("""
+        UPDATE services
+        SET name = ?, price = ?, duration = ?, description = ?, category = ?
+        WHERE id = ?
+    """, (name, price, duration, description, category, service_id))
+
+def delete_service(conn, service_id):
+    conn.execute("DELETE FROM services WHERE id = ?", (service_id,))
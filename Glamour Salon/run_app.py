@@ -28,8 +28,10 @@ def main():
     # Initialize the database
     try:
         print("🔧 Initializing database...")
-        from app_restored import init_db
-        init_db()
+        # Import the data layer only; importing the Streamlit script would
+        # execute its page setup outside of a Streamlit session.
+        from branches import get_router
+        get_router().ensure_ready()
         print("✅ Database initialized successfully")
     except Exception as e:
         print(f"❌ Error initializing database: {e}")
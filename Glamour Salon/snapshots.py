@@ -0,0 +1,94 @@
+"""
+Read-only snapshots for admin reporting.
+
+Heavy admin reports read from a copy of the branch database made with
+the SQLite online backup API, so they never hold long read transactions
+on the live file (which would stall WAL checkpoints while bookings are
+being written). A snapshot is refreshed on demand once it is older than
+max_age seconds.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from database import DB_PATH, PerDatabase, get_pool
+from query_stats import InstrumentedConnection
+
+def snapshot_path(db_path):
+    """salon.db -> salon.snapshot.db"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.snapshot{ext or '.db'}"
+
+class Snapshot:
+    def __init__(self, db_path=DB_PATH, max_age=300):
+        self.db_path = db_path
+        self.path = snapshot_path(db_path)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    @property
+    def refreshed_at(self):
+        """Modification time of the snapshot file, or None if there is none yet"""
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def age(self):
+        refreshed_at = self.refreshed_at
+        return None if refreshed_at is None else time.time() - refreshed_at
+
+    def is_stale(self):
+        age = self.age()
+        return age is None or age > self.max_age
+
+    def refresh(self):
+        """Copy the live database into a temp file, then swap it in atomically"""
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            dest = sqlite3.connect(tmp_path)
+            try:
+                with get_pool(self.db_path).connection() as source:
+                    source.backup(dest)
+                # Readers open the snapshot read-only, which WAL mode does not allow
+                dest.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dest.close()
+            try:
+                os.replace(tmp_path, self.path)
+            except PermissionError as e:
+                # Windows refuses while a report still has the old file open;
+                # keep serving it and try again on the next read
+                print(f"Snapshot refresh deferred: {e}")
+                os.remove(tmp_path)
+
+    def refresh_if_stale(self):
+        if self.is_stale():
+            self.refresh()
+
+    @contextmanager
+    def connection(self):
+        """Read-only connection to a fresh-enough snapshot.
+
+        Connections are not pooled: a refresh replaces the file, and a
+        pooled connection would keep reading the old one.
+        """
+        self.refresh_if_stale()
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+            factory=InstrumentedConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+_snapshots = PerDatabase(Snapshot)
+
+def get_snapshot(db_path=DB_PATH):
+    """Return the process-wide snapshot for a database file"""
+    return _snapshots.get(db_path)
@@ -0,0 +1,158 @@
+"""
+Stylist assignment for bookings.
+
+Each stylist has skills by service category. A booking goes to a
+qualified stylist who is free for its whole duration, and among those
+to the one with the least idle time around it (best fit). Long gaps
+then stay whole for long services instead of being chipped into pieces
+nobody can use. Ties go to the stylist with the lighter day.
+
+assign_booking runs as a booking hook inside the booking's own
+transaction. assign_day re-places a whole day from scratch, earliest
+start first. Both work on one indexed read of the day's bookings.
+"""
+
+from bisect import bisect_left, insort
+
+import availability
+import repository
+
+class Stylist(repository.Record):
+    __slots__ = ('id', 'name', 'skills')
+
+ACTIVE_STYLISTS_SQL = """
+    SELECT st.id, st.name, GROUP_CONCAT(sk.category)
+    FROM stylists st
+    LEFT JOIN stylist_skills sk ON sk.stylist_id = st.id
+    WHERE st.active = 1
+    GROUP BY st.id
+    ORDER BY st.id
+"""
+
+DAY_ASSIGNMENTS_SQL = """
+    SELECT a.id, a.stylist_id, a.time, COALESCE(a.duration, s.duration), s.category
+    FROM appointments a
+    LEFT JOIN services s ON s.id = a.service_id
+    WHERE a.date = ? AND a.status = 'booked'
+"""
+
+def get_stylists(conn):
+    """Active stylists, skills as a frozenset of service categories"""
+    return [
+        Stylist(stylist_id, name, frozenset(skills.split(',')) if skills else frozenset())
+        for stylist_id, name, skills in conn.execute(ACTIVE_STYLISTS_SQL).fetchall()
+    ]
+
+class Schedule:
+    """One stylist's busy intervals for a day, in minutes, sorted by start"""
+    __slots__ = ('intervals', 'busy')
+
+    def __init__(self):
+        self.intervals = []
+        self.busy = 0
+
+    def add(self, start, end):
+        insort(self.intervals, (start, end))
+        self.busy += end - start
+
+    def idle_around(self, start, end, day_start, day_end):
+        """Idle minutes either side of [start, end), or None if the stylist is busy then"""
+        i = bisect_left(self.intervals, (start, end))
+        previous_end = self.intervals[i - 1][1] if i else day_start
+        next_start = self.intervals[i][0] if i < len(self.intervals) else day_end
+        if previous_end > start or next_start < end:
+            return None
+        return (start - previous_end) + (next_start - end)
+
+def best_fit(schedules, stylists, category, start, end, rules):
+    """The qualified, free stylist leaving the least idle time around the booking"""
+    best_key = best = None
+    for stylist in stylists:
+        if category not in stylist.skills:
+            continue
+        schedule = schedules[stylist.id]
+        idle = schedule.idle_around(start, end, rules.open_minute, rules.close_minute)
+        if idle is None:
+            continue
+        key = (idle, schedule.busy, stylist.id)
+        if best_key is None or key < best_key:
+            best_key, best = key, stylist
+    return best
+
+def _day_bookings(conn, date):
+    bookings = []
+    for appointment_id, stylist_id, time, duration, category in conn.execute(DAY_ASSIGNMENTS_SQL, (date,)):
+        try:
+            start = availability.to_minutes(time)
+        except ValueError:
+            continue
+        bookings.append((appointment_id, stylist_id, start, start + (duration or availability.DEFAULT_DURATION), category))
+    return bookings
+
+def assign_booking(conn, rules, appointment_id):
+    """Booking hook: put a new or moved booking on the best-fitting stylist.
+
+    Leaves the booking unassigned (stylist_id NULL) when no qualified
+    stylist is free; chair capacity, not staffing, decides whether a
+    booking is accepted.
+    """
+    row = conn.execute("SELECT date FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+    stylists = get_stylists(conn)
+    if row is None or not stylists:
+        return None
+    schedules = {stylist.id: Schedule() for stylist in stylists}
+    target = None
+    for booking_id, stylist_id, start, end, category in _day_bookings(conn, row[0]):
+        if booking_id == appointment_id:
+            target = (category, start, end)
+        elif stylist_id in schedules:
+            schedules[stylist_id].add(start, end)
+    if target is None:
+        return None
+    stylist = best_fit(schedules, stylists, *target, rules)
+    conn.execute(
+        "UPDATE appointments SET stylist_id = ? WHERE id = ?",
+        (stylist.id if stylist else None, appointment_id),
+    )
+    return stylist
+
+def plan_day(stylists, bookings, rules):
+    """Assign (id, start, end, category) bookings from scratch; returns {appointment_id: stylist_id or None}"""
+    schedules = {stylist.id: Schedule() for stylist in stylists}
+    plan = {}
+    # Earliest start first, longer bookings first on ties
+    for appointment_id, start, end, category in sorted(bookings, key=lambda b: (b[1], b[1] - b[2])):
+        stylist = best_fit(schedules, stylists, category, start, end, rules)
+        if stylist is not None:
+            schedules[stylist.id].add(start, end)
+        plan[appointment_id] = stylist.id if stylist else None
+    return plan
+
+def assign_day(conn, rules, date):
+    """Write intent: re-place a whole day's bookings; returns (assigned, unassigned)"""
+    bookings = [
+        (appointment_id, start, end, category)
+        for appointment_id, _, start, end, category in _day_bookings(conn, date)
+    ]
+    plan = plan_day(get_stylists(conn), bookings, rules)
+    conn.executemany(
+        "UPDATE appointments SET stylist_id = ? WHERE id = ?",
+        [(stylist_id, appointment_id) for appointment_id, stylist_id in plan.items()],
+    )
+    assigned = sum(1 for stylist_id in plan.values() if stylist_id is not None)
+    return assigned, len(plan) - assigned
+
+def add_stylist(conn, name, skills):
+    """Write intent: add a stylist with skills in the given service categories"""
+    stylist_id = conn.execute("INSERT INTO stylists (name) VALUES (?)", (name,)).lastrowid
+    conn.executemany(
+        "INSERT INTO stylist_skills (stylist_id, category) VALUES (?, ?)",
+        [(stylist_id, category) for category in skills],
+    )
+    return stylist_id
+
+def deactivate_stylist(conn, stylist_id):
+    """Write intent: stop assigning new bookings to a stylist"""
+    conn.execute("UPDATE stylists SET active = 0 WHERE id = ?", (stylist_id,))
+
+availability.BOOKING_HOOKS.append(assign_booking)
@@ -6,6 +6,31 @@ This script tests the database functionality and displays basic information.
 
 import sqlite3
 import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+@contextmanager
+def salon_db(name, clients=()):
+    """A migrated database in a temporary directory, with its writer and clients registered in order.
+
+    Yields (db_path, writer); the writer is stopped on exit.
+    """
+    from database import init_db
+    from write_queue import WriteQueue
+    import repository
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, name)
+        init_db(db_path)
+        writer = WriteQueue(db_path)
+        try:
+            for client_name, phone in clients:
+                writer.run(repository.register_user, client_name, phone)
+            yield db_path, writer
+        finally:
+            writer.stop()
 
 def test_database():
     """Test database connectivity and show basic information."""
@@ -61,6 +86,913 @@ def test_database():
         print(f"❌ Database test failed: {e}")
         return False
 
+def test_connection_pool():
+    """Test that the connection pool reuses connections and stays bounded."""
+    print("🔌 Testing Connection Pool...")
+    from database import ConnectionPool
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'pool.db'), max_size=3)
+
+        # Sequential borrows reuse the same connection
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        assert first is second, "Pool should hand back the idle connection"
+
+        # Concurrent borrows never exceed max_size
+        def worker():
+            for _ in range(20):
+                with pool.connection() as conn:
+                    conn.execute("SELECT 1").fetchone()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert pool._created <= 3, f"Pool opened {pool._created} connections"
+        pool.close_all()
+
+    print("  ✅ Pool reuses connections and respects max_size")
+    return True
+
+def hot_queries():
+    """Hot queries issued by the app, with representative parameters"""
+    import availability
+    import repository
+    return {
+        "get_user_appointments": (repository.USER_APPOINTMENTS_SQL, (1,)),
+        "popular services": (repository.POPULAR_SERVICES_SQL, (5,)),
+        "recommended services": (repository.RECOMMENDED_SERVICES_SQL, ("Hair", "Nails", 1, "2000-01-01", 5)),
+        "booking history": (repository.BOOKING_HISTORY_SQL, (1,)),
+        "filtered appointments": (
+            repository.filtered_appointments_sql(True, True, True, 'date', True),
+            (1, "booked", "2030-01-01", "2030-01-31"),
+        ),
+        "slot lookup": ("""
+            SELECT COUNT(*) FROM appointments
+            WHERE date = ? AND time = ? AND status = 'booked'
+        """, ("2030-01-01", "10:00")),
+        "occupancy window": (availability.OCCUPANCY_WINDOW_SQL, ("2030-01-01", "2030-01-15")),
+        "appointments page": (
+            repository.filtered_appointments_sql(False, True, False, 'date', True, True, True),
+            (1, "2030-01-01", "2030-02-01", "2030-02-01", "10:00", 99, 10),
+        ),
+        "appointments page by time": (
+            repository.filtered_appointments_sql(False, False, False, 'time', False, True, True),
+            (1, "10:00", "10:00", "2030-02-01", 99, 10),
+        ),
+    }
+
+def test_query_plans():
+    """Test that migrations run and every hot query is served by an index."""
+    print("🗂️ Testing Migrations & Query Plans...")
+    from database import migrate, get_schema_version, SCHEMA_VERSION
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'plans.db'))
+        migrate(conn)
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        # Running again is a no-op
+        assert migrate(conn) == []
+
+        for name, (query, params) in hot_queries().items():
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+            # Any table or plain index scan grows with the data; only covering index scans pass
+            full_scans = [step for step in plan if step.startswith("SCAN ") and "COVERING INDEX" not in step]
+            assert not full_scans, f"{name} scans a table: {plan}"
+            print(f"  ✅ {name}: {' | '.join(plan)}")
+        conn.close()
+
+    return True
+
+def test_service_id_backfill():
+    """Test that the service_id migration backfills history and survives renames."""
+    print("🔗 Testing Service ID Migration...")
+    from database import MIGRATIONS, migrate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'backfill.db'))
+        # Build a version 2 database holding name-only appointments
+        for version, migration in MIGRATIONS[:2]:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("INSERT INTO services (name, price, duration, category) VALUES ('Manicure', 499, 45, 'Nails')")
+        conn.execute("INSERT INTO appointments (user_id, service, date, time) VALUES (1, 'Manicure', '2030-01-01', '10:00')")
+        conn.commit()
+
+        migrate(conn)
+        conn.execute("UPDATE services SET name = 'Classic Manicure' WHERE name = 'Manicure'")
+        row = conn.execute("""
+            SELECT s.name FROM appointments a JOIN services s ON a.service_id = s.id
+        """).fetchone()
+        assert row is not None and row[0] == 'Classic Manicure', row
+        conn.close()
+
+    print("  ✅ Appointments keep their service after a rename")
+    return True
+
+def test_duplicate_booking_cleanup():
+    """Test that migration 4 cancels duplicate bookings and takes back their points."""
+    print("🧹 Testing Duplicate Booking Cleanup...")
+    from database import MIGRATIONS, migrate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'duplicates.db'))
+        # Build a version 3 database where one booking was saved three times
+        for version, migration in MIGRATIONS[:3]:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("INSERT INTO users (name, phone, loyalty_points) VALUES ('Ann', '1234567890', 35)")
+        conn.executemany(
+            "INSERT INTO appointments (user_id, service, date, time) VALUES (1, 'Manicure', '2030-01-01', ?)",
+            [('10:00',), ('10:00',), ('10:00',), ('11:00',)],
+        )
+        conn.commit()
+
+        migrate(conn)
+        booked = conn.execute("SELECT id FROM appointments WHERE status = 'booked' ORDER BY id").fetchall()
+        assert booked == [(1,), (4,)], booked
+        assert conn.execute("SELECT appointment_id, user_id FROM cancelled_duplicate_bookings ORDER BY 1").fetchall() == [(2, 1), (3, 1)]
+        assert conn.execute("SELECT loyalty_points FROM users").fetchone()[0] == 15
+        conn.close()
+
+    print("  ✅ Duplicates cancelled, points reversed and recorded")
+    return True
+
+def test_write_queue():
+    """Test that the single writer group-commits and isolates failing intents."""
+    print("✍️ Testing Write Queue...")
+    import repository
+
+    with salon_db('writes.db') as (db_path, writer):
+        assert writer.run(repository.register_user, "Ann", "1234567890") is True
+        assert writer.run(repository.register_user, "Ann", "1234567890") is False
+
+        def fail(conn):
+            conn.execute("UPDATE users SET loyalty_points = 999")
+            raise ValueError("rejected")
+
+        futures = [writer.submit(repository.add_loyalty_points, 1, 1) for _ in range(200)]
+        failed = writer.submit(fail)
+        for future in futures:
+            future.result(timeout=10)
+        try:
+            failed.result(timeout=10)
+            assert False, "Failing intent should raise"
+        except ValueError:
+            pass
+
+        conn = sqlite3.connect(db_path)
+        points = conn.execute("SELECT loyalty_points FROM users WHERE id = 1").fetchone()[0]
+        conn.close()
+        assert points == 200, points
+        assert writer.batches < writer.intents, "Intents should share commits"
+
+    print(f"  ✅ {writer.intents} intents committed in {writer.batches} batches")
+    return True
+
+def test_atomic_booking():
+    """Test that booking and cancelling adjust points exactly once."""
+    print("🎟️ Testing Atomic Booking...")
+    import repository
+
+    with salon_db('booking.db', [("Ann", "1234567890")]) as (db_path, writer):
+        booking = (1, "Manicure", "2030-01-01", "10:00", 10)
+        assert writer.run(repository.book_appointment, *booking) is True
+        # Replayed booking is rejected by the partial unique index
+        assert writer.run(repository.book_appointment, *booking) is False
+        assert writer.run(repository.cancel_appointment, 1, -5) is True
+        assert writer.run(repository.cancel_appointment, 1, -5) is False
+        # The slot can be booked again once the first booking is cancelled
+        assert writer.run(repository.book_appointment, *booking) is True
+
+        conn = sqlite3.connect(db_path)
+        points = conn.execute("SELECT loyalty_points FROM users WHERE id = 1").fetchone()[0]
+        conn.close()
+        assert points == 15, points
+
+    print("  ✅ Duplicates and repeat cancellations leave points untouched")
+    return True
+
+def test_branch_router():
+    """Test that branches write to separate files and scatter-gather reads them all."""
+    print("🏬 Testing Branch Router...")
+    from branches import Branch, BranchRouter
+    import repository
+
+    with tempfile.TemporaryDirectory() as tmp:
+        router = BranchRouter([
+            Branch('north', "North", os.path.join(tmp, 'north.db')),
+            Branch('south', "South", os.path.join(tmp, 'south.db')),
+        ])
+        router.ensure_ready()
+        router.writer('north').run(repository.register_user, "Ann", "1234567890")
+        router.writer('south').run(repository.register_user, "Bea", "1234567891")
+        router.writer('south').run(repository.register_user, "Cat", "1234567892")
+
+        counts = router.scatter_gather(
+            lambda branch, conn: conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        )
+        assert counts == {'north': 1, 'south': 2}, counts
+        # Unknown branch ids fall back to the default branch
+        assert router.db_path('missing') == router.db_path('north')
+        for branch_id in router.branches:
+            router.writer(branch_id).stop()
+
+    print("  ✅ Branch databases are isolated and gathered correctly")
+    return True
+
+def test_snapshot():
+    """Test that admin snapshots are read-only copies refreshed on demand."""
+    print("📸 Testing Reporting Snapshot...")
+    from snapshots import Snapshot
+    import repository
+
+    with salon_db('live.db', [("Ann", "1234567890")]) as (db_path, writer):
+        snapshot = Snapshot(db_path, max_age=300)
+        assert snapshot.is_stale()
+        with snapshot.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+            try:
+                conn.execute("DELETE FROM users")
+                assert False, "Snapshot should be read-only"
+            except sqlite3.OperationalError:
+                pass
+
+        # New writes only show up after the next refresh
+        writer.run(repository.register_user, "Bea", "1234567891")
+        with snapshot.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        snapshot.refresh()
+        with snapshot.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+
+    print("  ✅ Snapshot is isolated from the live database")
+    return True
+
+def test_query_stats():
+    """Test that statements are timed, tagged and written to the slow log."""
+    print("⏱️ Testing Query Instrumentation...")
+    import query_stats
+    from database import init_db, get_pool
+    import repository
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stats.db')
+        init_db(db_path)
+        saved = query_stats.SLOW_QUERY_MS, query_stats.SLOW_QUERY_LOG
+        query_stats.SLOW_QUERY_MS = 0
+        query_stats.SLOW_QUERY_LOG = os.path.join(tmp, 'slow.jsonl')
+        try:
+            query_stats.reset_stats()
+
+            def load_popular_services():
+                with get_pool(db_path).connection() as conn:
+                    return repository.get_popular_services(conn)
+
+            load_popular_services()
+            stats = query_stats.get_stats()
+            # The ranking and, with nothing booked yet, the catalog fill-up
+            assert [row['function'] for row in stats] == ['load_popular_services'] * 2, stats
+            assert all(row['calls'] == 1 and row['p99_ms'] >= row['p50_ms'] for row in stats), stats
+
+            slow = query_stats.read_slow_log(path=query_stats.SLOW_QUERY_LOG)
+            assert slow and all(entry['function'] == 'load_popular_services' for entry in slow), slow
+            assert any('idx_appointments_service_id' in step for entry in slow for step in entry['plan']), slow
+
+            # Batches are explained with their first parameter row
+            with get_pool(db_path).connection() as conn:
+                conn.executemany("UPDATE services SET price = ? WHERE id = ?", ((price, 1) for price in (100, 200)))
+                conn.rollback()
+            slow = query_stats.read_slow_log(path=query_stats.SLOW_QUERY_LOG)
+            assert slow[0]['params'] == "(100, 1)", slow[0]
+            assert slow[0]['plan'] and not slow[0]['plan'][0].startswith("plan unavailable"), slow[0]['plan']
+        finally:
+            query_stats.SLOW_QUERY_MS, query_stats.SLOW_QUERY_LOG = saved
+            query_stats.reset_stats()
+
+    print("  ✅ Queries are tagged by caller and slow ones carry their plan")
+    return True
+
+def test_availability():
+    """Test that bookings respect chair capacity and service durations."""
+    print("🪑 Testing Slot Availability...")
+    from datetime import datetime
+    import availability
+
+    with salon_db('availability.db', [("Ann", "9000000000"), ("Bob", "9000000001"), ("Cat", "9000000002")]) as (db_path, writer):
+        rules = availability.BookingRules(chairs=2, closed_weekdays=[6])
+
+        def book(user_id, service, time):
+            return writer.run(availability.book_if_available, rules, user_id, service, "2030-01-01", time)
+
+        # Two 120-minute colorings overlap at 11:00-12:00, filling both chairs
+        assert book(1, "Hair Coloring", "10:00") == availability.BOOKED
+        assert book(2, "Hair Coloring", "11:00") == availability.BOOKED
+        assert book(3, "Eyebrow Threading", "11:30") == availability.FULL
+        assert book(3, "Eyebrow Threading", "10:00") == availability.BOOKED
+        assert book(1, "Hair Coloring", "10:00") == availability.DUPLICATE
+
+        engine = availability.AvailabilityEngine(db_path, rules)
+        free = engine.free_slots("2030-01-01", 30)
+        assert "10:00" not in free and "11:30" not in free and "12:00" in free, free
+        assert not engine.is_free("2030-01-01", "10:30", 120)
+        # A 120-minute service must finish by closing time
+        assert engine.free_slots("2030-01-01", 120)[-1] == "17:00"
+        # 2030-01-06 is a Sunday
+        assert engine.free_slots("2030-01-06", 30) == []
+
+        # Starts that have gone by are refused on every write path, with no points
+        afternoon = datetime(2030, 1, 2, 15, 0)
+        assert writer.run(availability.book_if_available, rules, 3, "Manicure", "2030-01-02", "09:00", 10, afternoon) == availability.PAST
+        assert writer.run(availability.book_if_available, rules, 3, "Manicure", "2030-01-01", "15:00", 10, afternoon) == availability.PAST
+        assert writer.run(availability.book_if_available, rules, 3, "Manicure", "2030-01-02", "15:00", 10, afternoon) == availability.BOOKED
+        series = [("Pedicure", "2030-01-02", "14:00"), ("Pedicure", "2030-01-03", "14:00")]
+        assert writer.run(availability.book_many_if_available, rules, 3, series, 10, afternoon) == series[:1]
+        assert writer.run(availability.reschedule_if_available, rules, 1, "2030-01-02", "10:00", 0, afternoon) == availability.PAST
+        conn = sqlite3.connect(db_path)
+        points = conn.execute("SELECT loyalty_points FROM users WHERE id = 3").fetchone()[0]
+        conn.close()
+        assert points == 10, points
+
+    print("  ✅ Full slots are rejected and hidden from the booking page")
+    return True
+
+def test_next_available_slot():
+    """Test that the slot finder skips past, full and too-short openings."""
+    print("🔎 Testing Next Available Slot...")
+    from datetime import datetime
+    from database import init_db, get_pool
+    import availability
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'next_slot.db')
+        init_db(db_path)
+        rules = availability.BookingRules(chairs=1)
+        # 2030-01-01 is fully booked apart from 18:30
+        with get_pool(db_path).connection() as conn:
+            conn.executemany(
+                "INSERT INTO appointments (user_id, service, date, time) VALUES (1, 'Eyebrow Threading', '2030-01-01', ?)",
+                [(rules.slot_time(i),) for i in range(rules.slots_per_day - 1)],
+            )
+            availability.rebuild_occupancy(conn, rules)
+            conn.commit()
+
+        engine = availability.AvailabilityEngine(db_path, rules)
+        morning = datetime(2030, 1, 1, 8, 0)
+        assert engine.next_available(30, now=morning) == ("2030-01-01", "18:30")
+        # A 60-minute service no longer fits before closing
+        assert engine.next_available(60, now=morning) == ("2030-01-02", "09:00")
+        # Slots already in the past are skipped
+        assert engine.next_available(30, now=datetime(2030, 1, 2, 10, 10)) == ("2030-01-02", "10:30")
+        assert engine.next_available(30, days=1, now=datetime(2030, 1, 1, 18, 45)) is None
+
+    print("  ✅ Earliest fitting slot found across the booking window")
+    return True
+
+def test_occupancy():
+    """Test that occupancy tracks bookings and cancellations and can be rebuilt."""
+    print("📊 Testing Materialized Occupancy...")
+    import availability
+    import repository
+
+    with salon_db('occupancy.db', [("Ann", "1234567890")]) as (db_path, writer):
+        rules = availability.BookingRules()
+
+        def occupancy():
+            conn = sqlite3.connect(db_path)
+            rows = conn.execute("SELECT date, slot, booked_count FROM occupancy WHERE booked_count > 0 ORDER BY 1, 2").fetchall()
+            conn.close()
+            return rows
+
+        # A 120-minute coloring at 10:00 covers slots 2-5
+        assert writer.run(availability.book_if_available, rules, 1, "Hair Coloring", "2030-01-01", "10:00") == availability.BOOKED
+        assert writer.run(availability.book_if_available, rules, 1, "Manicure", "2030-01-01", "11:00") == availability.BOOKED
+        # ...and a 45-minute manicure at 11:00 covers slots 4-5
+        assert occupancy() == [("2030-01-01", 2, 1), ("2030-01-01", 3, 1),
+                               ("2030-01-01", 4, 2), ("2030-01-01", 5, 2)], occupancy()
+        assert writer.run(availability.cancel_and_release, rules, 1) is True
+        assert writer.run(availability.cancel_and_release, rules, 1) is False
+        incremental = occupancy()
+        assert incremental == [("2030-01-01", 4, 1), ("2030-01-01", 5, 1)], incremental
+
+        # A full rebuild reproduces the incrementally maintained table
+        assert writer.run(availability.rebuild_occupancy, rules) == 2
+        assert occupancy() == incremental
+
+        # A booking keeps its span when its service is shortened or deleted
+        conn = sqlite3.connect(db_path)
+        coloring = conn.execute("SELECT id, name, price, description, category FROM services WHERE name = 'Hair Coloring'").fetchone()
+        conn.close()
+        service_id, name, price, description, category = coloring
+        assert writer.run(availability.book_if_available, rules, 1, "Hair Coloring", "2030-01-01", "10:00") == availability.BOOKED
+        writer.run(repository.update_service, service_id, name, price, 30, description, category)
+        assert writer.run(availability.cancel_and_release, rules, 3) is True
+        assert occupancy() == incremental, occupancy()
+        assert writer.run(availability.book_if_available, rules, 1, "Hair Coloring", "2030-01-01", "10:00") == availability.BOOKED
+        # Booked after the edit, so at the new 30 minutes: slot 2 plus the manicure's 4-5
+        writer.run(repository.delete_service, service_id)
+        assert writer.run(availability.rebuild_occupancy, rules) == 3
+        assert writer.run(availability.cancel_and_release, rules, 4) is True
+        assert occupancy() == incremental, occupancy()
+
+    print("  ✅ Occupancy updated with each booking and rebuilt identically")
+    return True
+
+def test_interval_index():
+    """Test overlap queries and rescheduling against the occupancy rules."""
+    print("📐 Testing Interval Index & Rescheduling...")
+    import random
+    from datetime import datetime
+    from database import get_pool
+    import availability
+    import intervals
+    import repository
+
+    # Overlap lookups agree with a brute-force scan
+    rng = random.Random(7)
+    bookings = []
+    for i in range(200):
+        start = rng.randrange(540, 1140, 15)
+        bookings.append(intervals.Booking(i, i % 5, None, "Service", start, start + rng.choice([30, 45, 60, 120])))
+    day = intervals.DayIntervals("2030-01-01", bookings)
+    for start in range(540, 1140, 25):
+        end = start + 40
+        expected = sorted(b.id for b in bookings if b.start < end and b.end > start)
+        assert sorted(b.id for b in day.overlapping(start, end)) == expected
+
+    with salon_db('intervals.db', [("Ann", "1234567890"), ("Bob", "1234567891")]) as (db_path, writer):
+        rules = availability.BookingRules(chairs=1)
+        assert writer.run(availability.book_if_available, rules, 1, "Hair Coloring", "2030-01-01", "10:00") == availability.BOOKED
+        assert writer.run(availability.book_if_available, rules, 2, "Manicure", "2030-01-01", "12:00") == availability.BOOKED
+
+        index = intervals.IntervalIndex(db_path)
+        assert [b.service for b in index.overlapping("2030-01-01", "11:30", "12:15")] == ["Hair Coloring", "Manicure"]
+        assert [b.end_time for b in index.conflicts("2030-01-01", "11:00", 30, 1)] == ["12:00"]
+        assert index.conflicts("2030-01-01", "11:00", 30, 1, exclude_id=1) == []
+
+        # Shifting into slots the booking already holds is allowed...
+        assert writer.run(availability.reschedule_if_available, rules, 1, "2030-01-01", "09:30") == availability.BOOKED
+        # ...but not into slots another client holds
+        assert writer.run(availability.reschedule_if_available, rules, 1, "2030-01-01", "11:00") == availability.FULL
+        assert writer.run(availability.cancel_and_release, rules, 2) is True
+        assert writer.run(availability.reschedule_if_available, rules, 2, "2030-01-02", "09:00") == availability.NOT_BOOKED
+
+        conn = sqlite3.connect(db_path)
+        moved = conn.execute("SELECT date, time FROM appointments WHERE id = 1").fetchone()
+        occupied = [row[0] for row in conn.execute("SELECT slot FROM occupancy WHERE booked_count > 0 ORDER BY slot")]
+        assert moved == ("2030-01-01", "09:30"), moved
+        assert occupied == [1, 2, 3, 4], occupied
+
+        # The reschedule form offers the slots the booking holds, at the duration it was booked for
+        conn.execute("UPDATE services SET duration = 30 WHERE name = 'Hair Coloring'")
+        conn.commit()
+        with get_pool(db_path).connection() as pooled:
+            held = repository.get_user_appointments(pooled, 1)[0]
+        engine = availability.AvailabilityEngine(db_path, rules)
+        morning = datetime(2030, 1, 1, 8, 0)
+        assert held.duration == 120, held
+        assert engine.free_slots("2030-01-01", held.duration, morning)[:2] == ["11:30", "12:00"]
+        moving = ("2030-01-01", held.time, held.duration)
+        assert engine.free_slots("2030-01-01", held.duration, morning, moving)[:3] == ["09:00", "09:30", "10:00"]
+        conn.close()
+
+    print("  ✅ Overlaps match a full scan and moves keep occupancy in step")
+    return True
+
+def test_series_booking():
+    """Test that a series is booked all or nothing with one points award."""
+    print("🔁 Testing Series Booking...")
+    import availability
+
+    with salon_db('series.db', [("Ann", "1234567890")]) as (db_path, writer):
+        rules = availability.BookingRules(chairs=2)
+
+        # Every four weeks, twelve times
+        monthly = [("Haircut & Styling", f"2030-{m:02d}-01", "10:00") for m in range(1, 13)]
+        assert writer.run(availability.book_many_if_available, rules, 1, monthly, 10) == []
+        # Three services at once need three chairs: the third cannot be placed
+        party = [("Makeup Application", "2030-02-02", "09:00"), ("Manicure", "2030-02-02", "09:00"),
+                 ("Pedicure", "2030-02-02", "09:00")]
+        assert writer.run(availability.book_many_if_available, rules, 1, party, 10) == [party[2]]
+        # Replaying the series is rejected as a whole
+        assert writer.run(availability.book_many_if_available, rules, 1, monthly[:2], 10) == monthly[:2]
+
+        conn = sqlite3.connect(db_path)
+        booked = conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        points = conn.execute("SELECT loyalty_points FROM users WHERE id = 1").fetchone()[0]
+        slots = conn.execute("SELECT COUNT(*) FROM occupancy WHERE booked_count = 1").fetchone()[0]
+        conn.close()
+        assert (booked, points, slots) == (12, 120, 24), (booked, points, slots)
+
+    print("  ✅ Series booked in one transaction; failures leave nothing behind")
+    return True
+
+def test_waitlist():
+    """Test that a cancellation promotes the first waiter who now fits."""
+    print("⏳ Testing Waitlist Backfill...")
+    import availability
+    import waitlist
+
+    with salon_db('waitlist.db', [("Ann", "9000000000"), ("Bob", "9000000001"), ("Cat", "9000000002")]) as (db_path, writer):
+        rules = availability.BookingRules(chairs=1)
+
+        assert writer.run(availability.book_if_available, rules, 1, "Hair Coloring", "2030-01-01", "10:00") == availability.BOOKED
+        join = (rules, 2, "Manicure", "2030-01-01", "11:00", 10)
+        assert writer.run(waitlist.join_waitlist, *join) == waitlist.WAITING
+        assert writer.run(waitlist.join_waitlist, *join) == availability.DUPLICATE
+        assert writer.run(waitlist.join_waitlist, rules, 3, "Manicure", "2030-01-01", "11:00", 10) == waitlist.WAITING
+        # Times that are not slot starts are rejected, not reported as already queued
+        for bad_time in ("08:00", "10:15"):
+            try:
+                writer.run(waitlist.join_waitlist, rules, 3, "Manicure", "2030-01-01", bad_time, 10)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{bad_time} was accepted")
+        # A time that still has room is booked instead of queued
+        assert writer.run(waitlist.join_waitlist, rules, 3, "Pedicure", "2030-01-01", "13:00", 10) == availability.BOOKED
+
+        # Ann cancels: Bob joined first and takes the chair, Cat keeps waiting
+        assert writer.run(availability.cancel_and_release, rules, 1, -5, 10) is True
+
+        conn = sqlite3.connect(db_path)
+        statuses = conn.execute("SELECT user_id, status, appointment_id IS NOT NULL FROM waitlist ORDER BY id").fetchall()
+        booked = conn.execute("SELECT user_id, service, time FROM appointments WHERE status = 'booked' ORDER BY id").fetchall()
+        points = conn.execute("SELECT loyalty_points FROM users ORDER BY id").fetchall()
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + waitlist.WAITERS_IN_SPAN_SQL, ("2030-01-01", 2, 5))]
+        conn.close()
+        assert statuses == [(2, 'promoted', 1), (3, 'waiting', 0)], statuses
+        assert booked == [(3, "Pedicure", "13:00"), (2, "Manicure", "11:00")], booked
+        assert points == [(-5,), (10,), (10,)], points
+        assert any("idx_waitlist_slot" in step for step in plan), plan
+
+        # A 120-minute coloring waiting at 09:30 needs the 10:00 manicure's slots too
+        assert writer.run(availability.book_if_available, rules, 1, "Manicure", "2030-01-02", "10:00") == availability.BOOKED
+        assert writer.run(waitlist.join_waitlist, rules, 2, "Hair Coloring", "2030-01-02", "09:30") == waitlist.WAITING
+        assert writer.run(availability.cancel_and_release, rules, 4) is True
+        conn = sqlite3.connect(db_path)
+        assert waitlist.get_user_waitlist(conn, 2) == []
+        # Past entries drop off the client's list; future ones stay
+        assert [entry.date for entry in waitlist.get_user_waitlist(conn, 3, today="2030-01-01")] == ["2030-01-01"]
+        assert waitlist.get_user_waitlist(conn, 3, today="2030-01-02") == []
+        conn.close()
+
+    print("  ✅ Freed slot handed to the first fitting waiter in the same transaction")
+    return True
+
+def test_stylist_assignment():
+    """Test that bookings go to a free, qualified stylist with the tightest fit."""
+    print("💇 Testing Stylist Assignment...")
+    import availability
+    import stylists
+
+    rules = availability.BookingRules()
+    team = [stylists.Stylist(1, "A", frozenset({"Hair"})), stylists.Stylist(2, "B", frozenset({"Hair", "Nails"}))]
+    schedules = {1: stylists.Schedule(), 2: stylists.Schedule()}
+    schedules[1].add(540, 600)   # A: 09:00-10:00
+    schedules[2].add(720, 780)   # B: 12:00-13:00
+    # 10:00-11:00 fits B's 09:00-12:00 hole more snugly than A's open afternoon
+    assert stylists.best_fit(schedules, team, "Hair", 600, 660, rules).name == "B"
+    assert stylists.best_fit(schedules, team, "Nails", 750, 795, rules) is None
+    plan = stylists.plan_day(team, [(1, 540, 660, "Hair"), (2, 600, 720, "Hair"), (3, 600, 645, "Nails")], rules)
+    assert plan == {1: 1, 2: 2, 3: None}, plan
+
+    with salon_db('stylists.db', [("Ann", "1234567890"), ("Bob", "1234567891")]) as (db_path, writer):
+        # Only Riya does nails: the overlapping second manicure is booked but unassigned
+        for user_id in (1, 2):
+            assert writer.run(availability.book_if_available, rules, user_id, "Manicure", "2030-01-01", "10:00") == availability.BOOKED
+        assert writer.run(availability.book_if_available, rules, 1, "Hair Coloring", "2030-01-01", "11:00") == availability.BOOKED
+        assert writer.run(stylists.assign_day, rules, "2030-01-01") == (2, 1)
+
+        conn = sqlite3.connect(db_path)
+        assigned = conn.execute("""
+            SELECT a.service, st.name FROM appointments a
+            LEFT JOIN stylists st ON st.id = a.stylist_id ORDER BY a.id
+        """).fetchall()
+        conn.close()
+        assert assigned == [("Manicure", "Riya"), ("Manicure", None), ("Hair Coloring", "Anjali")], assigned
+
+    # An existing salon's database is migrated without the sample team
+    from database import MIGRATIONS, init_db
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'existing.db')
+        conn = sqlite3.connect(db_path)
+        MIGRATIONS[0][1](conn)
+        conn.execute("INSERT INTO services (name, price, duration, category) VALUES ('Manicure', 499, 45, 'Nails')")
+        conn.commit()
+        conn.close()
+        init_db(db_path)
+        conn = sqlite3.connect(db_path)
+        counts = conn.execute("SELECT (SELECT COUNT(*) FROM services), (SELECT COUNT(*) FROM stylists)").fetchone()
+        conn.close()
+        assert counts == (1, 0), counts
+
+    print("  ✅ Bookings placed on qualified stylists with the least idle time")
+    return True
+
+def test_idempotency_keys():
+    """Test that a replayed booking request returns the first result and writes nothing."""
+    print("🔑 Testing Idempotency Keys...")
+    import time
+    from datetime import datetime
+    import availability
+    import idempotency
+
+    with salon_db('idempotency.db', [("Ann", "1234567890")]) as (db_path, writer):
+        rules = availability.BookingRules(chairs=1)
+
+        click = (availability.book_if_available, rules, 1, "Manicure", "2030-01-01", "10:00", 10)
+        assert writer.run(idempotency.run_once, "1:click", *click) == availability.BOOKED
+        # A double-click replays the stored outcome instead of reporting a duplicate
+        assert writer.run(idempotency.run_once, "1:click", *click) == availability.BOOKED
+
+        morning = datetime(2030, 1, 1, 8, 0)
+        link = (availability.book_next_available, rules, 1, "Pedicure", morning, 10)
+        first = writer.run(idempotency.run_once, "1:link", *link)
+        assert first == [availability.BOOKED, "2030-01-01", "09:00"], first
+        # Opening the link again answers with the slot booked the first time
+        assert writer.run(idempotency.run_once, "1:link", *link) == first
+
+        # Expired keys are dropped and the request runs again
+        assert writer.run(idempotency.expire_keys, time.time() + idempotency.KEY_TTL_SECONDS + 1) == 2
+        assert writer.run(idempotency.run_once, "1:click", *click) == availability.DUPLICATE
+
+        conn = sqlite3.connect(db_path)
+        booked = conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        points = conn.execute("SELECT loyalty_points FROM users WHERE id = 1").fetchone()[0]
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN DELETE FROM idempotency_keys WHERE created_at < 0"
+        ))
+        conn.close()
+        assert (booked, points) == (2, 20), (booked, points)
+        assert "idx_idempotency_created" in plan, plan
+
+        # A full slot is not stored: the same key books once the chair frees up
+        retry = (availability.book_if_available, rules, 1, "Eyebrow Threading", "2030-01-01", "10:00", 10)
+        assert writer.run(idempotency.run_once, "1:retry", *retry) == availability.FULL
+        assert writer.run(availability.cancel_and_release, rules, 1) is True
+        assert writer.run(idempotency.run_once, "1:retry", *retry) == availability.BOOKED
+
+    print("  ✅ Replays answered from stored results; expired keys evicted by index")
+    return True
+
+def test_appointment_filters():
+    """Test that My Appointments filters and sort orders are applied in SQL."""
+    print("🔎 Testing Appointment Filters...")
+    from database import init_db, get_pool
+    import repository
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'filters.db')
+        init_db(db_path)
+        with get_pool(db_path).connection() as conn:
+            conn.execute("INSERT INTO users (name, phone) VALUES ('Ann', '1234567890')")
+            conn.executemany(
+                "INSERT INTO appointments (user_id, service, date, time, status) VALUES (1, ?, ?, ?, ?)",
+                [("Manicure", "2030-01-05", "11:00", "booked"), ("Pedicure", "2030-01-20", "09:00", "booked"),
+                 ("Facial", "2030-01-10", "10:00", "cancelled"), ("Manicure", "2030-03-01", "09:30", "booked")],
+            )
+            conn.commit()
+
+            def services(**filters):
+                return [a.service for a in repository.find_user_appointments(conn, 1, **filters)]
+
+            assert repository.get_user_appointment_statuses(conn, 1) == ["booked", "cancelled"]
+            assert services() == ["Manicure", "Facial", "Pedicure", "Manicure"]
+            assert services(order='time') == ["Pedicure", "Manicure", "Facial", "Manicure"]
+            assert services(status="booked", date_from="2030-01-05", date_to="2030-01-31", descending=True) == [
+                "Pedicure", "Manicure"]
+            assert services(date_from="2030-02-01") == ["Manicure"]
+
+    print("  ✅ Status, date range and sort order served by one indexed query")
+    return True
+
+def test_keyset_pagination():
+    """Test that keyset pages cover each list exactly once, in order."""
+    print("📄 Testing Keyset Pagination...")
+    from database import init_db, get_pool
+    import repository
+
+    def walk(fetch, key, page_size=3):
+        pages, after = [], None
+        while True:
+            rows = fetch(after, page_size + 1)
+            pages.append(rows[:page_size])
+            if len(rows) <= page_size:
+                return pages
+            after = key(rows[page_size - 1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'pages.db')
+        init_db(db_path)
+        with get_pool(db_path).connection() as conn:
+            conn.executemany("INSERT INTO users (name, phone) VALUES (?, ?)",
+                             [(f"Client {i}", f"90000000{i:02d}") for i in range(11)])
+            # Several bookings share a date and time, so ties fall to the id
+            conn.executemany(
+                "INSERT INTO appointments (user_id, service, date, time) VALUES (1, ?, ?, ?)",
+                [(service, f"2030-01-{day:02d}", time) for day in (1, 2, 3)
+                 for time in ("09:00", "10:00") for service in ("Manicure", "Pedicure")],
+            )
+            conn.commit()
+
+            for order, descending in (('date', False), ('date', True), ('time', False), ('time', True)):
+                everything = repository.find_user_appointments(conn, 1, order=order, descending=descending)
+                pages = walk(
+                    lambda after, limit: repository.find_user_appointments(
+                        conn, 1, date_from="2030-01-01", order=order, descending=descending, after=after, limit=limit),
+                    lambda appointment: repository.appointment_key(appointment, order),
+                )
+                assert [a.id for page in pages for a in page] == [a.id for a in everything], (order, descending)
+                assert len(pages) == 4
+
+            services = walk(lambda after, limit: repository.get_services_page(conn, after, limit),
+                            lambda service: (service.category, service.name, service.id))
+            ordered = conn.execute("SELECT id FROM services ORDER BY category, name, id").fetchall()
+            assert [service.id for page in services for service in page] == [row[0] for row in ordered]
+
+            users = walk(lambda before, limit: repository.get_users_page(conn, None, before, limit),
+                         lambda user: (user.created_at, user.id))
+            assert [user.id for page in users for user in page] == list(range(11, 0, -1))
+            matches = repository.get_users_page(conn, "client 1", limit=25)
+            assert [user.id for user in matches] == [11, 2]
+
+    print("  ✅ Appointments, services and users paged by seek keys with no gaps or repeats")
+    return True
+
+def test_data_version():
+    """Test that data_version moves only when another connection commits."""
+    print("🔄 Testing Data Version Watcher...")
+    from database import data_version, get_pool
+    import repository
+
+    with salon_db('version.db') as (db_path, writer):
+        user, created = writer.run(repository.get_or_register_user, "Ann", "1234567890")
+        assert created and user.name == "Ann" and user.loyalty_points == 0
+
+        version = data_version(db_path)
+        with get_pool(db_path).connection() as conn:
+            assert repository.get_user_by_phone(conn, "1234567890") == user
+        # Reads leave the version alone; any commit moves it
+        assert data_version(db_path) == version
+        writer.run(repository.add_loyalty_points, user.id, 10)
+        assert data_version(db_path) != version
+        assert writer.run(repository.get_or_register_user, "Ann", "1234567890") == (
+            repository.User(user.id, "Ann", "1234567890", 10), False)
+
+    print("  ✅ Cached rows are re-read only after a commit")
+    return True
+
+def test_query_cache():
+    """Test that cached query results are reused until a tracked table changes."""
+    print("🗃️ Testing Query Result Cache...")
+    from database import get_pool
+    from query_cache import QueryCache, table_versions
+    import repository
+
+    with salon_db('cache.db') as (db_path, writer):
+        cache = QueryCache(max_entries=2)
+        sql = "SELECT name, price FROM services ORDER BY name"
+        with get_pool(db_path).connection() as conn:
+            services_version, users_version = table_versions(conn, ('services', 'users'))
+            first = cache.read_sql(conn, ('services',), sql)
+            assert cache.read_sql(conn, ('services',), sql).equals(first)
+            assert (cache.hits, cache.misses) == (1, 1)
+
+            # Triggers bump only the written table's counter
+            service = repository.get_services(conn)[0]
+            writer.run(repository.update_service, service.id, service.name, 1.0,
+                       service.duration, service.description, service.category)
+            assert table_versions(conn, ('services', 'users')) == (services_version + 1, users_version)
+            # An admin's price change is visible on the next read
+            updated = cache.read_sql(conn, ('services',), sql)
+            assert updated.loc[updated['name'] == service.name, 'price'].iloc[0] == 1.0
+            assert cache.misses == 2
+
+            # Loader results are keyed on their arguments; the oldest entry is evicted
+            popular = cache.call(conn, ('appointments', 'services'), repository.get_popular_services, 3)
+            assert len(popular) == 3 and len(cache) == 2
+            assert cache.call(conn, ('appointments', 'services'), repository.get_popular_services, 3) is popular
+            cache.call(conn, ('appointments', 'services'), repository.get_popular_services, 2)
+            cache.read_sql(conn, ('services',), sql)
+            assert (cache.hits, cache.misses) == (2, 5)
+
+    print("  ✅ Results are reused until their tables change, oldest evicted first")
+    return True
+
+def test_card_rendering():
+    """Test that card lists render as one escaped HTML block."""
+    print("🃏 Testing Batched Card Rendering...")
+    import pandas as pd
+    import cards
+    import repository
+
+    services = pd.DataFrame({
+        'name': ["Manicure", "Pedicure", "Cut <b>& Style</b>"],
+        'price': [499.0, 599.0, 799.5],
+        'duration': [45, 60, 90],
+        'description': ["Nail care", None, "Wash & cut"],
+        'category': ["Nails", "Nails", "Hair"],
+    })
+    block = cards.services_by_category(services)
+    assert block.count('class="service-card"') == 3
+    # One heading per category, in catalog order
+    assert block.count("<h3") == 2 and block.index("Nails") < block.index("Hair")
+    assert "Cut &lt;b&gt;&amp; Style&lt;/b&gt;" in block and "<b>" not in block
+    assert "₹799.50" in block and "90 minutes" in block and "None" not in block
+
+    rows = [
+        (1, "Manicure", "2030-01-01", "10:00", "booked", "Riya"),
+        (2, "Pedicure", "2030-01-02", "11:00", "cancelled", None),
+    ]
+    block = cards.appointment_cards(repository.Appointment.from_rows(rows))
+    assert block.count('class="appointment-card"') == 2
+    assert "BOOKED" in block and "CANCELLED" in block
+    assert block.count("Stylist:") == 1
+
+    print("  ✅ Each section is a single element with escaped values")
+    return True
+
+def test_booking_api():
+    """Test the headless booking API end to end over keep-alive HTTP."""
+    print("🌐 Testing Booking API...")
+    import asyncio
+    from datetime import datetime
+    from database import init_db
+    from branches import Branch, BranchRouter
+    import api
+
+    async def exercise(router):
+        server = await api.start_server("127.0.0.1", 0, router)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+        async def request(method, path, payload=None, headers=""):
+            body = json.dumps(payload).encode() if payload is not None else b""
+            writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n{headers}\r\n".encode() + body)
+            head = (await reader.readuntil(b"\r\n\r\n")).decode()
+            length = int(head.lower().split("content-length:")[1].split("\r\n")[0])
+            return int(head.split(" ")[1]), json.loads(await reader.readexactly(length))
+
+        status, catalog = await request("GET", "/services")
+        assert status == 200 and any(s["name"] == "Manicure" for s in catalog["services"])
+        assert (await request("GET", "/availability?service=Nope"))[0] == 404
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        booking = {"phone": "9876543210", "name": "Ann", "service": "Manicure"}
+        key = "Idempotency-Key: link-1\r\n"
+        status, first = await request("POST", "/bookings", booking, key)
+        assert status == 201 and first["result"] == "booked", first
+        # The same key replays the first answer on the same connection
+        assert await request("POST", "/bookings", booking, key) == (201, first)
+        status, slots = await request("GET", f"/availability?service=Manicure&date={first['date']}")
+        assert status == 200 and isinstance(slots["slots"], list)
+        assert (await request("POST", "/bookings", {**booking, "date": today, "time": "09:10"}))[0] == 400
+
+        # With the clock at 15:00, this morning's opening slot has gone by
+        class Afternoon(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.now(tz).replace(hour=15, minute=0, second=0, microsecond=0)
+
+        api.datetime = Afternoon
+        try:
+            late = {"phone": "9876543211", "name": "Bob", "service": "Manicure", "date": today, "time": "09:00"}
+            status, answer = await request("POST", "/bookings", late)
+        finally:
+            api.datetime = datetime
+        assert status == 400 and answer["result"] == "past", (status, answer)
+
+        assert (await request("DELETE", "/bookings/1?phone=1111111111"))[0] == 404
+        assert await request("DELETE", "/bookings/1?phone=9876543210") == (200, {"cancelled": 1})
+        # The server closes the connection when asked to
+        assert (await request("DELETE", "/bookings/1?phone=9876543210", headers="Connection: close\r\n"))[0] == 409
+        assert await reader.read() == b""
+        writer.close()
+        server.close()
+        await server.wait_closed()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'api.db')
+        init_db(db_path)
+        router = BranchRouter([Branch('main', "Main Branch", db_path)])
+        asyncio.run(exercise(router))
+        router.writer().stop()
+
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT status FROM appointments").fetchall()
+        points = conn.execute("SELECT loyalty_points FROM users WHERE phone = '9876543210'").fetchone()[0]
+        late_points = conn.execute("SELECT loyalty_points FROM users WHERE phone = '9876543211'").fetchone()[0]
+        conn.close()
+        assert (rows, points, late_points) == ([("cancelled",)], 5, 0), (rows, points, late_points)
+
+    print("  ✅ Catalog, availability, idempotent booking and cancellation served over HTTP")
+    return True
+
 def show_config():
     """Display salon configuration."""
     print("🏢 Salon Configuration:")
@@ -99,6 +1031,66 @@ def main():
     test_database()
     print()
     
+    # Test connection pool
+    test_connection_pool()
+    print()
+    
+    # Test migrations and query plans
+    test_query_plans()
+    print()
+    test_service_id_backfill()
+    print()
+    test_duplicate_booking_cleanup()
+    print()
+    
+    # Test the background writer
+    test_write_queue()
+    print()
+    test_atomic_booking()
+    print()
+    
+    # Test multi-branch routing
+    test_branch_router()
+    print()
+    
+    # Test the admin reporting snapshot
+    test_snapshot()
+    print()
+    
+    # Test SQL instrumentation
+    test_query_stats()
+    print()
+    
+    # Test capacity-aware availability
+    test_availability()
+    print()
+    test_next_available_slot()
+    print()
+    test_occupancy()
+    print()
+    test_interval_index()
+    print()
+    test_series_booking()
+    print()
+    test_waitlist()
+    print()
+    test_stylist_assignment()
+    print()
+    test_idempotency_keys()
+    print()
+    test_appointment_filters()
+    print()
+    test_keyset_pagination()
+    print()
+    test_booking_api()
+    print()
+    test_data_version()
+    print()
+    test_query_cache()
+    print()
+    test_card_rendering()
+    print()
+    
     print("🏁 Test completed!")
     print("\n💡 To run the full application, execute:")
     print("   python run_app.py")
@@ -0,0 +1,107 @@
+"""
+Waitlist for full slots, backfilled automatically when bookings free up.
+
+Clients queue for a (date, time, service) that has no free chair. When a
+cancellation or a reschedule releases slots, promote_waiters runs as a
+release hook inside that same write transaction: it looks up the waiters
+whose service overlaps the freed slots through idx_waitlist_slot and books
+the earliest ones that now fit, so a freed chair never sits empty while
+someone is waiting for it.
+"""
+
+from datetime import date as date_type
+
+import availability
+import repository
+
+WAITING = 'waiting'
+PROMOTED = 'promoted'
+LEFT = 'left'
+
+class WaitlistEntry(repository.Record):
+    __slots__ = ('id', 'service', 'date', 'time', 'status')
+
+USER_WAITLIST_SQL = """
+    SELECT id, service, date, time, status
+    FROM waitlist
+    WHERE user_id = ? AND status = 'waiting' AND date >= ?
+    ORDER BY date, time
+"""
+
+WAITERS_IN_SPAN_SQL = """
+    SELECT id, user_id, service, time, slot
+    FROM waitlist
+    WHERE date = ? AND slot BETWEEN ? AND ? AND status = 'waiting'
+    ORDER BY id
+"""
+
+def get_user_waitlist(conn, user_id, today=None):
+    """The user's entries still waiting, from today on"""
+    today = today or date_type.today().strftime("%Y-%m-%d")
+    return WaitlistEntry.from_rows(conn.execute(USER_WAITLIST_SQL, (user_id, today)).fetchall())
+
+def join_waitlist(conn, rules, user_id, service, date, time, points=0):
+    """Write intent: queue for a full slot.
+
+    Returns availability.BOOKED if the slot turned out to have room (the
+    booking is made straight away), WAITING once queued,
+    availability.DUPLICATE if the client is already waiting for it, or
+    availability.PAST if the time has already gone by.
+    Raises ValueError for a time that is not a slot start within opening
+    hours, which could never be queued.
+    """
+    slot = rules.slot_index(time)
+    if slot is None or rules.slot_time(slot) != time:
+        raise ValueError(f"'{time}' is not a bookable start time")
+    result = availability.book_if_available(conn, rules, user_id, service, date, time, points)
+    if result != availability.FULL:
+        return result
+    cursor = conn.execute("""
+        INSERT OR IGNORE INTO waitlist (user_id, service, date, time, slot)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, service, date, time, slot))
+    return WAITING if cursor.rowcount else availability.DUPLICATE
+
+def leave_waitlist(conn, entry_id, user_id):
+    """Write intent: withdraw a waiting entry; False if it is no longer waiting"""
+    cursor = conn.execute(
+        "UPDATE waitlist SET status = 'left' WHERE id = ? AND user_id = ? AND status = 'waiting'",
+        (entry_id, user_id),
+    )
+    return cursor.rowcount == 1
+
+def promote_waiters(conn, rules, date, start, length, points=0):
+    """Release hook: book the earliest waiters whose service overlaps the freed slots and now fits.
+
+    A longer service can start before the freed slots and still need
+    them, so the lookup reaches back by the longest service in the catalog.
+    """
+    longest = rules.slots_for(conn.execute("SELECT MAX(duration) FROM services").fetchone()[0])
+    promoted = 0
+    for entry_id, user_id, service, time, slot in conn.execute(
+        WAITERS_IN_SPAN_SQL, (date, start - longest + 1, start + length - 1)
+    ).fetchall():
+        if slot + rules.slots_for(availability.service_duration(conn, service)) <= start:
+            continue
+        result = availability.book_if_available(conn, rules, user_id, service, date, time, points)
+        # Still full, or the waited-for time has gone by
+        if result not in (availability.BOOKED, availability.DUPLICATE):
+            continue
+        appointment_id = availability.booked_appointment_id(conn, user_id, service, date, time)
+        # A duplicate means the client already holds this booking; the wait is over either way
+        conn.execute(
+            "UPDATE waitlist SET status = 'promoted', appointment_id = ? WHERE id = ?",
+            (appointment_id, entry_id),
+        )
+        promoted += result == availability.BOOKED
+    return promoted
+
+def refresh_slots(conn, rules):
+    """Recompute waiting entries' slot numbers after the slot grid changes"""
+    rows = conn.execute("SELECT id, time FROM waitlist WHERE status = 'waiting'").fetchall()
+    conn.executemany(
+        "UPDATE waitlist SET slot = ? WHERE id = ?",
+        [(rules.slot_index(time), entry_id) for entry_id, time in rows],
+    )
+
+availability.RELEASE_HOOKS.append(promote_waiters)
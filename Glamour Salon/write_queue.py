@@ -0,0 +1,119 @@
+"""
+Single-writer queue for salon writes.
+
+Every write intent is a function taking a connection as its first
+argument. One background thread owns the only write connection, drains
+whatever intents are waiting, runs each in its own SAVEPOINT inside one
+BEGIN IMMEDIATE transaction and commits the batch once. Callers get a
+Future back, so concurrent sessions never fight over the write lock.
+"""
+
+import threading
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+from database import DB_PATH, PerDatabase, open_connection
+
+class WriteQueue:
+    def __init__(self, db_path=DB_PATH, max_batch=64):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._queue = Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.intents = 0
+
+    def submit(self, intent, *args, **kwargs):
+        """Queue intent(conn, *args, **kwargs) and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((intent, args, kwargs, future))
+        return future
+
+    def run(self, intent, *args, timeout=30, **kwargs):
+        """Submit an intent and wait for its result"""
+        return self.submit(intent, *args, **kwargs).result(timeout=timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run_forever, name=f"salon-writer:{self.db_path}", daemon=True
+                )
+                self._thread.start()
+
+    def _next_batch(self):
+        """Block for one intent, then take whatever else is already waiting"""
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run_forever(self):
+        conn = open_connection(self.db_path)
+        # Transactions are managed explicitly below
+        conn.isolation_level = None
+        while True:
+            batch = self._next_batch()
+            if any(item is None for item in batch):
+                batch = [item for item in batch if item is not None]
+                self._apply(conn, batch)
+                conn.close()
+                return
+            self._apply(conn, batch)
+
+    def _apply(self, conn, batch):
+        if not batch:
+            return
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for intent, args, kwargs, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_intent")
+                try:
+                    result = intent(conn, *args, **kwargs)
+                    conn.execute("RELEASE write_intent")
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    # Undo just this intent; the rest of the batch still commits
+                    conn.execute("ROLLBACK TO write_intent")
+                    conn.execute("RELEASE write_intent")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for intent, args, kwargs, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.intents += len(outcomes)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stop(self):
+        """Flush pending intents and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+_queues = PerDatabase(WriteQueue)
+
+def get_write_queue(db_path=DB_PATH):
+    """Return the process-wide writer for a database file"""
+    return _queues.get(db_path)